@@ -0,0 +1,103 @@
+''' Storage saved by note compression against its CPU cost
+
+Creates one patient's notes, with texts drawn like benchmarks.generate_dataset
+draws them, through NoteDAOPickle with each compression setting, and reports
+the size of the notes file, the bytes held in memory per note and the time
+taken to create the notes, load them back and retrieve their texts.
+Run from the repository root:
+	python -m benchmarks.compression_benchmark --notes 100000 --threshold 256
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.generate_dataset import note_text
+from benchmarks.memory_benchmark import traced
+from clinic.compression import TextCompressor
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+
+PHN = 9790012000
+# (name, codec, level), without a codec the texts are kept as they are
+SETTINGS = (
+	('none', None, None),
+	('zlib 1', 'zlib', 1),
+	('zlib 6', 'zlib', 6),
+	('zlib 9', 'zlib', 9),
+	('lzma 0', 'lzma', 0),
+	('lzma 6', 'lzma', 6),
+)
+
+
+def seconds(function, *arguments):
+	''' seconds taken by one call, and its result '''
+	start = time.perf_counter()
+	result = function(*arguments)
+	return time.perf_counter() - start, result
+
+
+def create(dao, texts):
+	''' create every note, the file is written once afterwards '''
+	for text in texts:
+		dao.create_note(text)
+
+
+def retrieve(dao, codes):
+	''' look every code up and read its text '''
+	for code in codes:
+		dao.search_note(code).text
+
+
+def measure(data_directory, compressor, texts, codes):
+	''' file bytes, bytes per note, compressed notes and seconds per note of each operation '''
+	new_dao = lambda: NoteDAOPickle(PHN, data_directory=data_directory, compressor=compressor)
+	dao = new_dao()
+	results = {'create': seconds(create, dao, texts)[0] / len(texts)}
+	dao.autosave_note_to_file()
+	results['file'] = os.path.getsize(dao.notes_file_path)
+	results['compressed'] = sum(isinstance(note.stored_text, bytes) for note in dao.notes[PHN].values()) / len(texts)
+
+	results['load'], dao = seconds(new_dao)
+	results['load'] /= len(texts)
+	# measured empty, so only the notes and their texts are counted
+	dao.notes = {}
+	results['bytes'] = traced(dao.load_data)[0] / len(texts)
+	results['retrieve'] = seconds(retrieve, dao, codes)[0] / len(codes)
+	return results
+
+
+def run(count, operations, threshold, seed):
+	''' print every setting side by side '''
+	rng = random.Random(seed)
+	texts = [note_text(rng) for i in range(count)]
+	codes = rng.sample(range(1, count + 1), min(operations, count))
+	results = {}
+	for name, codec, level in SETTINGS:
+		compressor = None if codec is None else TextCompressor(codec, level=level, threshold=threshold)
+		with tempfile.TemporaryDirectory() as data_directory:
+			results[name] = measure(data_directory, compressor, texts, codes)
+
+	print(f"notes: {count}, average text: {sum(len(text.encode()) for text in texts) / count:.0f} bytes, threshold: {threshold} bytes")
+	print(f"{'':12}" + "".join(f"{name:>10}" for name, codec, level in SETTINGS))
+	rows = (
+		('file MB', lambda result: f"{result['file'] / 1e6:10.2f}"),
+		('saved', lambda result: f"{1 - result['file'] / results['none']['file']:10.1%}"),
+		('compressed', lambda result: f"{result['compressed']:10.1%}"),
+		('bytes/note', lambda result: f"{result['bytes']:10.0f}"),
+		('create us', lambda result: f"{result['create'] * 1e6:10.2f}"),
+		('load us', lambda result: f"{result['load'] * 1e6:10.2f}"),
+		('retrieve us', lambda result: f"{result['retrieve'] * 1e6:10.2f}"),
+	)
+	for label, cell in rows:
+		print(f"{label:12}" + "".join(cell(results[name]) for name, codec, level in SETTINGS))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--notes', type=int, default=20000)
+	parser.add_argument('--operations', type=int, default=10000, help="notes retrieved")
+	parser.add_argument('--threshold', type=int, default=256, help="bytes below which texts stay uncompressed")
+	parser.add_argument('--seed', type=int, default=265)
+	options = parser.parse_args()
+	run(options.notes, options.operations, options.threshold, options.seed)
@@ -0,0 +1,250 @@
+''' Synthetic clinic dataset generator writing the storage files directly
+
+Builds patients with realistic names, birth dates, phones, emails and
+addresses, and notes whose count, length and timestamps vary like a real
+clinic's, then writes them in the on-disk format of a backend without going
+through the DAOs. The same seed always gives the same dataset, whatever the
+number of worker processes. Run from the repository root:
+	python -m benchmarks.generate_dataset --patients 1000000 --notes-mean 20 --output /tmp/clinic-data
+and open it with Controller(autosave=True, data_directory='/tmp/clinic-data').
+'''
+import argparse
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import random
+import sqlite3
+import time
+
+from clinic.dao.note_segment_store import NoteSegmentStore
+from clinic.dao.patient_dao_sqlite import PatientDAOSQLite
+
+FIRST_PHN = 9000000000
+# patients generated by one task; fixed so the output does not depend on the worker count
+CHUNK_SIZE = 2000
+# the notes are dated up to this day, so a seed always gives the same timestamps
+REFERENCE_DATE = datetime.datetime(2024, 1, 1)
+
+FIRST_NAMES = (
+	"Olivia", "Liam", "Emma", "Noah", "Charlotte", "Oliver", "Amelia", "Lucas", "Ava", "Benjamin",
+	"Sophia", "William", "Mia", "Jack", "Chloe", "Ethan", "Isla", "Leo", "Emily", "James",
+	"Harper", "Logan", "Ella", "Jacob", "Aria", "Daniel", "Hannah", "Henry", "Zoe", "Samuel",
+	"Wei", "Priya", "Jin", "Arjun", "Mei", "Ali", "Fatima", "Hiroshi", "Sofia", "Mateo",
+	"Grace", "Owen", "Lily", "Ryan", "Nora", "Mohammed", "Sarah", "David", "Maya", "Thomas",
+)
+LAST_NAMES = (
+	"Smith", "Brown", "Tremblay", "Martin", "Roy", "Wilson", "MacDonald", "Gagnon", "Johnson", "Taylor",
+	"Campbell", "Anderson", "Lee", "Wong", "Singh", "Chen", "Li", "Thompson", "White", "Leblanc",
+	"Patel", "Nguyen", "Kim", "Young", "Clark", "Scott", "Stewart", "Walker", "Hu", "Mesbah",
+	"Moore", "Miller", "Davis", "Robinson", "Gill", "Ross", "Morrison", "Fraser", "Reid", "King",
+)
+# Zipf-like popularity: the first names of each list are much more common
+FIRST_NAME_WEIGHTS = [1 / rank for rank in range(1, len(FIRST_NAMES) + 1)]
+LAST_NAME_WEIGHTS = [1 / rank for rank in range(1, len(LAST_NAMES) + 1)]
+
+# (youngest, oldest, share of patients), roughly the age pyramid of a family practice
+AGE_GROUPS = ((0, 17, 0.19), (18, 39, 0.28), (40, 64, 0.33), (65, 84, 0.17), (85, 100, 0.03))
+AREA_CODES = (("250", 0.45), ("778", 0.3), ("604", 0.2), ("236", 0.05))
+EMAIL_DOMAINS = (("gmail.com", 0.45), ("outlook.com", 0.15), ("hotmail.com", 0.12), ("yahoo.ca", 0.1),
+	("shaw.ca", 0.08), ("telus.net", 0.06), ("uvic.ca", 0.04))
+STREETS = ("Fairfield", "Admirals", "Moss", "Douglas", "Fort", "Cook", "Oak Bay", "Shelbourne", "Quadra", "Cedar Hill",
+	"Richmond", "Yates", "Johnson", "Pandora", "Bay", "Hillside", "Gorge", "Tillicum", "Burnside", "McKenzie")
+STREET_TYPES = ("Rd", "St", "Ave", "Dr", "Cres", "Pl")
+CITIES = (("Victoria", 0.4), ("Saanich", 0.2), ("Esquimalt", 0.08), ("Oak Bay", 0.07), ("Langford", 0.1),
+	("Colwood", 0.05), ("Sidney", 0.04), ("Sooke", 0.03), ("View Royal", 0.03))
+
+NOTE_SENTENCES = (
+	"Patient comes with headache and high blood pressure.",
+	"Patient complains of a persistent dry cough for {days} days.",
+	"Blood pressure {systolic}x{diastolic}, heart rate {pulse} bpm.",
+	"Temperature {temperature} C, no fever reported.",
+	"Prescribed {medication} {dose} mg twice daily for {days} days.",
+	"Follow up in {weeks} weeks to review the test results.",
+	"Referred to a specialist for further assessment.",
+	"Lab work ordered: complete blood count and lipid panel.",
+	"Patient reports improved sleep and lower stress levels.",
+	"Mild swelling of the left ankle after a fall, x-ray requested.",
+	"No known allergies, vaccinations are up to date.",
+	"Discussed diet and exercise, target weight loss of {kilograms} kg.",
+	"Patient is a non-smoker and drinks alcohol occasionally.",
+	"Reports lower back pain when lifting, physiotherapy recommended.",
+	"Skin rash on both forearms, prescribed a topical cream.",
+	"Blood glucose {glucose} mmol/L, continue monitoring at home.",
+	"Patient feels dizzy when standing up quickly.",
+	"Renewed the prescription for {medication}.",
+	"Seasonal allergies are worse this spring, antihistamine advised.",
+	"Anxiety symptoms discussed, counselling options provided.",
+)
+MEDICATIONS = ("amoxicillin", "ibuprofen", "metformin", "lisinopril", "atorvastatin", "salbutamol", "sertraline", "omeprazole")
+
+
+def age_range(rng):
+	''' the youngest and oldest age of a randomly picked age group '''
+	youngest, oldest, _ = rng.choices(AGE_GROUPS, weights=[group[2] for group in AGE_GROUPS])[0]
+	return youngest, oldest
+
+
+def weighted(rng, options):
+	''' pick one value of a (value, weight) table '''
+	return rng.choices(options, weights=[option[1] for option in options])[0][0]
+
+
+def make_patient(rng, phn):
+	''' the fields of one patient, as patients.json stores them '''
+	first_name = rng.choices(FIRST_NAMES, weights=FIRST_NAME_WEIGHTS)[0]
+	last_name = rng.choices(LAST_NAMES, weights=LAST_NAME_WEIGHTS)[0]
+	youngest, oldest = age_range(rng)
+	birth_date = REFERENCE_DATE.date() - datetime.timedelta(days=rng.randint(youngest * 365, oldest * 365 + 364))
+	return {
+		'phn': phn,
+		'name': f"{first_name} {last_name}",
+		'birth_date': birth_date.isoformat(),
+		'phone': f"{weighted(rng, AREA_CODES)} {rng.randint(200, 999)} {rng.randint(0, 9999):04d}",
+		'email': f"{first_name.lower()}.{last_name.lower()}{rng.randint(1, 999)}@{weighted(rng, EMAIL_DOMAINS)}",
+		'address': f"{rng.randint(1, 4999)} {rng.choice(STREETS)} {rng.choice(STREET_TYPES)}, {weighted(rng, CITIES)}",
+		'record': {'phn': phn},
+	}
+
+
+def note_count(rng, mean, maximum):
+	''' how many notes a patient has: most have a few, some have very many '''
+	# log-normal with sigma 1, so the median is about 60% of the mean
+	return min(maximum, int(rng.lognormvariate(math.log(mean) - 0.5, 1.0)))
+
+
+def note_text(rng):
+	''' the text of one note, mostly short with a long tail '''
+	sentences = rng.choices(NOTE_SENTENCES, k=max(1, int(rng.lognormvariate(1.0, 0.6))))
+	return " ".join(sentence.format(
+		days=rng.randint(2, 21), weeks=rng.randint(1, 8), systolic=rng.randint(100, 170), diastolic=rng.randint(60, 105),
+		pulse=rng.randint(50, 110), temperature=round(rng.gauss(36.9, 0.5), 1), medication=rng.choice(MEDICATIONS),
+		dose=rng.choice((5, 10, 20, 50, 100, 250, 500)), kilograms=rng.randint(2, 15), glucose=round(rng.gauss(6.0, 1.5), 1))
+		for sentence in sentences)
+
+
+def make_notes(rng, patient, mean, maximum):
+	''' the notes of one patient, as the note DAOs store them, oldest first '''
+	count = note_count(rng, mean, maximum)
+	if not count:
+		return []
+	# the notes fall between the patient's birth, or the clinic opening, and the reference date
+	first_day = max(datetime.datetime.fromisoformat(patient['birth_date']), datetime.datetime(2005, 1, 1))
+	# at least a second, for patients born on the reference date
+	span = max(1, int((REFERENCE_DATE - first_day).total_seconds()))
+	seconds = sorted(rng.randrange(span) for i in range(count))
+	return [
+		{'code': code, 'text': note_text(rng), 'timestamp': first_day + datetime.timedelta(seconds=offset)}
+		for code, offset in enumerate(seconds, start=1)
+	]
+
+
+def generate_chunk(task):
+	''' generate one chunk of patients and their notes, writing the note files itself.
+		returns the chunk's patients as a patients.json fragment, the rows of the
+		sqlite backend, and the number of notes '''
+	seed, chunk_number, first, count, options = task
+	rng = random.Random(f"{seed}:{chunk_number}")
+	records_directory = os.path.join(options['output'], 'records')
+	backend = options['backend']
+	patients = []
+	rows = []
+	frames = []
+	notes_written = 0
+	for phn in range(first, first + count):
+		patient = make_patient(rng, phn)
+		notes = make_notes(rng, patient, options['notes_mean'], options['notes_max'])
+		patients.append(patient)
+		notes_written += len(notes)
+		if backend == 'json':
+			# the same pickled list of note attributes NoteDAOPickle writes
+			if notes:
+				with open(os.path.join(records_directory, f"{phn}.dat"), 'wb') as file:
+					pickle.dump(notes, file)
+		elif backend == 'segments':
+			if notes:
+				# one checkpoint record holds all of the patient's notes
+				key = NoteSegmentStore.key(phn)
+				payload = pickle.dumps(('checkpoint', notes))
+				frames.append(NoteSegmentStore.HEADER.pack(len(key), len(payload)) + key + payload)
+		else:
+			rows.extend((phn, note['code'], note['text'], note['timestamp'].strftime('%Y-%m-%d %H:%M:%S')) for note in notes)
+
+	if frames:
+		# every chunk has a segment of its own, numbered in chunk order
+		with open(os.path.join(records_directory, f"notes-{chunk_number + 1:06d}.seg"), 'wb') as file:
+			file.write(b''.join(frames))
+	if backend == 'sqlite':
+		patient_rows = [tuple(patient[field] for field in ('phn', 'name', 'birth_date', 'phone', 'email', 'address')) for patient in patients]
+		return None, (patient_rows, rows), notes_written
+	return json.dumps(patients)[1:-1], None, notes_written
+
+
+def write_patients_file(output, chunks):
+	''' write patients.json from the chunks' fragments, as PatientDAOJSON saves it '''
+	patients_file_path = os.path.join(output, 'patients.json')
+	temporary_file_path = patients_file_path + '.tmp'
+	notes_written = 0
+	with open(temporary_file_path, 'w') as file:
+		file.write('[')
+		for position, (fragment, rows, chunk_notes) in enumerate(chunks):
+			if position and fragment:
+				file.write(', ')
+			file.write(fragment)
+			notes_written += chunk_notes
+		file.write(']')
+	os.replace(temporary_file_path, patients_file_path)
+	return notes_written
+
+
+def write_database(output, chunks):
+	''' insert the chunks' rows into clinic.db, in one transaction '''
+	connection = sqlite3.connect(os.path.join(output, 'clinic.db'), isolation_level=None)
+	connection.execute('PRAGMA journal_mode=WAL')
+	for statement in PatientDAOSQLite.SCHEMA:
+		connection.execute(statement)
+	notes_written = 0
+	connection.execute('BEGIN')
+	for fragment, (patient_rows, note_rows), chunk_notes in chunks:
+		connection.executemany(f'INSERT INTO patients ({PatientDAOSQLite.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)', patient_rows)
+		connection.executemany('INSERT INTO notes (phn, code, text, timestamp) VALUES (?, ?, ?, ?)', note_rows)
+		notes_written += chunk_notes
+	connection.execute('COMMIT')
+	connection.close()
+	return notes_written
+
+
+def generate(output, patients, notes_mean = 10, notes_max = 10000, backend = 'json', seed = 265, workers = None):
+	''' write a dataset of patients and their notes into output in the backend's format,
+		using workers processes (all cores by default); returns the number of notes '''
+	if backend not in ('json', 'segments', 'sqlite'):
+		raise ValueError(f"Unknown storage backend '{backend}'.")
+	options = {'output': output, 'notes_mean': notes_mean, 'notes_max': notes_max, 'backend': backend}
+	os.makedirs(os.path.join(output, 'records'), exist_ok=True)
+	tasks = [(seed, chunk_number, FIRST_PHN + first, min(CHUNK_SIZE, patients - first), options)
+		for chunk_number, first in enumerate(range(0, patients, CHUNK_SIZE))]
+
+	# the chunks come back in order, so the parent writes the patients in PHN order
+	with multiprocessing.Pool(workers) as pool:
+		chunks = pool.imap(generate_chunk, tasks)
+		if backend == 'sqlite':
+			return write_database(output, chunks)
+		return write_patients_file(output, chunks)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--patients', type=int, default=10000)
+	parser.add_argument('--notes-mean', type=float, default=10, help="average notes per patient")
+	parser.add_argument('--notes-max', type=int, default=10000, help="most notes a patient can have")
+	parser.add_argument('--backend', choices=['json', 'segments', 'sqlite'], default='json')
+	parser.add_argument('--seed', type=int, default=265)
+	parser.add_argument('--workers', type=int, default=None, help="worker processes, all cores by default")
+	parser.add_argument('--output', required=True, help="data directory to write, as Controller's data_directory")
+	options = parser.parse_args()
+
+	start = time.perf_counter()
+	notes = generate(options.output, options.patients, options.notes_mean, options.notes_max, options.backend, options.seed, options.workers)
+	print(f"{options.patients} patients and {notes} notes written to {options.output} in {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,90 @@
+''' Memory benchmark: bytes per patient and per note held in memory once loaded
+
+Generates a dataset with benchmarks.generate_dataset, loads it with the JSON
+and pickle DAOs and reports the memory traced per patient (Patient,
+PatientRecord and their strings) and per note, with and without interning.
+Run from the repository root:
+	python -m benchmarks.memory_benchmark --patients 100000
+'''
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.generate_dataset import generate
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.dao.patient_dao_json import PatientDAOJSON
+
+
+def traced(function):
+	''' bytes still allocated by function once it returned, and its result '''
+	gc.collect()
+	tracemalloc.start()
+	result = function()
+	gc.collect()
+	allocated = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return allocated, result
+
+
+def measure_patients(data_directory, count, intern_strings):
+	''' bytes per loaded patient '''
+	options = {'intern_strings': True} if intern_strings else {}
+	records_directory = os.path.join(data_directory, 'records')
+	notes_dao_factory = lambda phn: NoteDAOPickle(phn, autosave=True, data_directory=records_directory)
+	allocated, patients_dao = traced(lambda: PatientDAOJSON(autosave=True, data_directory=data_directory,
+		notes_dao_factory=notes_dao_factory, **options))
+	assert len(patients_dao.patients) == count
+	return allocated / count, patients_dao
+
+
+def load_notes(daos):
+	''' load the notes of every DAO again, returning how many there are '''
+	for dao in daos:
+		dao.load_data()
+	return sum(len(dao.notes.get(dao.phn, {})) for dao in daos)
+
+
+def measure_notes(patients_dao, patients):
+	''' bytes per loaded note, over the notes of the first patients '''
+	daos = [patient.record.notes_dao for patient in list(patients_dao.patients.values())[:patients]]
+	# the DAOs are measured empty, so only the notes and their strings are counted
+	for dao in daos:
+		dao.notes = {}
+	allocated, count = traced(lambda: load_notes(daos))
+	note = next(note for dao in daos for note in dao.notes.get(dao.phn, {}).values())
+	return allocated / count, count, note
+
+
+def run(count, notes_mean, note_patients):
+	''' print the bytes per patient and per note, with and without interning '''
+	with tempfile.TemporaryDirectory() as data_directory:
+		generate(data_directory, count, notes_mean=notes_mean)
+		print(f"patients: {count}, notes per patient: {notes_mean} on average")
+		for intern_strings in (False, True):
+			try:
+				per_patient, patients_dao = measure_patients(data_directory, count, intern_strings)
+			except TypeError:
+				print("interned: not supported by this version")
+				continue
+			print(f"{'interned' if intern_strings else 'plain'}:")
+			print(f"  bytes per patient:    {per_patient:8.0f}")
+			if not intern_strings:
+				per_note, notes, note = measure_notes(patients_dao, note_patients)
+				print(f"  bytes per note:       {per_note:8.0f}   ({notes} notes)")
+				print(f"  Note object:          {sys.getsizeof(note):8d}" + (f" + __dict__ {sys.getsizeof(note.__dict__)}" if hasattr(note, '__dict__') else ""))
+			patient = next(iter(patients_dao.patients.values()))
+			print(f"  Patient object:       {sys.getsizeof(patient):8d}" + (f" + __dict__ {sys.getsizeof(patient.__dict__)}" if hasattr(patient, '__dict__') else ""))
+			print(f"  PatientRecord object: {sys.getsizeof(patient.record):8d}" + (f" + __dict__ {sys.getsizeof(patient.record.__dict__)}" if hasattr(patient.record, '__dict__') else ""))
+			del patients_dao, patient
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--patients', type=int, default=100000)
+	parser.add_argument('--notes-mean', type=float, default=10, help="average notes per patient")
+	parser.add_argument('--note-patients', type=int, default=1000, help="patients whose notes are measured")
+	options = parser.parse_args()
+	run(options.patients, options.notes_mean, options.note_patients)
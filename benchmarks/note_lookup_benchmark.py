@@ -0,0 +1,79 @@
+''' Micro-benchmark of code based note operations at 10k notes per patient
+
+Compares NoteDAOPickle against the linear list scan it used before notes
+were keyed by code. Run from the repository root:
+	python -m benchmarks.note_lookup_benchmark --notes 10000
+'''
+import argparse
+import random
+import tempfile
+import time
+
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.note import Note
+
+
+class LinearNotes():
+	''' the previous list based note storage, kept as the baseline '''
+
+	def __init__(self, count):
+		self.notes = [Note(code, f"note {code}", "2024-01-01 10:00:00") for code in range(1, count + 1)]
+
+	def search_note(self, code):
+		for note in self.notes:
+			if note.code == code:
+				return note
+		return None
+
+	def update_note(self, code, new_text):
+		for note in self.notes:
+			if note.code == code:
+				note.text = new_text
+				return True
+		return False
+
+	def delete_note(self, code):
+		for note in self.notes:
+			if note.code == code:
+				self.notes.remove(note)
+				return True
+		return False
+
+
+def time_operations(notes, codes):
+	''' seconds per call of search_note, update_note and delete_note over the given codes '''
+	timings = {}
+	for operation in ('search_note', 'update_note', 'delete_note'):
+		method = getattr(notes, operation)
+		start = time.perf_counter()
+		for code in codes:
+			if operation == 'update_note':
+				method(code, "updated note")
+			else:
+				method(code)
+		timings[operation] = (time.perf_counter() - start) / len(codes)
+	return timings
+
+
+def run(count, operations):
+	''' print the per call latency of both implementations '''
+	codes = random.Random(265).sample(range(1, count + 1), operations)
+	with tempfile.TemporaryDirectory() as data_directory:
+		dao = NoteDAOPickle(9790012000, data_directory=data_directory)
+		for code in range(1, count + 1):
+			dao.create_note(f"note {code}")
+		keyed = time_operations(dao, codes)
+	linear = time_operations(LinearNotes(count), codes)
+
+	print(f"notes per patient: {count}, operations: {operations}")
+	for operation in keyed:
+		print(f"{operation:12} linear {linear[operation] * 1e6:10.2f} us   keyed {keyed[operation] * 1e6:8.2f} us   "
+			f"speedup {linear[operation] / keyed[operation]:8.1f}x")
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--notes', type=int, default=10000)
+	parser.add_argument('--operations', type=int, default=1000)
+	arguments = parser.parse_args()
+	run(arguments.notes, arguments.operations)
@@ -0,0 +1,95 @@
+''' Memory and throughput of columnar notes against a dictionary of Note objects
+
+Builds one patient's notes as NoteDAOPickle loads them, once into the usual
+code -> Note dictionary and once into ColumnarNotes, and reports the bytes
+held per note and the time taken to load, search, update and list them.
+Run from the repository root:
+	python -m benchmarks.note_store_benchmark --notes 1000000
+'''
+import argparse
+import datetime
+import pickle
+import random
+import time
+
+from benchmarks.generate_dataset import note_text
+from benchmarks.memory_benchmark import traced
+from clinic.dao.columnar_notes import ColumnarNotes
+from clinic.note import Note
+
+
+def note_data(count, seed):
+	''' the notes of one patient as the .dat files hold them, oldest first '''
+	rng = random.Random(seed)
+	first_day = datetime.datetime(2005, 1, 1)
+	return [
+		{'code': code, 'text': note_text(rng), 'timestamp': first_day + datetime.timedelta(seconds=code * 3600 + rng.randrange(3600))}
+		for code in range(1, count + 1)
+	]
+
+
+def load(new_notes, data):
+	''' build the notes from a pickled .dat file, as load_patient_notes does '''
+	return new_notes(Note(note['code'], note['text'], note['timestamp']) for note in pickle.loads(data))
+
+
+def search(notes, codes):
+	''' look every code up '''
+	for code in codes:
+		notes.get(code)
+
+
+def update(notes, codes):
+	''' change the text of every code, as update_note does '''
+	for code in codes:
+		note = notes[code]
+		note.text = note.text + " Follow up in a week."
+		notes[code] = note
+
+
+def list_notes(notes):
+	''' every note, newest first '''
+	return list(reversed(notes.values()))
+
+
+def seconds(function, *arguments):
+	''' seconds taken by one call '''
+	start = time.perf_counter()
+	function(*arguments)
+	return time.perf_counter() - start
+
+
+def measure(new_notes, data, codes):
+	''' bytes per note and seconds per note of each operation '''
+	allocated, notes = traced(lambda: load(new_notes, data))
+	results = {'bytes': allocated / len(notes), 'load': seconds(load, new_notes, data) / len(notes)}
+	results['search'] = seconds(search, notes, codes) / len(codes)
+	results['update'] = seconds(update, notes, codes) / len(codes)
+	results['list'] = seconds(list_notes, notes) / len(notes)
+	return results
+
+
+def run(count, operations, seed):
+	''' print both representations side by side '''
+	data = pickle.dumps(note_data(count, seed))
+	codes = random.Random(seed).sample(range(1, count + 1), min(operations, count))
+	stores = {
+		'dictionary': lambda notes: {note.code: note for note in notes},
+		'columnar': ColumnarNotes,
+	}
+	results = {name: measure(new_notes, data, codes) for name, new_notes in stores.items()}
+
+	print(f"notes: {count}, average text: {sum(len(note['text']) for note in pickle.loads(data)) / count:.0f} characters")
+	print(f"{'':12} {'dictionary':>12} {'columnar':>12}")
+	print(f"{'bytes/note':12} {results['dictionary']['bytes']:12.0f} {results['columnar']['bytes']:12.0f}")
+	for operation in ('load', 'search', 'update', 'list'):
+		print(f"{operation + ' us':12} {results['dictionary'][operation] * 1e6:12.2f} {results['columnar'][operation] * 1e6:12.2f}")
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--notes', type=int, default=100000)
+	parser.add_argument('--operations', type=int, default=10000, help="codes searched and updated")
+	parser.add_argument('--seed', type=int, default=265)
+	options = parser.parse_args()
+	run(options.notes, options.operations, options.seed)
@@ -0,0 +1,91 @@
+''' Cold start benchmark: loading patients.json with and without opening every patient's notes
+
+A fraction of the patients get a records/<phn>.dat with a few notes, so the
+eager pass reads notes files as well as probing for the missing ones.
+Run from the repository root:
+	python -m benchmarks.startup_benchmark --patients 100000 --with-notes 0.6
+'''
+import argparse
+import datetime
+import json
+import os
+import pickle
+import random
+import tempfile
+import time
+
+from benchmarks.generate_dataset import note_text
+
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.dao.patient_dao_json import PatientDAOJSON
+
+
+def write_patients_file(data_directory, count):
+	''' write a patients.json snapshot with the given number of patients '''
+	patients = []
+	for i in range(count):
+		phn = 9700000000 + i
+		patients.append({
+			'phn': phn,
+			'name': f"Patient {i}",
+			'birth_date': "1980-03-03",
+			'phone': "250 301 6060",
+			'email': f"patient{i}@gmail.com",
+			'address': "500 Fairfield Rd, Victoria",
+			'record': {'phn': phn},
+		})
+	with open(os.path.join(data_directory, 'patients.json'), 'w') as file:
+		json.dump(patients, file)
+
+
+def write_notes_files(records_directory, count, fraction, notes_per_patient, seed = 265):
+	''' write a <phn>.dat of notes_per_patient notes for the given fraction of the patients '''
+	os.makedirs(records_directory, exist_ok=True)
+	rng = random.Random(seed)
+	first_day = datetime.datetime(2005, 1, 1)
+	written = 0
+	for i in range(count):
+		if rng.random() >= fraction:
+			continue
+		notes = [
+			{'code': code, 'text': note_text(rng), 'timestamp': first_day + datetime.timedelta(days=code * 30)}
+			for code in range(1, notes_per_patient + 1)
+		]
+		with open(os.path.join(records_directory, f"{9700000000 + i}.dat"), 'wb') as file:
+			pickle.dump(notes, file)
+		written += 1
+	return written
+
+
+def run(count, fraction, notes_per_patient):
+	''' time a lazy cold start, then the cost the eager notes loading used to add on top '''
+	with tempfile.TemporaryDirectory() as data_directory:
+		write_patients_file(data_directory, count)
+		records_directory = os.path.join(data_directory, 'records')
+		notes_files = write_notes_files(records_directory, count, fraction, notes_per_patient)
+
+		start = time.perf_counter()
+		patients_dao = PatientDAOJSON(autosave=True, data_directory=data_directory,
+			notes_dao_factory=lambda phn: NoteDAOPickle(phn, autosave=True, data_directory=records_directory))
+		lazy_seconds = time.perf_counter() - start
+
+		# touching every record builds its notes DAO, which probes the records
+		# directory and opens <phn>.dat, as every startup used to do
+		start = time.perf_counter()
+		for patient in patients_dao.patients.values():
+			patient.record.notes_dao
+		eager_seconds = time.perf_counter() - start
+
+	print(f"patients:                  {count}, {notes_files} with {notes_per_patient} notes each")
+	print(f"lazy cold start:           {lazy_seconds:.3f} s")
+	print(f"eager notes loading adds:  {eager_seconds:.3f} s")
+	print(f"eager cold start (before): {lazy_seconds + eager_seconds:.3f} s")
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--patients', type=int, default=100000)
+	parser.add_argument('--with-notes', type=float, default=0.6, help="fraction of the patients with a notes file")
+	parser.add_argument('--notes', type=int, default=5, help="notes in each notes file")
+	options = parser.parse_args()
+	run(options.patients, options.with_notes, options.notes)
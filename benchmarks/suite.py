@@ -0,0 +1,251 @@
+''' Benchmark suite for the Controller and DAO hot paths at growing data sizes
+
+Times create, search, retrieve, update, delete, list, page and cold start load of
+patients, and of one patient's notes, through the Controller and directly on
+its DAOs, with autosave off and on. The results are written as JSON so runs
+can be compared between releases. Run from the repository root, e.g. the
+full matrix:
+	python -m benchmarks.suite --patients 1000 100000 1000000 --notes 10 1000 10000 --output results.json
+and against an earlier run:
+	python -m benchmarks.suite --baseline results.json
+'''
+import argparse
+import datetime
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+from clinic.controller import Controller
+from clinic.patient import Patient
+
+FIRST_PHN = 9000000000
+PHN = 9790012000  # the patient whose notes are benchmarked
+PAGE_SIZE = 50  # rows shown by one page of the UI
+
+
+def patient_fields(phn):
+	''' the fields of a synthetic patient '''
+	return (phn, f"Patient {phn}", "1980-03-03", "250 301 6060", f"patient{phn}@gmail.com", "500 Fairfield Rd, Victoria")
+
+
+def note_text(code):
+	''' the text of a synthetic note, findable by its visit number '''
+	return f"Visit {code}: patient reports a mild headache, blood pressure 120x80."
+
+
+def summarize(samples):
+	''' latency statistics of one operation, in seconds '''
+	samples = sorted(samples)
+	return {
+		'samples': len(samples),
+		'mean_s': sum(samples) / len(samples),
+		'p50_s': samples[len(samples) // 2],
+		'p95_s': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+		'max_s': samples[-1],
+	}
+
+
+def timed(function, calls):
+	''' seconds taken by each call of function with the given argument tuples '''
+	samples = []
+	for arguments in calls:
+		start = time.perf_counter()
+		function(*arguments)
+		samples.append(time.perf_counter() - start)
+	return samples
+
+
+class Run():
+	''' one benchmarked store: a backend, autosave setting and data size '''
+
+	def __init__(self, options, autosave, data_directory):
+		self.options = options
+		self.autosave = autosave
+		self.data_directory = data_directory
+		self.random = random.Random(options.seed)
+
+	def open_controller(self):
+		''' a logged in controller over the run's data directory '''
+		controller = Controller(autosave=self.autosave, journal=self.options.journal, backend=self.options.backend,
+			write_behind=self.options.write_behind, data_directory=self.data_directory)
+		controller.login("user", "123456")
+		return controller
+
+	def close(self, controller):
+		''' write what write-behind still holds and stop its thread '''
+		if controller.flusher is not None:
+			controller.flusher.close()
+
+	def patient_operations(self, controller, count, layer):
+		''' the calls timed for each patient operation, in the order they run '''
+		samples = self.options.samples
+		existing = [FIRST_PHN + self.random.randrange(count) for i in range(samples)]
+		new = [FIRST_PHN + count + i for i in range(samples)]
+		list_calls = [()] * max(1, samples // 10)
+		if layer == 'controller':
+			return [
+				('create', controller.create_patient, [patient_fields(phn) for phn in new]),
+				('search', controller.search_patient, [(phn,) for phn in existing]),
+				('retrieve', controller.retrieve_patients, [(f"Patient {phn}",) for phn in existing]),
+				('update', controller.update_patient, [(phn,) + patient_fields(phn) for phn in existing]),
+				('delete', controller.delete_patient, [(phn,) for phn in new]),
+				('list', controller.list_patients, list_calls),
+				('page', controller.list_patients, [(PAGE_SIZE, phn) for phn in existing]),
+			]
+		dao = controller.patients_dao
+		return [
+			('create', dao.create_patient, [(Patient(*patient_fields(phn)),) for phn in new]),
+			('search', dao.search_patient, [(phn,) for phn in existing]),
+			('retrieve', dao.retrieve_patients, [(f"Patient {phn}",) for phn in existing]),
+			('update', dao.update_patient, [(phn, Patient(*patient_fields(phn))) for phn in existing]),
+			('delete', dao.delete_patient, [(phn,) for phn in new]),
+			('list', dao.list_patients, list_calls),
+			('page', dao.list_patients, [(PAGE_SIZE, phn) for phn in existing]),
+		]
+
+	def note_operations(self, controller, count, layer):
+		''' the calls timed for each note operation, in the order they run '''
+		samples = self.options.samples
+		existing = [self.random.randrange(1, count + 1) for i in range(samples)]
+		new = [count + 1 + i for i in range(samples)]
+		list_calls = [()] * max(1, samples // 10)
+		target = controller if layer == 'controller' else controller.current_patient.record.notes_dao
+		return [
+			('create', target.create_note, [(note_text(code),) for code in new]),
+			('search', target.search_note, [(code,) for code in existing]),
+			('retrieve', target.retrieve_notes, [(f"Visit {code}:",) for code in existing]),
+			('update', target.update_note, [(code, note_text(code) + " Follow up in a week.") for code in existing]),
+			('delete', target.delete_note, [(code,) for code in new]),
+			('list', target.list_notes, list_calls),
+			('page', target.list_notes, [(PAGE_SIZE, code) for code in existing]),
+		]
+
+	def load_patients(self, layer):
+		''' cold start: open the store and, through the controller, log in '''
+		if layer == 'controller':
+			self.close(self.open_controller())
+		else:
+			Controller(autosave=True, journal=self.options.journal, backend=self.options.backend, data_directory=self.data_directory)
+
+	def load_notes(self, layer):
+		''' cold start: open the store and load the patient's notes '''
+		controller = self.open_controller()
+		if layer == 'controller':
+			controller.set_current_patient(PHN)
+			controller.list_notes()
+		else:
+			controller.patients_dao.search_patient(PHN).record.notes_dao
+		self.close(controller)
+
+
+def benchmark_patients(options, count, autosave, layer):
+	''' time the patient operations on a store of count patients '''
+	with tempfile.TemporaryDirectory() as data_directory:
+		run = Run(options, autosave, data_directory)
+		controller = run.open_controller()
+		controller.create_patients(patient_fields(FIRST_PHN + i) for i in range(count))
+		results = {operation: timed(function, calls) for operation, function, calls in run.patient_operations(controller, count, layer)}
+		run.close(controller)
+		if autosave:
+			results['load'] = timed(run.load_patients, [(layer,)] * options.load_samples)
+	return results
+
+
+def benchmark_notes(options, count, autosave, layer):
+	''' time the note operations on a patient with count notes '''
+	with tempfile.TemporaryDirectory() as data_directory:
+		run = Run(options, autosave, data_directory)
+		controller = run.open_controller()
+		controller.create_patient(*patient_fields(PHN))
+		controller.set_current_patient(PHN)
+		# one write for all the notes, so large records are quick to set up
+		with controller.transaction():
+			for code in range(1, count + 1):
+				controller.create_note(note_text(code))
+		results = {operation: timed(function, calls) for operation, function, calls in run.note_operations(controller, count, layer)}
+		run.close(controller)
+		if autosave:
+			results['load'] = timed(run.load_notes, [(layer,)] * options.load_samples)
+	return results
+
+
+def git_commit():
+	''' the commit being benchmarked, if the suite runs from a git checkout '''
+	try:
+		return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def run_suite(options):
+	''' run every configured benchmark and return the report '''
+	rows = []
+	configurations = [('patients', count) for count in options.patients] + [('notes', count) for count in options.notes]
+	for benchmark, count in configurations:
+		for autosave in options.autosave:
+			for layer in options.layers:
+				function = benchmark_patients if benchmark == 'patients' else benchmark_notes
+				for operation, samples in function(options, count, autosave == 'on', layer).items():
+					row = {
+						'benchmark': benchmark, 'size': count, 'operation': operation, 'layer': layer,
+						'autosave': autosave == 'on', 'backend': options.backend, 'journal': options.journal,
+						'write_behind': options.write_behind,
+					}
+					row.update(summarize(samples))
+					rows.append(row)
+					print(f"{benchmark:8} {count:>8} {operation:8} {layer:10} autosave {autosave:3}   "
+						f"p50 {row['p50_s'] * 1e6:12.1f} us   p95 {row['p95_s'] * 1e6:12.1f} us", flush=True)
+	return {
+		'metadata': {
+			'started': datetime.datetime.now().isoformat(timespec='seconds'),
+			'commit': git_commit(),
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'options': vars(options),
+		},
+		'results': rows,
+	}
+
+
+def row_key(row):
+	''' what identifies the same measurement in two reports '''
+	return tuple(row[field] for field in ('benchmark', 'size', 'operation', 'layer', 'autosave', 'backend', 'journal', 'write_behind'))
+
+
+def compare(report, baseline):
+	''' print how the median latencies moved since the baseline report '''
+	baseline_rows = {row_key(row): row for row in baseline['results']}
+	print(f"\ncompared with {baseline['metadata'].get('commit')}:")
+	for row in report['results']:
+		previous = baseline_rows.get(row_key(row))
+		if previous and previous['p50_s']:
+			print(f"{row['benchmark']:8} {row['size']:>8} {row['operation']:8} {row['layer']:10} "
+				f"autosave {'on' if row['autosave'] else 'off':3}   p50 x{row['p50_s'] / previous['p50_s']:6.2f}")
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--patients', type=int, nargs='*', default=[1000], help="patient counts to benchmark")
+	parser.add_argument('--notes', type=int, nargs='*', default=[10, 1000], help="notes per patient to benchmark")
+	parser.add_argument('--autosave', nargs='+', choices=['off', 'on'], default=['off', 'on'])
+	parser.add_argument('--layers', nargs='+', choices=['controller', 'dao'], default=['controller', 'dao'])
+	parser.add_argument('--backend', choices=['json', 'segments', 'sqlite'], default='json')
+	parser.add_argument('--journal', action='store_true', help="append changes to journals")
+	parser.add_argument('--write-behind', action='store_true', help="write changes in the background")
+	parser.add_argument('--samples', type=int, default=100, help="calls timed per operation")
+	parser.add_argument('--load-samples', type=int, default=3, help="cold starts timed per benchmark")
+	parser.add_argument('--seed', type=int, default=265)
+	parser.add_argument('--output', default='benchmark-results.json', help="where the JSON report is written")
+	parser.add_argument('--baseline', help="an earlier JSON report to compare with")
+	options = parser.parse_args()
+
+	report = run_suite(options)
+	with open(options.output, 'w') as file:
+		json.dump(report, file, indent=1)
+	print(f"results written to {options.output}")
+	if options.baseline:
+		with open(options.baseline) as file:
+			compare(report, json.load(file))
@@ -0,0 +1,187 @@
+from clinic.controller import Controller
+from clinic.session import Session
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+
+
+class AsyncController():
+	''' asyncio facade over Controller, running the operations that touch storage
+		on a bounded executor so they never block the event loop. reads run side by
+		side, kept apart from writes by the controller's store lock '''
+
+	# the note operations that change the notes, which take the notes file's lock
+	NOTE_MUTATIONS = ('create_note', 'update_note', 'delete_note')
+
+	def __init__(self, autosave = False, journal = False, backend = 'json', max_workers = 4, controller = None):
+		''' construct an async controller, loading the data like Controller does '''
+		if controller is None:
+			controller = Controller(autosave=autosave, journal=journal, backend=backend)
+		self.controller = controller
+		self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='clinic-io')
+		# one lock per file, so writes to the same file never interleave and run in the order
+		# they were called; reads skip it, the store lock keeps them apart from writes
+		self.locks = {}
+		# idle sessions the note operations run on, at most one per operation in flight
+		self.sessions = []
+
+	def _lock(self, name):
+		''' the lock serializing access to one file '''
+		lock = self.locks.get(name)
+		if lock is None:
+			lock = self.locks[name] = asyncio.Lock()
+		return lock
+
+	def _notes_file(self, phn):
+		''' name of the file holding a patient's notes '''
+		if self.controller.backend == 'json':
+			return f"notes-{phn}"
+		if self.controller.backend == 'segments':
+			return 'notes'  # every patient's notes share the segment files
+		return 'patients'  # sqlite keeps patients and notes in one database
+
+	async def _run(self, file_name, function, *args, **kwargs):
+		''' run blocking writes on the executor while holding the lock of the file they change '''
+		async with self._lock(file_name):
+			return await self._read(function, *args, **kwargs)
+
+	async def _read(self, function, *args, **kwargs):
+		''' run blocking reads on the executor, alongside other reads '''
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+	async def _run_on_patient(self, operation, *args, **kwargs):
+		''' run a note operation of the controller on the current patient, captured
+			when the operation is called. it runs on a session of the controller's
+			user, so it takes the store lock and is measured like the controller's
+			own operations, while the current patient may change meanwhile '''
+		self.controller._check_current_patient()
+		patient = self.controller.current_patient
+		session = self.sessions.pop() if self.sessions else Session(self.controller)
+		session.username = self.controller.username
+		session.password = self.controller.password
+		session.logged = True
+		session.current_patient = patient
+		try:
+			if operation in self.NOTE_MUTATIONS:
+				result = await self._run(self._notes_file(patient.phn), getattr(session, operation), *args, **kwargs)
+			else:
+				result = await self._read(getattr(session, operation), *args, **kwargs)
+		except asyncio.CancelledError:
+			raise  # the executor may still be running on the session, so it is not reused
+		except Exception:
+			self.sessions.append(session)
+			raise
+		self.sessions.append(session)
+		return result
+
+	async def login(self, username, password):
+		''' user logs in the system '''
+		return self.controller.login(username, password)
+
+	async def logout(self):
+		''' user logs out from the system, writing the changes held back by write-behind '''
+		return await self._run('patients', self.controller.logout)
+
+	async def flush(self):
+		''' write the changes held back by write-behind now '''
+		return await self._run('patients', self.controller.flush)
+
+	async def search_patient(self, phn):
+		''' user searches a patient '''
+		return await self._read(self.controller.search_patient, phn)
+
+	async def create_patient(self, phn, name, birth_date, phone, email, address):
+		''' user creates a patient '''
+		return await self._run('patients', self.controller.create_patient, phn, name, birth_date, phone, email, address)
+
+	async def create_patients(self, patients_data):
+		''' user creates many patients at once '''
+		return await self._run('patients', self.controller.create_patients, list(patients_data))
+
+	async def import_patients(self, file_path):
+		''' user imports patients from a CSV file '''
+		return await self._run('patients', self.controller.import_patients, file_path)
+
+	async def retrieve_patients(self, name):
+		''' user retrieves the patients that satisfy a search criterion '''
+		return await self._read(self.controller.retrieve_patients, name)
+
+	async def query_patients(self, birth_date_from = None, birth_date_to = None, phone_prefix = None, email_domain = None):
+		''' user retrieves the patients matching every given criterion '''
+		return await self._read(self.controller.query_patients, birth_date_from=birth_date_from,
+			birth_date_to=birth_date_to, phone_prefix=phone_prefix, email_domain=email_domain)
+
+	async def update_patient(self, original_phn, phn, name, birth_date, phone, email, address):
+		''' user updates a patient '''
+		return await self._run('patients', self.controller.update_patient, original_phn, phn, name, birth_date, phone, email, address)
+
+	async def delete_patient(self, phn):
+		''' user deletes a patient '''
+		return await self._run('patients', self.controller.delete_patient, phn)
+
+	async def list_patients(self, limit = None, after = None):
+		''' user lists all patients, or a page of them ordered by PHN '''
+		return await self._read(self.controller.list_patients, limit=limit, after=after)
+
+	async def set_current_patient(self, phn):
+		''' user sets the current patient '''
+		return await self._read(self.controller.set_current_patient, phn)
+
+	async def get_current_patient(self):
+		''' get the current patient '''
+		return self.controller.get_current_patient()
+
+	async def unset_current_patient(self):
+		''' unset the current patient '''
+		return self.controller.unset_current_patient()
+
+	async def search_note(self, code):
+		''' user searches a note from the current patient's record '''
+		return await self._run_on_patient('search_note', code)
+
+	async def create_note(self, text):
+		''' user creates a note in the current patient's record '''
+		return await self._run_on_patient('create_note', text)
+
+	async def retrieve_notes(self, search_string):
+		''' user retrieves the notes from the current patient's record
+			that satisfy a search string '''
+		return await self._run_on_patient('retrieve_notes', search_string)
+
+	async def retrieve_notes_between(self, start = None, end = None):
+		''' user retrieves the notes from the current patient's record
+			timestamped from start to end, oldest first '''
+		return await self._run_on_patient('retrieve_notes_between', start, end)
+
+	async def notes_since(self, since):
+		''' user retrieves the notes from the current patient's record
+			timestamped at or after since, oldest first '''
+		return await self._run_on_patient('notes_since', since)
+
+	async def retrieve_clinic_notes_between(self, start = None, end = None):
+		''' user retrieves the notes of every patient timestamped from start to end '''
+		return await self._read(self.controller.retrieve_clinic_notes_between, start, end)
+
+	async def update_note(self, code, new_text):
+		''' user updates a note from the current patient's record '''
+		return await self._run_on_patient('update_note', code, new_text)
+
+	async def delete_note(self, code):
+		''' user deletes a note from the current patient's record '''
+		return await self._run_on_patient('delete_note', code)
+
+	async def list_notes(self, limit = None, before_code = None):
+		''' user lists all notes from the current patient's record, or a page of them '''
+		return await self._run_on_patient('list_notes', limit=limit, before_code=before_code)
+
+	def close(self):
+		''' wait for the pending storage work and stop the executor '''
+		self.executor.shutdown(wait=True)
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc_value, traceback):
+		self.close()
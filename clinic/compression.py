@@ -0,0 +1,44 @@
+import lzma
+import zlib
+
+
+# xz streams start with this magic and zlib streams never do, so a
+# compressed text needs no marker of the codec that compressed it
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+
+def decompress_text(data):
+	''' the text compressed by a TextCompressor '''
+	if data.startswith(XZ_MAGIC):
+		return lzma.decompress(data).decode()
+	return zlib.decompress(data).decode()
+
+
+class TextCompressor():
+	''' compresses note texts with zlib or lzma. texts are stored as str, or
+		as the compressed bytes once they are long enough for it to pay off '''
+
+	CODECS = ('zlib', 'lzma')
+
+	def __init__(self, codec = 'zlib', level = None, threshold = 256):
+		''' compress with the codec at level (0 to 9, the codec's default if None)
+			the texts of at least threshold UTF-8 bytes '''
+		if codec not in self.CODECS:
+			raise ValueError(f"Unknown compression codec '{codec}'.")
+		if level is not None and not 0 <= level <= 9:
+			raise ValueError(f"Invalid compression level {level}.")
+		self.codec = codec
+		self.level = level
+		self.threshold = threshold
+
+	def compress(self, text):
+		''' the text as it is to be stored: compressed bytes, or the text itself
+			if it is shorter than the threshold or does not get any shorter '''
+		data = text.encode()
+		if len(data) < self.threshold:
+			return text
+		if self.codec == 'zlib':
+			compressed = zlib.compress(data, -1 if self.level is None else self.level)
+		else:
+			compressed = lzma.compress(data, preset=self.level)
+		return compressed if len(compressed) < len(data) else text
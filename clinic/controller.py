@@ -10,30 +10,123 @@ from clinic.exception.invalid_logout_exception import InvalidLogoutException
 from clinic.exception.no_current_patient_exception import NoCurrentPatientException
 
 from clinic.dao.patient_dao_json import PatientDAOJSON
+from clinic.dao.patient_dao_sqlite import PatientDAOSQLite
 from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.dao.note_dao_segment import NoteDAOSegment
+from clinic.dao.note_segment_store import NoteSegmentStore
+from clinic.dao.timestamp_index import normalize_timestamp
+from clinic.dao.patient_query_index import phone_digits
+from clinic.dao.write_behind_flusher import WriteBehindFlusher
+from clinic.read_write_lock import ReadWriteLock
+from clinic.metrics import Metrics, MetricsExporter
+from clinic.profiler import Profiler
+from clinic.compression import TextCompressor
 
 import os
+import csv
+import datetime
 import hashlib
+from contextlib import contextmanager
 
 
 class Controller():
 	''' controller class that receives the system's operations '''
 
-	def __init__(self, autosave = False):
-		''' construct a controller class '''
+	# the patient fields, in the order create_patient takes them
+	PATIENT_FIELDS = ('phn', 'name', 'birth_date', 'phone', 'email', 'address')
+	# the operations timed when metrics are on
+	OPERATIONS = ('login', 'logout', 'open_session', 'flush', 'search_patient', 'create_patient', 'create_patients',
+		'import_patients', 'retrieve_patients', 'query_patients', 'update_patient', 'delete_patient', 'list_patients',
+		'set_current_patient', 'get_current_patient', 'unset_current_patient',
+		'search_note', 'create_note', 'retrieve_notes', 'retrieve_notes_between', 'notes_since', 'retrieve_clinic_notes_between',
+		'update_note', 'delete_note', 'list_notes')
+
+	def __init__(self, autosave = False, journal = False, backend = 'json', write_behind = False, flush_interval = 1.0, flush_threshold = 100, data_directory = None,
+			metrics = False, metrics_file = None, metrics_interval = 15.0, intern_strings = False, columnar_notes = False,
+			note_compression = None, compression_level = None, compression_threshold = 256):
+		''' construct a controller class, storing data with the 'json' (JSON and pickle files),
+			'segments' (JSON patients, notes in shared segment files) or 'sqlite' backend.
+			with write_behind, the json backend writes changes in the background every
+			flush_interval seconds, or once flush_threshold changes are waiting.
+			the data files are kept in data_directory, the clinic package by default.
+			with metrics, operations and DAO persistence calls are measured for stats(),
+			and with a metrics_file they are also written there in the Prometheus text
+			format every metrics_interval seconds. with intern_strings, patients share the
+			strings of repeated names and birth dates, which saves memory in large registries,
+			and with columnar_notes the notes are kept in arrays instead of one object each.
+			with note_compression ('zlib' or 'lzma'), note texts of at least compression_threshold
+			bytes are compressed at compression_level, and decompressed when they are read '''
 		self.users = {"user" : "123456", "ali": "@G00dPassw0rd"}
 		self.username = None
 		self.password = None
 		self.logged = False
 		self.current_patient = None
+		self.transaction_daos = None  # DAOs taking part in the open transaction
 		
 		self.autosave = autosave
-
-		self.patients_dao = PatientDAOJSON(autosave=self.autosave)  # Instantiate the PatientDAO class
+		self.journal = journal  # append mutations to a journal instead of rewriting whole files
+		self.backend = backend
+		self.intern_strings = intern_strings
+		# sessions share the store, searches run in parallel and mutations one at a time
+		self.store_lock = ReadWriteLock()
+		self.flusher = None
+		# without metrics the operations are not wrapped at all, so they cost nothing
+		self.metrics = Metrics() if metrics or metrics_file is not None else None
+		self.metrics_exporter = None
+		if write_behind and backend != 'json':
+			raise IllegalOperationException(f"Write-behind is not supported by the '{backend}' backend.")
+		if columnar_notes and backend == 'sqlite':
+			raise IllegalOperationException("Columnar notes are not supported by the 'sqlite' backend, which keeps the notes in the database.")
+		compressor = None
+		if note_compression is not None:
+			if backend == 'sqlite':
+				raise IllegalOperationException("Note compression is not supported by the 'sqlite' backend, which searches the texts in the database.")
+			try:
+				compressor = TextCompressor(note_compression, level=compression_level, threshold=compression_threshold)
+			except ValueError as e:
+				raise IllegalOperationException(str(e))
+
+		records_directory = os.path.join(data_directory, 'records') if data_directory is not None else None
+
+		# the DAO loads patients from their respective file itself when autosave is on
+		if backend == 'json':
+			if write_behind and self.autosave:
+				# the flusher writes while searches go on, but never in the middle of a change
+				self.flusher = WriteBehindFlusher(interval=flush_interval, threshold=flush_threshold, lock=self.store_lock.read_locked)
+			notes_dao_factory = None
+			if self.flusher is not None or records_directory is not None or self.metrics is not None or columnar_notes or compressor is not None:
+				notes_dao_factory = lambda phn: NoteDAOPickle(phn, autosave=self.autosave, journal=self.journal,
+					data_directory=records_directory, flusher=self.flusher, metrics=self.metrics, columnar=columnar_notes,
+					compressor=compressor)
+			self.patients_dao = PatientDAOJSON(autosave=self.autosave, journal=self.journal, data_directory=data_directory,
+				flusher=self.flusher, notes_dao_factory=notes_dao_factory, metrics=self.metrics,
+				intern_strings=intern_strings)  # Instantiate the PatientDAO class
+		elif backend == 'segments':
+			notes_store = NoteSegmentStore(records_directory) if self.autosave else None
+			self.patients_dao = PatientDAOJSON(autosave=self.autosave, journal=self.journal, data_directory=data_directory,
+				notes_dao_factory=lambda phn: NoteDAOSegment(phn, notes_store, autosave=self.autosave, metrics=self.metrics,
+					columnar=columnar_notes, compressor=compressor),
+				metrics=self.metrics, intern_strings=intern_strings)
+		elif backend == 'sqlite':
+			self.patients_dao = PatientDAOSQLite(autosave=self.autosave, data_directory=data_directory)
+		else:
+			raise IllegalOperationException(f"Unknown storage backend '{backend}'.")
 		
 		if self.autosave:
 			self.load_users()  # Load users from the users.txt file
-			self.patients_dao.load_data()  # Load patients from their respective file
+
+		if self.metrics is not None:
+			self.metrics.instrument(self, 'controller', self.OPERATIONS)
+		if metrics_file is not None:
+			self.metrics_exporter = MetricsExporter(self.metrics, metrics_file, interval=metrics_interval)
+
+		# profiling can be turned on without touching the code, e.g. CLINIC_PROFILE=/tmp/profiles
+		self.profiler = None
+		profile_directory = os.environ.get('CLINIC_PROFILE')
+		if profile_directory:
+			operations = os.environ.get('CLINIC_PROFILE_OPERATIONS')
+			self.start_profiling(profile_directory, operations.split(',') if operations else None,
+				mode=os.environ.get('CLINIC_PROFILE_MODE', 'cprofile'), interval=float(os.environ.get('CLINIC_PROFILE_INTERVAL', 60)))
 
 	
 	def load_users(self):
@@ -68,6 +161,14 @@ class Controller():
 		self.password = password
 		self.logged = True
 		return True
+
+	def open_session(self, username, password):
+		''' user logs in a new session with its own current patient, sharing the
+			controller's store with every other session '''
+		from clinic.session import Session
+		session = Session(self)
+		session.login(username, password)
+		return session
 	
 	def check_password_hash(self, password, stored_password_hash):
 		''' Safely checks the password against its hash '''
@@ -80,6 +181,9 @@ class Controller():
 		''' user logs out from the system '''
 		if not self.logged:
 			raise InvalidLogoutException("User is not currently logged in.")
+
+		# changes held back by write-behind are on disk once the user leaves
+		self.flush()
 	
 		self.username = None
 		self.password = None
@@ -87,11 +191,113 @@ class Controller():
 		self.current_patient = None
 		return True
 
+	@contextmanager
+	def transaction(self):
+		''' user groups several operations so their changes are written together
+			when the block ends and all discarded if it raises. the changes to each
+			file are written at once, but a transaction touching several files (the
+			patients and some patients' notes) is not atomic: if writing one of them
+			fails, the files written before it keep their changes and the changes
+			to the others are discarded '''
+		# must be logged in to do operation
+		self._check_access()
+		if self.transaction_daos is not None:
+			raise IllegalOperationException("A transaction is already in progress.")
+
+		# other sessions wait until the transaction ends, so they never see or add to it
+		with self.store_lock.write_locked():
+			self.patients_dao.begin()
+			self.transaction_daos = daos = [self.patients_dao]
+			try:
+				yield self
+			except BaseException:
+				self._rollback(daos)
+				self._forget_rolled_back_patient()
+				raise
+			else:
+				for position, dao in enumerate(daos):
+					try:
+						dao.commit()
+					except BaseException:
+						# a failed commit discards its own changes, the DAOs not committed yet
+						# are rolled back so none keeps its changes pending or its file locked
+						self._rollback(daos[position + 1:])
+						self._forget_rolled_back_patient()
+						raise
+			finally:
+				self.transaction_daos = None
+
+	@staticmethod
+	def _rollback(daos):
+		''' roll every DAO back, even if some of them fail, raising the first failure '''
+		error = None
+		for dao in daos:
+			try:
+				dao.rollback()
+			except BaseException as e:
+				if error is None:
+					error = e
+		if error is not None:
+			raise error
+
+	def _forget_rolled_back_patient(self):
+		''' unset the current patient if it was created inside a rolled back transaction '''
+		if self.current_patient is not None and self.patients_dao.search_patient(self.current_patient.phn) is None:
+			self.current_patient = None
+
+	def flush(self):
+		''' write the changes held back by write-behind now '''
+		if self.flusher is not None:
+			self.flusher.flush()
+
+	def stats(self):
+		''' call counts and latency histograms of the operations and persistence calls,
+			bytes written and dataset sizes, when the controller was built with metrics '''
+		if self.metrics is None:
+			raise IllegalOperationException("Metrics are not enabled.")
+		return self.metrics.stats()
+
+	def export_metrics(self, path):
+		''' write the metrics to a file in the Prometheus text format '''
+		if self.metrics is None:
+			raise IllegalOperationException("Metrics are not enabled.")
+		self.metrics.write_prometheus(path)
+
+	def start_profiling(self, directory, operations = None, mode = 'cprofile', interval = 60.0):
+		''' profile operations (all of them by default) on this controller and its sessions,
+			dumping a pstats ('cprofile' mode) or collapsed stacks ('sampling' mode) file
+			per operation into directory every interval seconds '''
+		if self.profiler is not None:
+			raise IllegalOperationException("Profiling is already on.")
+		operations = list(operations) if operations is not None else list(self.OPERATIONS)
+		for operation in operations:
+			if operation not in self.OPERATIONS:
+				raise IllegalOperationException(f"Unknown operation '{operation}'.")
+		if mode not in Profiler.MODES:
+			raise IllegalOperationException(f"Unknown profiling mode '{mode}'.")
+		self.profiler = Profiler(directory, operations, mode=mode, interval=interval)
+		self.profiler.instrument(self)
+		return self.profiler
+
+	def stop_profiling(self):
+		''' stop profiling, writing the profiles one last time '''
+		if self.profiler is None:
+			raise IllegalOperationException("Profiling is not on.")
+		self.profiler.close()
+		self.profiler = None
+
+	def _enlist(self, dao):
+		''' make a notes DAO take part in the open transaction, if any '''
+		if self.transaction_daos is not None and dao not in self.transaction_daos:
+			dao.begin()
+			self.transaction_daos.append(dao)
+
 	def search_patient(self, phn):
 		''' user searches a patient '''
 		# must be logged in to do operation
 		self._check_access()
-		return self.patients_dao.search_patient(phn)
+		with self.store_lock.read_locked():
+			return self.patients_dao.search_patient(phn)
 
 
 	def create_patient(self, phn, name, birth_date, phone, email, address):
@@ -99,42 +305,94 @@ class Controller():
 		# must be logged in to do operation
 		self._check_access()
 
-		if self.patients_dao.search_patient(phn):
-			raise IllegalOperationException("Patient with this PHN already exists.")
+		with self.store_lock.write_locked():
+			if self.patients_dao.search_patient(phn):
+				raise IllegalOperationException("Patient with this PHN already exists.")
+
+			# finally, create a new patient
+			patient = Patient(phn, name, birth_date, phone, email, address, autosave=self.autosave, journal=self.journal, intern_strings=self.intern_strings)
+			self.patients_dao.create_patient(patient)
+			return patient
+
+	def create_patients(self, patients_data):
+		''' user creates many patients at once, persisting them with a single write.
+			each item is a dictionary or a sequence of the patient fields '''
+		# must be logged in to do operation
+		self._check_access()
+
+		patients = []
+		for patient_data in patients_data:
+			if isinstance(patient_data, dict):
+				patient_data = [patient_data.get(field) for field in self.PATIENT_FIELDS]
+			else:
+				patient_data = list(patient_data)
+			if len(patient_data) != len(self.PATIENT_FIELDS) or any(value is None for value in patient_data):
+				raise IllegalOperationException(f"Invalid patient data: {patient_data}")
+			patients.append(Patient(*patient_data, autosave=self.autosave, journal=self.journal, intern_strings=self.intern_strings))
+
+		# the DAO rejects PHNs already registered or repeated in the batch before inserting any
+		with self.store_lock.write_locked():
+			return self.patients_dao.create_patients(patients)
+
+	def import_patients(self, file_path):
+		''' user imports patients from a CSV file whose header names the patient fields '''
+		# must be logged in to do operation
+		self._check_access()
 
-		# finally, create a new patient
-		patient = Patient(phn, name, birth_date, phone, email, address)
-		self.patients_dao.create_patient(patient)
-		return patient
+		try:
+			with open(file_path, newline='') as file:
+				patients_data = [dict(row, phn=int(row['phn'])) for row in csv.DictReader(file)]
+		except (KeyError, ValueError) as e:
+			raise IllegalOperationException(f"Invalid patients file '{file_path}': {e}")
+		return self.create_patients(patients_data)
 
 	def retrieve_patients(self, name):
 		''' user retrieves the patients that satisfy a search criterion '''
 		# must be logged in to do operation
 		self._check_access()
-		return self.patients_dao.retrieve_patients(name)
+		with self.store_lock.read_locked():
+			return self.patients_dao.retrieve_patients(name)
+
+	def query_patients(self, birth_date_from = None, birth_date_to = None, phone_prefix = None, email_domain = None):
+		''' user retrieves the patients matching every given criterion, ordered by PHN:
+			born between birth_date_from and birth_date_to (both included, as dates or
+			YYYY-MM-DD), with a phone number starting with phone_prefix (digits only are
+			compared) and an email address at email_domain '''
+		# must be logged in to do operation
+		self._check_access()
+		birth_date_from = self._birth_date_bound(birth_date_from)
+		birth_date_to = self._birth_date_bound(birth_date_to)
+		if phone_prefix is not None and (not isinstance(phone_prefix, str) or not phone_digits(phone_prefix)):
+			raise IllegalOperationException(f"Invalid phone prefix: {phone_prefix!r}.")
+		if email_domain is not None and not isinstance(email_domain, str):
+			raise IllegalOperationException(f"Invalid email domain: {email_domain!r}.")
+		with self.store_lock.read_locked():
+			return self.patients_dao.query_patients(birth_date_from=birth_date_from, birth_date_to=birth_date_to,
+				phone_prefix=phone_prefix, email_domain=email_domain)
 
 	def update_patient(self, original_phn, phn, name, birth_date, phone, email, address):
 		''' user updates a patient '''
 		# must be logged in to do operation
 		self._check_access()
 
-		# Ensure PHN update is not to an already registered PHN
-		if original_phn != phn and self.patients_dao.search_patient(phn):
-			raise IllegalOperationException("Cannot update patient with an already registered PHN.")
+		with self.store_lock.write_locked():
+			# Ensure PHN update is not to an already registered PHN
+			if original_phn != phn and self.patients_dao.search_patient(phn):
+				raise IllegalOperationException("Cannot update patient with an already registered PHN.")
 
-    	# Prevent updating the current patient
-		if original_phn == self.current_patient.phn if self.current_patient else None:
-			raise IllegalOperationException("Cannot update the current patient.")
+			# Prevent updating the current patient
+			if original_phn == self.current_patient.phn if self.current_patient else None:
+				raise IllegalOperationException("Cannot update the current patient.")
 
-		patient_to_update = self.patients_dao.search_patient(original_phn)
-		if not patient_to_update:
-			raise IllegalOperationException("Patient not found.")
+			patient_to_update = self.patients_dao.search_patient(original_phn)
+			if not patient_to_update:
+				raise IllegalOperationException("Patient not found.")
 
-		updated_patient = Patient(phn, name, birth_date, phone, email, address)
-		updated = self.patients_dao.update_patient(original_phn, updated_patient)
-		if not updated:
-			raise IllegalOperationException("Failed to update patient.")
-		return True
+			updated_patient = Patient(phn, name, birth_date, phone, email, address, autosave=self.autosave, journal=self.journal, intern_strings=self.intern_strings)
+			updated = self.patients_dao.update_patient(original_phn, updated_patient)
+			if not updated:
+				raise IllegalOperationException("Failed to update patient.")
+			return True
 	######could have an error with my first if statement########
 	def delete_patient(self, phn):
 		''' user deletes a patient '''
@@ -144,17 +402,30 @@ class Controller():
 		if self.current_patient is not None and phn == self.current_patient.phn:
 			raise IllegalOperationException("Cannot delete the current patient.")
 
-		if not self.patients_dao.search_patient(phn):
-			raise IllegalOperationException("Patient not found.")
+		with self.store_lock.write_locked():
+			if not self.patients_dao.search_patient(phn):
+				raise IllegalOperationException("Patient not found.")
 
-		self.patients_dao.delete_patient(phn)
-		return True
+			self.patients_dao.delete_patient(phn)
+			return True
 
-	def list_patients(self):
-		''' user lists all patients '''
+	def list_patients(self, limit = None, after = None):
+		''' user lists all patients, or with a limit a page of them ordered by PHN: the
+			first limit patients with a PHN greater than after. the next page starts after
+			the last PHN of this one, and stays in place while patients are created or deleted '''
 		# must be logged in to do operation
 		self._check_access()
-		return self.patients_dao.list_patients()
+		self._check_limit(limit)
+		with self.store_lock.read_locked():
+			return self.patients_dao.list_patients(limit=limit, after=after)
+
+	def iter_patients(self, page_size = 100):
+		''' user goes through every patient ordered by PHN, one page at a time; the
+			store is only locked while a page is read, so other sessions can change
+			the patients in between pages '''
+		self._check_access()
+		self._check_limit(page_size)
+		return self._pages(lambda after: self.list_patients(page_size, after=after), lambda patient: patient.phn)
 		
 
 	def set_current_patient(self, phn):
@@ -163,7 +434,8 @@ class Controller():
 		self._check_access()
 
 		# first, search the patient by key
-		patient = self.patients_dao.search_patient(phn)
+		with self.store_lock.read_locked():
+			patient = self.patients_dao.search_patient(phn)
 		# patient does not exist
 		if not patient:
 			raise IllegalOperationException("Patient does not exist.")
@@ -194,7 +466,8 @@ class Controller():
 		# there must be a valid current patient and logged in
 		self._check_current_patient()
 		# search a new note with the given code and return it 
-		return self.current_patient.record.search_note(code)
+		with self.store_lock.read_locked():
+			return self.current_patient.record.search_note(code)
 
 	def create_note(self, text):
 		''' user creates a note in the current patient's record '''
@@ -203,7 +476,9 @@ class Controller():
 		self._check_current_patient()
 
 		# create a new note and return it
-		return self.current_patient.record.create_note(text)
+		with self.store_lock.write_locked():
+			self._enlist(self.current_patient.record.notes_dao)
+			return self.current_patient.record.create_note(text)
 
 	def retrieve_notes(self, search_string):
 		''' user retrieves the notes from the current patient's record
@@ -212,7 +487,39 @@ class Controller():
 		self._check_current_patient()
 
 		# return the found notes
-		return self.current_patient.record.retrieve_notes(search_string)
+		with self.store_lock.read_locked():
+			return self.current_patient.record.retrieve_notes(search_string)
+
+	def retrieve_notes_between(self, start = None, end = None):
+		''' user retrieves the notes from the current patient's record timestamped
+			from start to end, both included and optional, oldest first. bounds are
+			datetimes, dates or ISO strings, aware datetimes are taken in local time '''
+		# there must be a valid current patient and logged in
+		self._check_current_patient()
+		self._check_time_range(start, end)
+
+		with self.store_lock.read_locked():
+			return self.current_patient.record.retrieve_notes_between(start, end)
+
+	def notes_since(self, since):
+		''' user retrieves the notes from the current patient's record
+			timestamped at or after since, oldest first '''
+		# there must be a valid current patient and logged in
+		self._check_current_patient()
+		self._check_time_range(since, None)
+
+		with self.store_lock.read_locked():
+			return self.current_patient.record.notes_since(since)
+
+	def retrieve_clinic_notes_between(self, start = None, end = None):
+		''' user retrieves the notes of every patient timestamped from start to end,
+			as (patient, note) pairs, oldest first '''
+		# must be logged in to do operation
+		self._check_access()
+		self._check_time_range(start, end)
+
+		with self.store_lock.read_locked():
+			return self.patients_dao.retrieve_notes_between(start, end)
 
 	def update_note(self, code, new_text):
 		''' user updates a note from the current patient's record '''
@@ -221,7 +528,9 @@ class Controller():
 		self._check_current_patient()
 
 		# update note
-		return self.current_patient.record.update_note(code, new_text)
+		with self.store_lock.write_locked():
+			self._enlist(self.current_patient.record.notes_dao)
+			return self.current_patient.record.update_note(code, new_text)
 
 	def delete_note(self, code):
 		''' user deletes a note from the current patient's record '''
@@ -230,15 +539,72 @@ class Controller():
 		self._check_current_patient()
 
 		# delete note
-		return self.current_patient.record.delete_note(code)
-
-	def list_notes(self):
-		''' user lists all notes from the current patient's record '''
+		with self.store_lock.write_locked():
+			self._enlist(self.current_patient.record.notes_dao)
+			return self.current_patient.record.delete_note(code)
+
+	def list_notes(self, limit = None, before_code = None):
+		''' user lists all notes from the current patient's record, newest first, or with
+			a limit a page of them: the limit newest notes with a code lower than before_code.
+			the next page continues before the last code of this one '''
 		# there must be a valid current patient and logged in
 		self._check_current_patient()
+		self._check_limit(limit)
+
+		with self.store_lock.read_locked():
+			return self.current_patient.record.list_notes(limit=limit, before_code=before_code)
 
-		return self.current_patient.record.list_notes()
+	def iter_notes(self, page_size = 100):
+		''' user goes through the current patient's notes newest first, one page at a time,
+			staying on that patient even if the current patient changes meanwhile '''
+		self._check_current_patient()
+		self._check_limit(page_size)
+		patient = self.current_patient
+
+		def list_page(before_code):
+			with self.store_lock.read_locked():
+				return patient.record.list_notes(limit=page_size, before_code=before_code)
+		return self._pages(list_page, lambda note: note.code)
+
+	@staticmethod
+	def _pages(list_page, cursor_of):
+		''' yield the items of one page after the other, each page continuing
+			from the cursor of the last item of the previous one '''
+		cursor = None
+		while True:
+			# a page may come back short while a concurrent reload swaps the data, only an empty one ends
+			page = list_page(cursor)
+			if not page:
+				return
+			yield from page
+			cursor = cursor_of(page[-1])
 	
+	def _check_limit(self, limit):
+		''' check that a page holds at least one item '''
+		if limit is not None and limit < 1:
+			raise IllegalOperationException("The page size must be at least 1.")
+
+	def _birth_date_bound(self, bound):
+		''' a bound of a birth date range as YYYY-MM-DD, given as a date or an ISO date string '''
+		if bound is None:
+			return None
+		if isinstance(bound, datetime.datetime):
+			bound = bound.date()
+		if isinstance(bound, datetime.date):
+			return bound.isoformat()
+		if isinstance(bound, str):
+			try:
+				return datetime.date.fromisoformat(bound).isoformat()
+			except ValueError:
+				pass
+		raise IllegalOperationException(f"Invalid birth date: {bound!r}.")
+
+	def _check_time_range(self, start, end):
+		''' check that the bounds of a time range are timestamps '''
+		for bound in (start, end):
+			if bound is not None and normalize_timestamp(bound) is None:
+				raise IllegalOperationException(f"Invalid timestamp: {bound!r}.")
+
 	def _check_access(self):
 		''' check if the user is logged in '''
 		if not self.logged:
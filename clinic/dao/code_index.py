@@ -0,0 +1,46 @@
+from array import array
+from bisect import bisect_left, insort
+
+
+class CodeIndex():
+    ''' The codes of a patient's notes in order, for pages of notes. Deleted codes
+        are skipped while paging and dropped once there are enough of them '''
+
+    def __init__(self, codes = ()):
+        ''' index the given codes '''
+        self.codes = array('q', sorted(codes))
+        self.deleted = 0  # codes still in the array whose notes were deleted
+
+    def add(self, code):
+        ''' index the code of a new note, usually the highest one yet '''
+        codes = self.codes
+        if not codes or code > codes[-1]:
+            codes.append(code)
+            return
+        position = bisect_left(codes, code)
+        if position < len(codes) and codes[position] == code:
+            self.deleted -= 1  # its note was deleted but the code was still there
+        else:
+            insort(codes, code)
+
+    def remove(self, code, notes):
+        ''' stop indexing the code of a deleted note; notes holds the remaining ones '''
+        self.deleted += 1
+        # rebuilt once the deleted codes outnumber an eighth of the notes, so a page
+        # skips few of them and each deletion costs a constant amount on average
+        if self.deleted > max(64, (len(self.codes) - self.deleted) // 8):
+            self.codes = array('q', sorted(notes))
+            self.deleted = 0
+
+    def before(self, before_code, limit, notes):
+        ''' up to limit codes lower than before_code, or from the highest one,
+            highest first, of the notes still in notes '''
+        codes = self.codes
+        position = len(codes) if before_code is None else bisect_left(codes, before_code)
+        page = []
+        while position > 0 and (limit is None or len(page) < limit):
+            position -= 1
+            code = codes[position]
+            if code in notes:
+                page.append(code)
+        return page
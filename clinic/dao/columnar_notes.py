@@ -0,0 +1,226 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping, ValuesView
+from datetime import datetime, timedelta
+
+from clinic.note import Note
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# how each row's timestamp is kept
+DELETED = -1  # the row was deleted, its space is reclaimed by the next compaction
+DATETIME = 0  # a naive datetime, as microseconds since the epoch
+STRING = 1  # a string a naive datetime prints as, stored like a datetime
+OTHER = 2  # anything else, kept as is in other_timestamps
+
+
+class ColumnarNoteValues(ValuesView):
+	''' the notes of a ColumnarNotes, built as they are iterated '''
+
+	def __iter__(self):
+		return self._mapping.notes()
+
+	def __reversed__(self):
+		return self._mapping.notes(reverse=True)
+
+
+class ColumnarNotes(MutableMapping):
+	''' a patient's notes as a code -> Note mapping kept in columns: codes and
+		timestamps in typed arrays and the texts in one shared buffer, as UTF-8
+		or, for the texts the notes DAO compressed, as the compressed bytes.
+		Note objects are only built when a note is returned, so changing one
+		does not change the stored note until it is assigned back '''
+
+	def __init__(self, notes = ()):
+		''' construct the columns, holding the given notes in order '''
+		self.codes = array('q')
+		self.timestamps = array('q')
+		self.kinds = array('b')
+		self.offsets = array('q')  # where each text starts in the buffer
+		self.lengths = array('i')  # its length in bytes
+		self.compressed = array('b')  # whether it is compressed
+		self.text = bytearray()
+		self.other_timestamps = {}  # code -> timestamp of the OTHER kind
+		self.live = 0
+		self.garbage = 0  # buffer bytes of deleted or replaced texts
+		# codes are looked up by bisection while they only grow, as created
+		# notes get the next code; otherwise by this code -> row index
+		self.rows = None
+		for note in notes:
+			self[note.code] = note
+
+	def find(self, code):
+		''' the row of the note with the code, or -1 '''
+		if self.rows is not None:
+			return self.rows.get(code, -1)
+		codes = self.codes
+		if not codes:
+			return -1
+		# until deleted rows are compacted away the codes are usually consecutive
+		row = code - codes[0]
+		if not 0 <= row < len(codes) or codes[row] != code:
+			row = bisect_left(codes, code)
+		if row < len(codes) and codes[row] == code and self.kinds[row] != DELETED:
+			return row
+		return -1
+
+	def encode_timestamp(self, code, timestamp):
+		''' the kind and stored value of a note's timestamp '''
+		if isinstance(timestamp, str):
+			try:
+				parsed = datetime.fromisoformat(timestamp)
+			except ValueError:
+				parsed = None
+			# only strings it prints back as exactly, e.g. '2024-01-01 10:00:00'
+			if parsed is not None and parsed.tzinfo is None and parsed.isoformat(' ') == timestamp:
+				return STRING, (parsed - EPOCH) // MICROSECOND
+		elif isinstance(timestamp, datetime) and timestamp.tzinfo is None:
+			return DATETIME, (timestamp - EPOCH) // MICROSECOND
+		self.other_timestamps[code] = timestamp
+		return OTHER, 0
+
+	def timestamp(self, row):
+		''' the timestamp of a row, as it was given '''
+		kind = self.kinds[row]
+		if kind == OTHER:
+			return self.other_timestamps[self.codes[row]]
+		timestamp = EPOCH + timedelta(0, 0, self.timestamps[row])
+		return timestamp.isoformat(' ') if kind == STRING else timestamp
+
+	def note(self, row):
+		''' a new Note holding a row '''
+		# built without __init__, which would parse a string timestamp only to discard it
+		note = Note.__new__(Note)
+		note.code = self.codes[row]
+		offset = self.offsets[row]
+		text = self.text[offset:offset + self.lengths[row]]
+		note.text = bytes(text) if self.compressed[row] else text.decode()
+		note.timestamp = self.timestamp(row)
+		return note
+
+	def notes(self, reverse = False):
+		''' the notes in insertion order, or newest first '''
+		kinds = self.kinds
+		rows = range(len(kinds) - 1, -1, -1) if reverse else range(len(kinds))
+		return (self.note(row) for row in rows if kinds[row] != DELETED)
+
+	def __getitem__(self, code):
+		row = self.find(code)
+		if row < 0:
+			raise KeyError(code)
+		return self.note(row)
+
+	def __setitem__(self, code, note):
+		''' store a note under its code, in place if the code is already there '''
+		# a compressed text is stored as it is, without decompressing it
+		text = note.stored_text
+		compressed = isinstance(text, bytes)
+		if not compressed:
+			text = text.encode()
+		if self.rows is None and (not self.codes or code > self.codes[-1]):
+			row = -1  # a new last code, as for every created note
+		else:
+			row = self.find(code)
+		if row >= 0:
+			self.garbage += self.lengths[row]
+			self.other_timestamps.pop(code, None)
+			kind, timestamp = self.encode_timestamp(code, note.timestamp)
+			self.kinds[row] = kind
+			self.timestamps[row] = timestamp
+			self.offsets[row] = len(self.text)
+			self.lengths[row] = len(text)
+			self.compressed[row] = compressed
+			self.text += text
+			self.compact_if_sparse()
+			return
+
+		if self.rows is None and self.codes and code <= self.codes[-1]:
+			self.rows = {self.codes[row]: row for row in range(len(self.codes)) if self.kinds[row] != DELETED}
+		if self.rows is not None:
+			self.rows[code] = len(self.codes)
+		kind, timestamp = self.encode_timestamp(code, note.timestamp)
+		self.codes.append(code)
+		self.kinds.append(kind)
+		self.timestamps.append(timestamp)
+		self.offsets.append(len(self.text))
+		self.lengths.append(len(text))
+		self.compressed.append(compressed)
+		self.text += text
+		self.live += 1
+
+	def __delitem__(self, code):
+		row = self.find(code)
+		if row < 0:
+			raise KeyError(code)
+		self.kinds[row] = DELETED
+		self.garbage += self.lengths[row]
+		self.other_timestamps.pop(code, None)
+		if self.rows is not None:
+			del self.rows[code]
+		self.live -= 1
+		self.compact_if_sparse()
+
+	def compact_if_sparse(self):
+		''' compact once deleted rows or replaced texts take more room than the notes '''
+		if len(self.codes) - self.live > max(self.live, 64) or self.garbage > max(len(self.text) - self.garbage, 65536):
+			self.compact()
+
+	def compact(self):
+		''' rebuild the columns without the deleted rows and replaced texts '''
+		compacted = ColumnarNotes()
+		compacted.other_timestamps = self.other_timestamps
+		text = self.text
+		for row in range(len(self.codes)):
+			if self.kinds[row] == DELETED:
+				continue
+			compacted.codes.append(self.codes[row])
+			compacted.kinds.append(self.kinds[row])
+			compacted.timestamps.append(self.timestamps[row])
+			compacted.offsets.append(len(compacted.text))
+			compacted.lengths.append(self.lengths[row])
+			compacted.compressed.append(self.compressed[row])
+			compacted.text += text[self.offsets[row]:self.offsets[row] + self.lengths[row]]
+		codes = compacted.codes
+		if any(codes[row] >= codes[row + 1] for row in range(len(codes) - 1)):
+			compacted.rows = {code: row for row, code in enumerate(codes)}
+		compacted.live = len(codes)
+		self.__dict__.update(compacted.__dict__)
+
+	def __iter__(self):
+		kinds = self.kinds
+		return (code for row, code in enumerate(self.codes) if kinds[row] != DELETED)
+
+	def __reversed__(self):
+		kinds = self.kinds
+		return (self.codes[row] for row in range(len(kinds) - 1, -1, -1) if kinds[row] != DELETED)
+
+	def __contains__(self, code):
+		return self.find(code) >= 0
+
+	def __len__(self):
+		return self.live
+
+	def values(self):
+		''' the notes, built as they are iterated '''
+		return ColumnarNoteValues(self)
+
+	def clear(self):
+		''' remove every note '''
+		self.__init__()
+
+	def copy(self):
+		''' an independent copy of the columns '''
+		copied = ColumnarNotes()
+		copied.codes = array('q', self.codes)
+		copied.timestamps = array('q', self.timestamps)
+		copied.kinds = array('b', self.kinds)
+		copied.offsets = array('q', self.offsets)
+		copied.lengths = array('i', self.lengths)
+		copied.compressed = array('b', self.compressed)
+		copied.text = bytearray(self.text)
+		copied.other_timestamps = dict(self.other_timestamps)
+		copied.live = self.live
+		copied.garbage = self.garbage
+		copied.rows = None if self.rows is None else dict(self.rows)
+		return copied
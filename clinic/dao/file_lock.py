@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+import os
+import threading
+import time
+import weakref
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where only threads are kept apart
+    fcntl = None
+
+
+def file_stamp(path):
+    ''' inode, modification time and size of a file, or None if it does not exist '''
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class _LockState():
+    ''' the open lock file and nesting depth shared by the FileLocks of one path '''
+
+    def __init__(self):
+        self.file = None
+        self.depth = 0
+        # flock only tells processes apart, the threads of one process take turns here
+        self.thread_lock = threading.RLock()
+
+
+class FileLock():
+    ''' advisory lock shared by every process using the same data files, taken with
+        fcntl.flock on a separate .lock file because the data files are replaced on save.
+        the lock file's modification time doubles as a generation counter of the data '''
+
+    # the FileLocks of one path share their state: flocks taken through two files
+    # of the same process exclude each other, so a thread would wait on itself
+    states = weakref.WeakValueDictionary()  # real path -> _LockState
+    states_lock = threading.Lock()
+
+    def __init__(self, path):
+        ''' construct a lock, held already if another FileLock of the path is held;
+            the lock file is opened on acquire '''
+        self.path = path
+        key = os.path.realpath(path)
+        with FileLock.states_lock:
+            state = FileLock.states.get(key)
+            if state is None:
+                state = FileLock.states[key] = _LockState()
+        self.state = state
+
+    def acquire(self, exclusive = True):
+        ''' block until the lock is held; a thread already holding it just nests '''
+        state = self.state
+        state.thread_lock.acquire()
+        if state.depth == 0:
+            try:
+                try:
+                    file = open(self.path, 'a')
+                except FileNotFoundError:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    file = open(self.path, 'a')
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                    except BaseException:
+                        file.close()
+                        raise
+            except BaseException:
+                state.thread_lock.release()
+                raise
+            state.file = file
+        state.depth += 1
+
+    def release(self):
+        ''' release one acquire, unlocking the file after the outermost one '''
+        state = self.state
+        state.depth -= 1
+        if state.depth == 0:
+            state.file.close()  # closing the file releases the flock
+            state.file = None
+        state.thread_lock.release()
+
+    @contextmanager
+    def shared(self):
+        ''' hold the lock for reading, alongside other reading processes '''
+        self.acquire(exclusive=False)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def exclusive(self):
+        ''' hold the lock for writing, excluding every other process '''
+        self.acquire(exclusive=True)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def generation(self):
+        ''' the generation of the data files, advanced by every write '''
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def advance(self, *paths):
+        ''' record a write made under the exclusive lock. the lock file, and the data
+            files just written, get a modification time later than any before it, so
+            the generation and their stamps change even within the timestamp resolution '''
+        generation = max(time.time_ns(), (self.generation() or 0) + 1)
+        for path in (self.path,) + paths:
+            os.utime(path, ns=(generation, generation))
+        return generation
@@ -1,118 +1,611 @@
 from clinic.dao.note_dao import NoteDAO
+from clinic.dao.columnar_notes import ColumnarNotes
+from clinic.dao.trigram_index import TrigramIndex
+from clinic.dao.timestamp_index import TimestampIndex, normalize_timestamp
+from clinic.dao.code_index import CodeIndex
+from clinic.dao.file_lock import FileLock, file_stamp
+from clinic.metrics import measured
 from clinic.note import Note
 from datetime import datetime
+from contextlib import contextmanager, nullcontext
 
+import copy
 import os
 import pickle
+import threading
 
 class NoteDAOPickle(NoteDAO):
-	def __init__(self, phn, autosave = False):
+	# checkpoints are written one at a time so a reader never sees a checkpoint
+	# replaced underneath it while it is still replaying the rotated log
+	checkpoint_lock = threading.Lock()
+
+	def __init__(self, phn, autosave = False, journal = False, checkpoint_interval = 100, data_directory = None, flusher = None, metrics = None,
+			columnar = False, compressor = None):
 		self.phn = phn 
 		self.autosave = autosave
+		# In journal mode each change is appended to <phn>.log and <phn>.dat
+		# becomes a periodic checkpoint written in the background
+		self.journal = journal
+		self.checkpoint_interval = checkpoint_interval
+		self.log_size = 0
+		self.compaction_thread = None
 
 		# Fix the data directory to be inside the clinic directory, using the PHN
 		# This line constructs the path to a folder named records
-		self.data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'records')
+		if data_directory is None:
+			data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'records')
+		self.data_directory = data_directory
+		self.notes_file_path = os.path.join(self.data_directory, f"{self.phn}.dat")
+		self.log_file_path = os.path.join(self.data_directory, f"{self.phn}.log")
+		self.old_log_file_path = self.log_file_path + '.old'
 		self.counter = 1
+		# each patient's notes are kept as code -> note, in insertion order,
+		# so code based operations do not have to walk the notes
 		self.notes: dict = {}
+		# columnar notes keep the codes, timestamps and texts in arrays instead of
+		# one Note object each, for patients with very many notes
+		self.columnar = columnar
+		# with a TextCompressor the long texts are kept compressed, in memory and in the files,
+		# and only decompressed when a note's text is read
+		self.compressor = compressor
+		# full text index over the note texts, built on the first search
+		self._text_index = None
+		# the note codes in time order, built on the first time range query
+		self._time_index = None
+		# the note codes in order, built on the first page of notes
+		self._code_index = None
+		# the clinic-wide timestamp index the patient DAO keeps, told about every change,
+		# and the lock file whose generation advances with any patient's notes write
+		self.clinic_index = None
+		self.clinic_lock = FileLock(os.path.join(self.data_directory, 'notes.lock')) if self.autosave else None
+		# while a transaction is open, changes are collected here instead of written
+		self.pending_records = None
+		self.rollback_state = None
+		# in write-behind mode changes wait here until the flusher writes them together
+		self.flusher = flusher
+		self.unflushed_records = []
+		# timings of the persistence calls, bytes written and the number of notes
+		self.metrics = metrics
+		# other processes may share the patient's files: writes hold the lock and advance
+		# its generation, and reads reload the notes first when the generation moved on
+		self.file_lock = FileLock(os.path.join(self.data_directory, f"{self.phn}.lock")) if self.autosave else None
+		self.generation = None
+		self.notes_stamp = None
+		self.log_position = None  # (inode, length) of the log applied so far
+		self.rotated_log_stamp = None  # the log rotated for a checkpoint not written yet
 		self.initialize()
 	
 	def initialize(self):
-		self.load_data()
+		if self.file_lock is None:
+			self.load_data()
+		else:
+			self.reload()
+
+	def reload(self):
+		''' Load the notes again from the patient's files, under the shared file lock '''
+		with self.file_lock.shared():
+			loaded = copy.copy(self)
+			loaded.notes = {}
+			loaded.counter = 1
+			loaded.load_data()
+			self._adopt_loaded(loaded)
+
+	def _adopt_loaded(self, loaded):
+		''' take the notes loaded on a copy of this DAO; readers may be using the
+			notes meanwhile, so they are swapped in instead of changed in place '''
+		self.notes = loaded.notes
+		self.counter = loaded.counter
+		self.log_size = loaded.log_size
+		self._text_index = None
+		self._time_index = None
+		self._code_index = None
+		self._notes_replaced()
+		self._remember_files()
+
+	def _notes_replaced(self):
+		''' have the clinic-wide index read the notes again, they were replaced as a whole '''
+		if self.clinic_index is not None:
+			self.clinic_index.invalidate(self.phn)
+
+	def _advance_clinic_generation(self):
+		''' tell the processes sharing the records directory that notes were written '''
+		before = self.clinic_lock.generation()
+		if before is None:
+			open(self.clinic_lock.path, 'a').close()
+		after = self.clinic_lock.advance()
+		if self.clinic_index is not None:
+			self.clinic_index.wrote(before, after)
+
+	def new_notes(self, notes = ()):
+		''' a code -> note mapping holding the given notes '''
+		if self.columnar:
+			return ColumnarNotes(notes)
+		return {note.code: note for note in notes}
+
+	def compress_text(self, text):
+		''' a note text as it is kept, compressed if there is a compressor '''
+		return text if self.compressor is None else self.compressor.compress(text)
+
+	def patient_notes(self):
+		''' the patient's code -> note mapping, created if there is none yet '''
+		if self.phn not in self.notes:
+			self.notes[self.phn] = self.new_notes()
+		return self.notes[self.phn]
+
+	def _log_position(self):
+		''' inode and length of the log file, or None if there is no log '''
+		stamp = file_stamp(self.log_file_path) if self.journal else None
+		return stamp and (stamp[0], stamp[2])
+
+	def _remember_files(self):
+		''' note the state of the files that the notes in memory now match '''
+		self.generation = self.file_lock.generation()
+		self.notes_stamp = file_stamp(self.notes_file_path)
+		self.log_position = self._log_position()
+		self.rotated_log_stamp = file_stamp(self.old_log_file_path) if self.journal else None
+
+	def _record_write(self, *paths):
+		''' advance the generation after writing under the exclusive lock '''
+		self.file_lock.advance(*paths)
+		self._remember_files()
+
+	def refresh(self):
+		''' Reload the notes if another process changed the patient's files since this
+			DAO last read or wrote them, replaying only the new log records if it can '''
+		if self.file_lock is None or self.pending_records is not None or self.unflushed_records:
+			return  # the notes in memory are newer than the files until they are written
+		if self.file_lock.generation() == self.generation:
+			return
+
+		with self.file_lock.shared():
+			notes_stamp = file_stamp(self.notes_file_path)
+			log_position = self._log_position()
+			# a compaction moves the log aside before its checkpoint replaces the notes file
+			rotated_log_stamp = file_stamp(self.old_log_file_path) if self.journal else None
+			if notes_stamp == self.notes_stamp and log_position == self.log_position and rotated_log_stamp == self.rotated_log_stamp:
+				self._remember_files()
+			elif (notes_stamp == self.notes_stamp and rotated_log_stamp == self.rotated_log_stamp and log_position and self.log_position
+					and log_position[0] == self.log_position[0] and log_position[1] > self.log_position[1]):
+				# the other process only appended to the log
+				loaded = copy.copy(self)
+				loaded.notes = {self.phn: self.patient_notes().copy()}
+				loaded.log_size += loaded.replay_log(self.log_file_path, self.log_position[1])
+				self._adopt_loaded(loaded)
+			else:
+				self.reload()
 
+	@contextmanager
+	def write_locked(self):
+		''' hold the file lock while changing the notes, reloading them first if stale '''
+		if self.file_lock is None or self.pending_records is not None:
+			yield  # nothing is written, or the open transaction holds the lock already
+			return
+		with self.file_lock.exclusive():
+			self.refresh()
+			yield
+
+	@measured('load_data')
 	def load_data(self):
 		''' Load notes from patient record files if autosave is enabled '''
 		if not os.path.exists(self.data_directory):
 			os.makedirs(self.data_directory) # creates directory if doesnt exist
 
 		# Load each patient's notes from the records directory
-		notes_file_path = os.path.join(self.data_directory, f"{self.phn}.dat")
-		if os.path.exists(notes_file_path):
-			self.load_patient_notes(notes_file_path)
+		notes_file_path = self.notes_file_path
+		self._text_index = None
+		self._time_index = None
+		self._code_index = None
+		self._notes_replaced()
+		if not self.journal:
+			if os.path.exists(notes_file_path):
+				self.load_patient_notes(notes_file_path)
+			self.measure_size()
+			return
+
+		with NoteDAOPickle.checkpoint_lock:
+			if os.path.exists(notes_file_path):
+				self.load_patient_notes(notes_file_path)
+			# a rotated log only survives if its checkpoint was never finished
+			self.replay_log(self.old_log_file_path)
+		self.log_size = self.replay_log(self.log_file_path)
+		self.measure_size()
+
+	def measure_size(self):
+		''' record the number of notes in the metrics, if there are any '''
+		if self.metrics is not None:
+			self.metrics.size('notes', len(self.notes.get(self.phn, {})), key=self.phn)
+
+	def replay_log(self, log_file_path, offset = 0):
+		''' Rebuild the current notes by applying the log records, from offset on, on top of the checkpoint '''
+		if not os.path.exists(log_file_path):
+			return 0
+
+		# replaying is idempotent, so records already covered by the checkpoint are harmless
+		notes_by_code = self.patient_notes()
+		records = 0
+		valid_length = offset
+		try:
+			with open(log_file_path, 'rb') as file:
+				file.seek(offset)
+				while True:
+					try:
+						record = pickle.load(file)
+					except EOFError:
+						break
+					except Exception:
+						# a torn record left by an interrupted append
+						break
+					self.apply_record(notes_by_code, record)
+					valid_length = file.tell()
+					records += 1
+		except Exception as e:
+			raise Exception(f"Error replaying notes log for patient {self.phn}: {e}")
+
+		# drop the torn tail so the next append starts on a record boundary
+		if valid_length != os.path.getsize(log_file_path):
+			with open(log_file_path, 'r+b') as file:
+				file.truncate(valid_length)
+
+		self.counter = max(self.counter, max(notes_by_code, default=0) + 1)
+		return records
 	
+	@staticmethod
+	def apply_record(notes_by_code, record):
+		''' Apply one logged change to a patient's notes '''
+		if record[0] == 'create':
+			notes_by_code[record[1]] = Note(record[1], record[2], record[3])
+		elif record[0] == 'update' and record[1] in notes_by_code:
+			note = notes_by_code[record[1]]
+			note.text = record[2]
+			notes_by_code[record[1]] = note  # columnar notes store a copy of the text
+		elif record[0] == 'delete':
+			notes_by_code.pop(record[1], None)
+		elif record[0] == 'checkpoint':
+			notes_by_code.clear()
+			for note in record[1]:
+				notes_by_code[note['code']] = Note(note['code'], note['text'], note['timestamp'])
+
+	@measured('load_patient_notes')
 	def load_patient_notes(self, notes_file_path):
 		''' Load notes for a specific patient from their .dat file '''
 		try:
 			with open(notes_file_path, 'rb') as file:
 				patient_notes = pickle.load(file)
-				self.notes[self.phn] = [
+				notes = (
 					Note(note['code'], note['text'], note['timestamp']) if isinstance(note, dict) else note
 					for note in patient_notes
-				]
+				)
+				self.notes[self.phn] = self.new_notes(notes)
 				
 				# Set the counter to the max note code + 1
-				self.counter = max((note.code for note in self.notes[self.phn]), default=0) + 1
+				self.counter = max(self.notes[self.phn], default=0) + 1
 		except Exception as e:
 			raise Exception(f"Error loading notes for patient {self.phn}: {e}")
 
 
+	@property
+	def text_index(self):
+		''' trigram index over the patient's note texts, built on the first search '''
+		if self._text_index is None:
+			# published only once complete, concurrent searches may build it at the same time.
+			# compressed texts are not copied into it, it reads them back to confirm matches
+			text_index = TrigramIndex() if self.compressor is None else TrigramIndex(text_of=self.note_text)
+			for note in self.notes.get(self.phn, {}).values():
+				text_index.add(note.code, note.text)
+			self._text_index = text_index
+		return self._text_index
+
+	def note_text(self, code):
+		''' the text of a note, or an empty one if a concurrent reload removed it '''
+		note = self.notes.get(self.phn, {}).get(code)
+		return '' if note is None else note.text
+
+	@property
+	def time_index(self):
+		''' timestamp index over the patient's notes, built on the first time range query '''
+		if self._time_index is None:
+			self._time_index = TimestampIndex(self.notes.get(self.phn, {}).values())
+		return self._time_index
+
+	@property
+	def code_index(self):
+		''' ordered index of the patient's note codes, built on the first page of notes '''
+		if self._code_index is None:
+			self._code_index = CodeIndex(self.notes.get(self.phn, {}))
+		return self._code_index
+
 	def search_note(self, code):
 		''' search for a note by code '''
-		for note in self.notes.get(self.phn, []):
-			if note.code == code:
-				return note
-		return None
+		self.refresh()
+		return self.notes.get(self.phn, {}).get(code)
 
 	def create_note(self, note_text):
 		''' Create a new note for a patient '''
-		note_code = self.counter
-		self.counter += 1  # Increment after assigning the code to preserve the correct code
-		# have to deal with the timestamp now because it is no longer a given input, must read from string
-		note_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-		note = Note(note_code, note_text, note_timestamp)
-		
-		if self.phn not in self.notes:
-			self.notes[self.phn] = []
-		
-		self.notes[self.phn].append(note)
-		
-		if self.autosave:
-			self.autosave_note_to_file()
+		with self.write_locked():
+			note_code = self.counter
+			self.counter += 1  # Increment after assigning the code to preserve the correct code
+			# have to deal with the timestamp now because it is no longer a given input, must read from string
+			note_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+			stored_text = self.compress_text(note_text)
+			note = Note(note_code, stored_text, note_timestamp)
+			self.patient_notes()[note.code] = note
+			if self._text_index is not None:
+				self._text_index.add(note.code, note_text)
+			if self._time_index is not None:
+				self._time_index.add(note.code, note.timestamp)
+			if self._code_index is not None:
+				self._code_index.add(note.code)
+			if self.clinic_index is not None:
+				self.clinic_index.add(self.phn, note.code, note.timestamp)
+			
+			if self.autosave:
+				self.persist(('create', note.code, stored_text, note.timestamp))
 		
 		return note
+
+	def persist(self, *records):
+		''' Persist changes, either as log records or as a full rewrite '''
+		if self.pending_records is not None:
+			self.pending_records.extend(records)
+		elif self.flusher is not None:
+			self.unflushed_records.extend(records)
+			self.flusher.mark_dirty(self, len(records))
+		else:
+			self.write_records(records)
+
+	def write_records(self, records):
+		''' Write changes now, as log records or as a full rewrite '''
+		if self.journal:
+			self.append_log(records)
+		else:
+			self.autosave_note_to_file()
+		if self.file_lock is not None:
+			self._record_write(*[] if self.journal else [self.notes_file_path])
+		if self.clinic_lock is not None:
+			self._advance_clinic_generation()
+		self.measure_size()
+
+	def flush(self):
+		''' Write the changes held back in write-behind mode, with a single write '''
+		with self.file_lock.exclusive():
+			records = self.unflushed_records
+			if not records:
+				return
+			if self.file_lock.generation() != self.generation:
+				# another process wrote meanwhile, so these changes are applied on top of its own
+				loaded = copy.copy(self)
+				loaded.notes = {}
+				loaded.counter = 1
+				loaded.load_data()
+				notes_by_code = loaded.patient_notes()
+				next_code = max(loaded.counter, self.counter)
+				codes = {}  # code given here -> code the other process left free
+				rebased_records = []
+				for record in records:
+					code = codes.get(record[1], record[1])
+					if record[0] == 'create' and code in notes_by_code:
+						codes[record[1]] = code = next_code
+						next_code += 1
+						note = self.notes.get(self.phn, {}).get(record[1])
+						if note is not None:
+							note.code = code
+					record = (record[0], code) + tuple(record[2:])
+					self.apply_record(notes_by_code, record)
+					rebased_records.append(record)
+				records = rebased_records
+				loaded.counter = next_code
+				self._adopt_loaded(loaded)
+
+			self.unflushed_records = []
+			try:
+				self.write_records(records)
+			except BaseException:
+				self.unflushed_records = records + self.unflushed_records
+				raise
+
+	def append_log(self, records):
+		''' Append changes to the patient's notes log, checkpointing periodically '''
+		try:
+			with open(self.log_file_path, 'ab') as file:
+				start = file.tell()
+				for record in records:
+					pickle.dump(record, file)
+				written = file.tell() - start
+			if self.metrics is not None:
+				self.metrics.wrote('notes_log', written)
+		except Exception as e:
+			raise Exception(f"Error saving notes for patient {self.phn}: {e}")
+		self.log_size += len(records)
+		if self.log_size >= self.checkpoint_interval:
+			self.compact(background=True)
+
+	def begin(self):
+		''' Defer persistence until commit, remembering the state to roll back to.
+			other processes cannot write the notes until the transaction ends '''
+		if self.file_lock is not None:
+			self.file_lock.acquire(exclusive=True)
+			self.refresh()
+		self.pending_records = []
+		if self.columnar:
+			# copying the columns is cheaper than building every note
+			saved_notes = self.patient_notes().copy()
+		else:
+			# update_note edits notes in place, so their texts are saved along with them
+			saved_notes = [(note, note.stored_text) for note in self.notes.get(self.phn, {}).values()]
+		self.rollback_state = (saved_notes, self.counter)
+
+	def commit(self):
+		''' Write every change made since begin with a single write '''
+		records = self.pending_records
+		rollback_state = self.rollback_state
+		self.pending_records = None
+		self.rollback_state = None
+		try:
+			if records:
+				self.persist(*records)
+		except BaseException:
+			# the changes that could not be written are discarded, as by a rollback
+			self._restore(rollback_state)
+			raise
+		finally:
+			if self.file_lock is not None:
+				self.file_lock.release()
+
+	def rollback(self):
+		''' Discard every change made since begin '''
+		rollback_state = self.rollback_state
+		self.pending_records = None
+		self.rollback_state = None
+		try:
+			self._restore(rollback_state)
+		finally:
+			if self.file_lock is not None:
+				self.file_lock.release()
+
+	def _restore(self, rollback_state):
+		''' put the notes back as begin saved them '''
+		saved_notes, self.counter = rollback_state
+		if self.columnar:
+			self.notes[self.phn] = saved_notes
+		else:
+			for note, text in saved_notes:
+				note.text = text
+			self.notes[self.phn] = {note.code: note for note, text in saved_notes}
+		self._text_index = None
+		self._time_index = None
+		self._code_index = None
+		self._notes_replaced()
+
+	def compact(self, background = False):
+		''' Write a checkpoint of the current notes and discard the log records it covers '''
+		if self.compaction_thread is not None and self.compaction_thread.is_alive():
+			if background:
+				return  # the running compaction will be followed by another one later
+			self.compaction_thread.join()
+
+		with self.write_locked():
+			# the snapshot and log rotation happen here so the background thread
+			# never touches the live notes or the log being appended to
+			patient_notes_data = [note.to_dict() for note in self.notes.get(self.phn, {}).values()]
+			if not os.path.exists(self.old_log_file_path) and os.path.exists(self.log_file_path):
+				os.replace(self.log_file_path, self.old_log_file_path)
+			self.log_size = 0
+			old_log_stamp = file_stamp(self.old_log_file_path)
+			if self.file_lock is not None:
+				self._record_write()
+
+		if background:
+			self.compaction_thread = threading.Thread(target=self.write_checkpoint, args=(patient_notes_data, old_log_stamp))
+			self.compaction_thread.start()
+		else:
+			self.write_checkpoint(patient_notes_data, old_log_stamp)
+
+	def write_checkpoint(self, patient_notes_data, old_log_stamp = None):
+		''' Atomically replace the checkpoint file and drop the rotated log '''
+		temporary_file_path = self.notes_file_path + '.tmp'
+		# runs on the compaction thread, which only needs to keep other processes out
+		file_lock = self.file_lock.exclusive() if self.file_lock is not None else nullcontext()
+		with file_lock, NoteDAOPickle.checkpoint_lock:
+			# once the rotated log is gone, a checkpoint at least as recent was written by
+			# another process meanwhile, and this older snapshot must not replace it
+			if self.file_lock is not None and (old_log_stamp is None or file_stamp(self.old_log_file_path) != old_log_stamp):
+				return
+			with open(temporary_file_path, 'wb') as file:
+				pickle.dump(patient_notes_data, file)
+				written = file.tell()
+			os.replace(temporary_file_path, self.notes_file_path)
+			if self.metrics is not None:
+				self.metrics.wrote('notes', written)
+			if os.path.exists(self.old_log_file_path):
+				os.remove(self.old_log_file_path)
+			if self.file_lock is not None:
+				# the notes in memory only match the files if no other process wrote since they were last read
+				in_sync = self.file_lock.generation() == self.generation
+				self.file_lock.advance(self.notes_file_path)
+				if in_sync:
+					self._remember_files()
 	
+	@measured('autosave_note_to_file')
 	def autosave_note_to_file(self):
 		''' Save patient notes to file (autosave functionality) '''
-		notes_file_path = os.path.join(self.data_directory, f"{self.phn}.dat")
+		notes_file_path = self.notes_file_path
 		try:
 			with open(notes_file_path, 'wb') as file:
-				patient_notes_data = [note.__dict__ for note in self.notes[self.phn]]
+				patient_notes_data = [note.to_dict() for note in self.notes[self.phn].values()]
 				pickle.dump(patient_notes_data, file)
+				written = file.tell()
+			if self.metrics is not None:
+				self.metrics.wrote('notes', written)
 		except Exception as e:
 			raise Exception(f"Error saving notes for patient {self.phn}: {e}")
 
 
 	def retrieve_notes(self, search_string):
 		''' retrieve notes that contain the search string '''
-		return [
-            note for note in self.notes.get(self.phn, [])
-            if search_string.lower() in note.text.lower()
-        ]
+		self.refresh()
+		notes = self.notes.get(self.phn, {})
+		codes = self.text_index.search(search_string)
+		# a reload by a concurrent reader may have swapped the notes in between
+		return [notes[code] for code in codes if code in notes]
 		#return [note for note in self.notes.values() if search_string in note.text]
 		#this is not to 1 specific value's
 
+	def retrieve_notes_between(self, start = None, end = None):
+		''' retrieve the notes timestamped from start to end, both included and
+			optional, oldest first. an end date includes the whole day '''
+		self.refresh()
+		notes = self.notes.get(self.phn, {})
+		codes = self.time_index.between(normalize_timestamp(start), normalize_timestamp(end, end_of_day=True))
+		# a reload by a concurrent reader may have swapped the notes in between
+		return [notes[code] for code in codes if code in notes]
+
+	def notes_since(self, since):
+		''' retrieve the notes timestamped at or after since, oldest first '''
+		return self.retrieve_notes_between(since, None)
+
 	def update_note(self, code, new_text):
 		''' Update an existing note by its code '''
-		for note in self.notes.get(self.phn, []):
-			if note.code == code:
-				note.text = new_text
-				if self.autosave:
-					self.autosave_note_to_file()
-				return True
-		return False
+		with self.write_locked():
+			note = self.search_note(code)
+			if note is None:
+				return False
+			# the index is updated first, it may read the text being replaced
+			if self._text_index is not None:
+				self._text_index.update(code, new_text)
+			stored_text = self.compress_text(new_text)
+			note.text = stored_text
+			self.notes[self.phn][code] = note  # columnar notes store a copy of the text
+			if self.autosave:
+				self.persist(('update', code, stored_text))
+		return True
 
 	def delete_note(self, code):
 		''' delete a note '''
-		for note in self.notes.get(self.phn, []):
-			if note.code == code:
-				self.notes[self.phn].remove(note)
-				if self.autosave:
-					self.autosave_note_to_file()
-				return True
-		return False
-
-	def list_notes(self):
-		''' list all notes in reverse order '''
-		return list(reversed(self.notes.get(self.phn, [])))
+		with self.write_locked():
+			note = self.search_note(code)
+			if note is None:
+				return False
+			if self._text_index is not None:
+				self._text_index.remove(code)
+			del self.notes[self.phn][code]
+			if self._time_index is not None:
+				self._time_index.remove(code, note.timestamp)
+			if self._code_index is not None:
+				self._code_index.remove(code, self.notes[self.phn])
+			if self.clinic_index is not None:
+				self.clinic_index.remove(self.phn, code)
+			if self.autosave:
+				self.persist(('delete', code))
+		return True
+
+	def list_notes(self, limit = None, before_code = None):
+		''' list all notes in reverse order, or with a limit a page of them:
+			the limit newest notes with a code lower than before_code '''
+		self.refresh()
+		notes = self.notes.get(self.phn, {})
+		if limit is None and before_code is None:
+			return list(reversed(notes.values()))
+		# codes only grow, so the older notes are the ones with the lower codes
+		return [notes[code] for code in self.code_index.before(before_code, limit, notes)]
 		#return list(self.notes.values())[::-1]
 		# commented out one returns all patients notes not specific one
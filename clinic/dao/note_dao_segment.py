@@ -0,0 +1,76 @@
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.metrics import measured
+
+
+class NoteDAOSegment(NoteDAOPickle):
+	''' notes DAO keeping a patient's notes in the shared NoteSegmentStore
+		instead of a .dat file per patient '''
+
+	def __init__(self, phn, store, autosave = False, checkpoint_interval = 100, metrics = None, columnar = False, compressor = None):
+		# without a store (autosave off) the notes only live in memory
+		self.store = store
+		super().__init__(phn, autosave=autosave, checkpoint_interval=checkpoint_interval, metrics=metrics, columnar=columnar,
+			compressor=compressor)
+
+	def initialize(self):
+		# the segment files are shared by every patient, so the store's lock covers them all
+		self.file_lock = None if self.store is None else self.store.file_lock
+		# the store's generation advances with every patient's notes write
+		self.clinic_lock = self.file_lock
+		self.store_position = None
+		super().initialize()
+
+	def _remember_files(self):
+		''' note the generation and the patient's last record that the notes in memory match '''
+		self.generation = self.file_lock.generation()
+		self.store_position = self.store.position(self.phn)
+
+	def refresh(self):
+		''' Reload the notes if another process appended records for the patient
+			since this DAO last read or wrote them '''
+		if self.file_lock is None or self.pending_records is not None:
+			return
+		if self.file_lock.generation() == self.generation:
+			return
+
+		with self.file_lock.shared():
+			self.store.refresh()
+			if self.store.position(self.phn) == self.store_position:
+				self._remember_files()  # the other process appended other patients' records
+			else:
+				self.reload()
+
+	@measured('load_data')
+	def load_data(self):
+		''' Rebuild the patient's notes from their records in the segment store '''
+		self._text_index = None
+		self._time_index = None
+		self._code_index = None
+		self._notes_replaced()
+		notes_by_code = self.patient_notes()
+		if self.store is None:
+			return
+		for record in self.store.read(self.phn):
+			self.apply_record(notes_by_code, record)
+		self.counter = max(notes_by_code, default=0) + 1
+		self.measure_size()
+
+	def persist(self, *records):
+		''' Append changes to the segment store, checkpointing the notes periodically '''
+		if self.pending_records is not None:
+			self.pending_records.extend(records)
+			return
+		if self.store is None:
+			return
+		before = self.file_lock.generation()
+		written = self.store.append(self.phn, records)
+		# a checkpoint bounds how many records a later load has to replay
+		if self.store.record_count(self.phn) >= self.checkpoint_interval:
+			checkpoint = [note.to_dict() for note in self.notes[self.phn].values()]
+			written += self.store.append(self.phn, [('checkpoint', checkpoint)])
+		self._remember_files()
+		if self.clinic_index is not None:
+			self.clinic_index.wrote(before, self.generation)
+		if self.metrics is not None:
+			self.metrics.wrote('notes_segments', written)
+		self.measure_size()
@@ -0,0 +1,106 @@
+from clinic.dao.note_dao import NoteDAO
+from clinic.dao.timestamp_index import normalize_timestamp
+from clinic.exception.illegal_operation_exception import IllegalOperationException
+from clinic.note import Note
+from datetime import datetime
+import sqlite3
+
+
+class NoteDAOSQLite(NoteDAO):
+	''' DAO for one patient's notes, kept in the notes table of the clinic database '''
+
+	def __init__(self, connection, phn):
+		self.connection = connection
+		self.phn = phn
+		# like the pickle DAO, codes continue from the highest code stored so far
+		self.counter = connection.execute('SELECT COALESCE(MAX(code), 0) + 1 FROM notes WHERE phn = ?', (phn,)).fetchone()[0]
+		self.rollback_counter = None
+
+	def search_note(self, code):
+		''' search for a note by code '''
+		row = self.connection.execute('SELECT code, text, timestamp FROM notes WHERE phn = ? AND code = ?', (self.phn, code)).fetchone()
+		return Note(*row) if row else None
+
+	def create_note(self, note_text):
+		''' Create a new note for a patient '''
+		note_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+		# another session or process may have used the next code already, so the code is
+		# taken in the statement inserting the note, which holds the database's write lock
+		try:
+			cursor = self.connection.execute(
+				'INSERT INTO notes (phn, code, text, timestamp) SELECT ?, MAX(COALESCE(MAX(code), 0) + 1, ?), ?, ? FROM notes WHERE phn = ?',
+				(self.phn, self.counter, note_text, note_timestamp, self.phn))
+		except sqlite3.IntegrityError as e:
+			raise IllegalOperationException(f"Note could not be created for patient {self.phn}: {e}")
+		note_code = self.connection.execute('SELECT code FROM notes WHERE rowid = ?', (cursor.lastrowid,)).fetchone()[0]
+		self.counter = note_code + 1
+		return Note(note_code, note_text, note_timestamp)
+
+	def retrieve_notes(self, search_string):
+		''' retrieve notes that contain the search string '''
+		rows = self.connection.execute(
+			'SELECT code, text, timestamp FROM notes WHERE phn = ? AND instr(py_lower(text), ?) > 0 ORDER BY rowid',
+			(self.phn, search_string.lower()))
+		return [Note(*row) for row in rows]
+
+	def retrieve_notes_between(self, start = None, end = None):
+		''' retrieve the notes timestamped from start to end, both included and
+			optional, oldest first '''
+		conditions, parameters = time_range('timestamp', start, end)
+		rows = self.connection.execute(
+			f'SELECT code, text, timestamp FROM notes WHERE phn = ?{conditions} ORDER BY timestamp, code', (self.phn,) + parameters)
+		return [Note(*row) for row in rows]
+
+	def notes_since(self, since):
+		''' retrieve the notes timestamped at or after since, oldest first '''
+		return self.retrieve_notes_between(since, None)
+
+	def update_note(self, code, new_text):
+		''' Update an existing note by its code '''
+		cursor = self.connection.execute('UPDATE notes SET text = ? WHERE phn = ? AND code = ?', (new_text, self.phn, code))
+		return cursor.rowcount > 0
+
+	def delete_note(self, code):
+		''' delete a note '''
+		cursor = self.connection.execute('DELETE FROM notes WHERE phn = ? AND code = ?', (self.phn, code))
+		return cursor.rowcount > 0
+
+	def list_notes(self, limit = None, before_code = None):
+		''' list all notes in reverse order, or with a limit a page of them:
+			the limit newest notes with a code lower than before_code '''
+		if limit is None and before_code is None:
+			rows = self.connection.execute('SELECT code, text, timestamp FROM notes WHERE phn = ? ORDER BY rowid DESC', (self.phn,))
+		else:
+			condition, parameters = ('', (self.phn,)) if before_code is None else (' AND code < ?', (self.phn, before_code))
+			rows = self.connection.execute(f'SELECT code, text, timestamp FROM notes WHERE phn = ?{condition} ORDER BY code DESC LIMIT ?',
+				parameters + (-1 if limit is None else limit,))
+		return [Note(*row) for row in rows]
+
+	# the notes share the patient DAO's connection, so its database transaction
+	# already covers them and only the code counter has to be restored
+	def begin(self):
+		''' remember the code counter to restore on rollback '''
+		self.rollback_counter = self.counter
+
+	def commit(self):
+		''' nothing to write, the patient DAO commits the database transaction '''
+		self.rollback_counter = None
+
+	def rollback(self):
+		''' restore the code counter, the patient DAO rolls back the database transaction '''
+		self.counter = self.rollback_counter
+		self.rollback_counter = None
+
+
+def time_range(column, start, end):
+	''' the conditions, each starting with AND, and parameters selecting the rows whose
+		timestamp column is from start to end; timestamps are stored as
+		'%Y-%m-%d %H:%M:%S' text, which sorts as the times do '''
+	conditions = ''
+	parameters = ()
+	for bound, operator, end_of_day in ((start, '>=', False), (end, '<=', True)):
+		bound = normalize_timestamp(bound, end_of_day)
+		if bound is not None:
+			conditions += f' AND {column} {operator} ?'
+			parameters += (bound.isoformat(' '),)
+	return conditions, parameters
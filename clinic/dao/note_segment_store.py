@@ -0,0 +1,239 @@
+from clinic.dao.file_lock import FileLock
+
+import os
+import pickle
+import struct
+
+
+class NoteSegmentStore():
+	''' Append-only segment files holding every patient's note records,
+		with an in-memory index from PHN to the records' offsets. Processes
+		sharing the segments append and compact under an exclusive file lock,
+		and index what the others appended before reading or writing '''
+
+	# each record is framed as: key length, payload length, key, pickled payload
+	HEADER = struct.Struct('>HI')
+	# set in the key length of a record replacing the key's earlier records, which are dead
+	# then: a checkpoint, or the first of a key's records copied by a compaction
+	CHECKPOINT = 0x8000
+
+	def __init__(self, data_directory = None, segment_size = 64 * 1024 * 1024, compaction_ratio = 0.5, compaction_min_size = 1024 * 1024):
+		''' open the store, indexing the records already in its segments. the segments
+			are compacted once dead records take more than compaction_ratio of them,
+			if they hold at least compaction_min_size bytes '''
+		if data_directory is None:
+			data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'records')
+		self.data_directory = data_directory
+		self.segment_size = segment_size
+		self.compaction_ratio = compaction_ratio
+		self.compaction_min_size = compaction_min_size
+		self.index = {}  # key -> [(segment number, payload offset, payload length)]
+		self.dead = {}  # segment number -> bytes of the records replaced by a checkpoint
+		self.readers = {}  # segment number -> open file
+		self.writer = None
+		self.writer_segment = None  # segment number the writer appends to
+		self.segment_numbers = []
+		self.indexed = {}  # segment number -> length of it indexed so far
+		# every write advances the lock's generation, so an unchanged one means
+		# no other process appended or compacted since the segments were indexed
+		self.file_lock = FileLock(os.path.join(self.data_directory, 'notes-segments.lock'))
+		self.generation = None
+
+		if not os.path.exists(self.data_directory):
+			os.makedirs(self.data_directory)
+		with self.file_lock.exclusive():
+			self._index_segments(truncate=True)
+
+	def segment_path(self, segment_number):
+		''' path of a segment file '''
+		return os.path.join(self.data_directory, f"notes-{segment_number:06d}.seg")
+
+	@staticmethod
+	def key(phn):
+		''' the bytes a patient's records are filed under '''
+		return str(phn).encode('utf-8')
+
+	def refresh(self):
+		''' index the records other processes appended since the segments were
+			last indexed, or every record again if they compacted the segments '''
+		if self.file_lock.generation() == self.generation:
+			return
+		with self.file_lock.shared():
+			self._index_segments()
+
+	def _index_segments(self, truncate = False):
+		''' index what was appended to the segments since they were last indexed,
+			with the file lock held. with truncate, which needs the exclusive lock,
+			torn records left by interrupted appends are dropped '''
+		self.generation = self.file_lock.generation()
+		segment_numbers = sorted(int(filename[6:-4]) for filename in os.listdir(self.data_directory)
+			if filename.startswith('notes-') and filename.endswith('.seg'))
+		if any(segment_number not in segment_numbers for segment_number in self.indexed):
+			# another process compacted the segments, so every record moved
+			self.close()
+			self.index = {}
+			self.indexed = {}
+			self.dead = {}
+		self.segment_numbers = segment_numbers
+		for segment_number in segment_numbers:
+			self._index_segment(segment_number, truncate)
+
+	def _index_segment(self, segment_number, truncate = False):
+		''' add the records appended to one segment since it was last indexed to the index '''
+		path = self.segment_path(segment_number)
+		start = self.indexed.get(segment_number, 0)
+		with open(path, 'rb') as file:
+			file.seek(start)
+			data = file.read()
+
+		offset = 0
+		while offset + self.HEADER.size <= len(data):
+			key_length, payload_length = self.HEADER.unpack_from(data, offset)
+			checkpoint = key_length & self.CHECKPOINT
+			key_length &= ~self.CHECKPOINT
+			payload_offset = offset + self.HEADER.size + key_length
+			if payload_offset + payload_length > len(data):
+				break
+			key = data[offset + self.HEADER.size:payload_offset]
+			if checkpoint:
+				self._drop(key)
+			self.index.setdefault(key, []).append((segment_number, start + payload_offset, payload_length))
+			offset = payload_offset + payload_length
+		self.indexed[segment_number] = start + offset
+
+		# drop a torn record left by an interrupted append
+		if truncate and offset != len(data):
+			with open(path, 'r+b') as file:
+				file.truncate(start + offset)
+
+	def _drop(self, key):
+		''' count a key's records as dead, a checkpoint replaced them '''
+		for segment_number, offset, length in self.index.get(key, []):
+			self.dead[segment_number] = self.dead.get(segment_number, 0) + self.HEADER.size + len(key) + length
+		self.index[key] = []
+
+	def _frame(self, key, payload, checkpoint = False):
+		''' one framed record, ready to be appended '''
+		return self.HEADER.pack(len(key) | (self.CHECKPOINT if checkpoint else 0), len(payload)) + key + payload
+
+	def _write(self, key, payloads, checkpoints = None):
+		''' append framed payloads, flagged as checkpoints by checkpoints, to the
+			last segment, with the exclusive lock held, and return their locations '''
+		if self.file_lock.generation() != self.generation:
+			self._index_segments(truncate=True)
+		offset = self._writer_offset()
+		if offset != self.indexed.get(self.writer_segment, 0):
+			# a process died while appending and left a torn record
+			self._index_segments(truncate=True)
+			offset = self._writer_offset()
+		segment_number = self.writer_segment
+		locations = []
+		frames = []
+		for position, payload in enumerate(payloads):
+			frame = self._frame(key, payload, checkpoints is not None and checkpoints[position])
+			locations.append((segment_number, offset + self.HEADER.size + len(key), len(payload)))
+			frames.append(frame)
+			offset += len(frame)
+		self.writer.write(b''.join(frames))
+		self.writer.flush()
+		self.indexed[segment_number] = offset
+		return locations
+
+	def _writer_offset(self):
+		''' the end of the last segment, where the next records go. the writer continues
+			in the last segment, which another process may have started, or starts a new
+			one once it is full. the end is the file's, as other processes append too '''
+		if self.writer is not None and self.writer_segment == self.segment_numbers[-1]:
+			offset = self.writer.seek(0, os.SEEK_END)
+			if offset < self.segment_size:
+				return offset
+		if self.writer is not None:
+			self.writer.close()
+		if not self.segment_numbers or os.path.getsize(self.segment_path(self.segment_numbers[-1])) >= self.segment_size:
+			self.segment_numbers.append(self.segment_numbers[-1] + 1 if self.segment_numbers else 1)
+		self.writer_segment = self.segment_numbers[-1]
+		self.writer = open(self.segment_path(self.writer_segment), 'ab')
+		return self.writer.seek(0, os.SEEK_END)
+
+	def append(self, phn, records):
+		''' append change records for a patient; a checkpoint record replaces the ones before it.
+			returns the number of bytes written '''
+		key = self.key(phn)
+		payloads = [pickle.dumps(record) for record in records]
+		checkpoints = [record[0] == 'checkpoint' for record in records]
+		with self.file_lock.exclusive():
+			locations = self._write(key, payloads, checkpoints)
+			for checkpoint, location in zip(checkpoints, locations):
+				if checkpoint:
+					self._drop(key)
+				self.index.setdefault(key, []).append(location)
+			# only a checkpoint makes records dead
+			if any(checkpoints) and self._wasteful():
+				self.compact()
+			self.generation = self.file_lock.advance()
+		return sum(self.HEADER.size + len(key) + len(payload) for payload in payloads)
+
+	def read(self, phn):
+		''' the change records of a patient, oldest first '''
+		with self.file_lock.shared():
+			self.refresh()
+			return [pickle.loads(self._read_payload(location)) for location in self.index.get(self.key(phn), [])]
+
+	def record_count(self, phn):
+		''' how many records a patient's notes are rebuilt from '''
+		return len(self.index.get(self.key(phn), []))
+
+	def position(self, phn):
+		''' location of a patient's last record, which moves whenever records are
+			appended for the patient, or None if there are none '''
+		locations = self.index.get(self.key(phn))
+		return locations[-1] if locations else None
+
+	def _wasteful(self):
+		''' whether dead records take enough of the segments for a compaction to pay off '''
+		size = sum(self.indexed.values())
+		return size >= self.compaction_min_size and sum(self.dead.values()) > size * self.compaction_ratio
+
+	def compact(self):
+		''' rewrite the live records into fresh segments and delete the old ones '''
+		with self.file_lock.exclusive():
+			self._index_segments(truncate=True)
+			live = {key: [self._read_payload(location) for location in locations] for key, locations in self.index.items()}
+			old_segment_numbers = list(self.segment_numbers)
+			self.close()
+			self.segment_numbers.append(old_segment_numbers[-1] + 1 if old_segment_numbers else 1)
+			self.writer_segment = self.segment_numbers[-1]
+			self.writer = open(self.segment_path(self.writer_segment), 'ab')
+
+			# the old segments stay until every live record has been copied. the copies
+			# replace the records they were copied from, so if the copy is interrupted
+			# the records copied are not replayed twice
+			self.index = {}
+			for key, payloads in live.items():
+				if payloads:
+					self.index[key] = self._write(key, payloads, [True] + [False] * (len(payloads) - 1))
+			self.close()
+			for segment_number in old_segment_numbers:
+				os.remove(self.segment_path(segment_number))
+				self.segment_numbers.remove(segment_number)
+				self.indexed.pop(segment_number, None)
+				self.dead.pop(segment_number, None)
+			self.generation = self.file_lock.advance()
+
+	def _read_payload(self, location):
+		''' read one record's payload, keeping the segment open for the next read '''
+		segment_number, offset, length = location
+		reader = self.readers.get(segment_number)
+		if reader is None:
+			reader = self.readers[segment_number] = open(self.segment_path(segment_number), 'rb')
+		reader.seek(offset)
+		return reader.read(length)
+
+	def close(self):
+		''' close every open segment file '''
+		if self.writer is not None:
+			self.writer.close()
+			self.writer = None
+		for reader in self.readers.values():
+			reader.close()
+		self.readers = {}
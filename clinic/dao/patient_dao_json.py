@@ -3,102 +3,498 @@ from clinic.exception.illegal_operation_exception import IllegalOperationExcepti
 
 from clinic.dao.patient_encoder import PatientEncoder
 from clinic.dao.patient_decoder import PatientDecoder
+from clinic.dao.trigram_index import TrigramIndex
+from clinic.dao.patient_query_index import PatientQueryIndex
+from clinic.dao.timestamp_index import ClinicTimestampIndex, normalize_timestamp
+from clinic.dao.file_lock import FileLock, file_stamp
+from clinic.metrics import measured
+from contextlib import contextmanager
+import copy
 import os
 import json
+import threading
 
 
 class PatientDAOJSON():
     ''' DAO for handling patient data in JSON format '''
 
-    def __init__(self, autosave = False):
+    def __init__(self, autosave = False, journal = False, compaction_threshold = 1000, data_directory = None, streaming = False, notes_dao_factory = None, flusher = None, metrics = None, intern_strings = False):
         ''' initialize an empty patient dictionary '''
         self.patients = {}
         self.autosave = autosave
+        # builds each patient's notes DAO, the records default to pickle files
+        self.notes_dao_factory = notes_dao_factory
+        # Streaming parses patients.json incrementally, so peak memory while
+        # loading stays close to the final Patient objects
+        self.streaming = streaming
+        # share one string between the patients with the same name or birth date
+        self.intern_strings = intern_strings
+        self._name_index = None
+        # birth date, phone and email domain indexes, built on the first query
+        self._query_index = None
+        # every patient's notes by timestamp, built on the first clinic-wide time range query
+        self._notes_index = None
+        self.notes_index_lock = threading.Lock()
+        # In journal mode every mutation is appended to a small log beside the
+        # snapshot instead of rewriting the whole patients file
+        self.journal = journal
+        self.compaction_threshold = compaction_threshold
+        self.journal_size = 0
+        # while a transaction is open, mutations are collected here instead of written
+        self.pending_entries = None
+        self.rollback_patients = None
+        # in write-behind mode mutations wait here until the flusher writes them together
+        self.flusher = flusher
+        self.unflushed_entries = []
+        # timings of the persistence calls, bytes written and the number of patients
+        self.metrics = metrics
+
+        if data_directory is None:
+            data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        self.patients_file_path = os.path.abspath(os.path.join(data_directory, 'patients.json'))
+        self.journal_file_path = os.path.abspath(os.path.join(data_directory, 'patients.journal'))
+        # other processes may share the files: writes hold the lock and advance its
+        # generation, and reads reload the patients first when the generation moved on
+        self.file_lock = FileLock(os.path.abspath(os.path.join(data_directory, 'patients.lock')))
+        self.generation = None
+        self.snapshot_stamp = None
+        self.journal_position = None  # (inode, length) of the journal applied so far
+
         if self.autosave:
-            self.load_data()
+            self.reload()
+
+    def reload(self):
+        ''' Load the patients again from the files, under the shared file lock '''
+        with self.file_lock.shared():
+            loaded = copy.copy(self)
+            loaded.patients = {}
+            loaded.load_data()
+            self._adopt_loaded(loaded)
+
+    def _adopt_loaded(self, loaded):
+        ''' take the patients loaded on a copy of this DAO; readers may be using the
+            patients meanwhile, so they are swapped in instead of changed in place '''
+        self.patients = loaded.patients
+        self.journal_size = loaded.journal_size
+        self._name_index = None
+        self._query_index = None
+        self._notes_index = None
+        self._remember_files()
+
+    def _journal_position(self):
+        ''' inode and length of the journal file, or None if there is no journal '''
+        stamp = file_stamp(self.journal_file_path) if self.journal else None
+        return stamp and (stamp[0], stamp[2])
+
+    def _remember_files(self):
+        ''' note the state of the files that the patients in memory now match '''
+        self.generation = self.file_lock.generation()
+        self.snapshot_stamp = file_stamp(self.patients_file_path)
+        self.journal_position = self._journal_position()
+
+    def _record_write(self, *paths):
+        ''' advance the generation after writing under the exclusive lock '''
+        self.file_lock.advance(*paths)
+        self._remember_files()
+
+    def refresh(self):
+        ''' Reload the patients if another process changed the files since this DAO
+            last read or wrote them, replaying only the new journal records if it can '''
+        if not self.autosave or self.pending_entries is not None or self.unflushed_entries:
+            return  # the patients in memory are newer than the files until they are written
+        if self.file_lock.generation() == self.generation:
+            return
+
+        with self.file_lock.shared():
+            snapshot_stamp = file_stamp(self.patients_file_path)
+            journal_position = self._journal_position()
+            if snapshot_stamp == self.snapshot_stamp and journal_position == self.journal_position:
+                self._remember_files()
+            elif (snapshot_stamp == self.snapshot_stamp and journal_position and self.journal_position
+                    and journal_position[0] == self.journal_position[0] and journal_position[1] > self.journal_position[1]):
+                # the other process only appended to the journal
+                loaded = copy.copy(self)
+                loaded.patients = self.patients.copy()
+                loaded._replay_journal(self.journal_position[1])
+                self._adopt_loaded(loaded)
+            else:
+                self.reload()
+
+    @contextmanager
+    def _write_locked(self):
+        ''' hold the file lock while changing the patients, reloading them first if stale '''
+        if not self.autosave or self.pending_entries is not None:
+            yield  # nothing is written, or the open transaction holds the lock already
+            return
+        with self.file_lock.exclusive():
+            self.refresh()
+            yield
+
+    @measured('load_data')
     def load_data(self):
         ''' Load patient data from a JSON file '''
-        root_dir = os.path.dirname(os.path.abspath(__file__))
-        patients_file_path = os.path.join(root_dir, '..', 'patients.json')
-        patients_file_path = os.path.abspath(patients_file_path)
+        patients_file_path = self.patients_file_path
 
         if not os.path.exists(patients_file_path):
-            with open(patients_file_path, 'w') as file:
+            # other processes holding the shared lock may be reading the file as it
+            # appears, so it appears whole; each one writes its own temporary file
+            temporary_file_path = f"{patients_file_path}.{os.getpid()}.tmp"
+            with open(temporary_file_path, 'w') as file:
                 json.dump([], file)
+            os.replace(temporary_file_path, patients_file_path)
+        else:
+            try:
+                with open(patients_file_path, 'r') as file:
+                    # Pass autosave to PatientDecoder
+                    patient_decoder = PatientDecoder(autosave=self.autosave, journal=self.journal, notes_dao_factory=self.notes_dao_factory,
+                        intern_strings=self.intern_strings)
+                    if self.streaming:
+                        patients = patient_decoder.iter_decode(file)
+                    else:
+                        # Read content as a list of dictionaries, then build each patient from its dictionary
+                        patients = (patient_decoder.decode_dict(patient_data) for patient_data in json.load(file))
+                    for patient in patients:
+                        self.patients[patient.phn] = patient
+            except FileNotFoundError:
+                raise Exception(f"Patient data file '{patients_file_path}' not found.")
+            except json.JSONDecodeError:
+                raise Exception(f"Error decoding JSON from '{patients_file_path}'.")
+            except Exception as e:
+                raise Exception(f"Error loading patient data: {e}")
+
+        if self.journal:
+            self._replay_journal()
+        # the indexes are rebuilt from the loaded patients on the next search
+        self._name_index = None
+        self._query_index = None
+        self._notes_index = None
+        if self.metrics is not None:
+            self.metrics.size('patients', len(self.patients))
+
+    def _replay_journal(self, offset = 0):
+        ''' Apply the mutations recorded in the journal, from offset on, on top of the loaded patients '''
+        if offset == 0:
+            self.journal_size = 0
+        if not os.path.exists(self.journal_file_path):
             return
 
+        patient_decoder = PatientDecoder(autosave=self.autosave, journal=self.journal, notes_dao_factory=self.notes_dao_factory,
+            intern_strings=self.intern_strings)
+        valid_length = offset
         try:
-            with open(patients_file_path, 'r') as file:
-                # Read content as a list of dictionaries, then manually decode each patient
-                patients_data = json.load(file)
-                # Pass autosave to PatientDecoder
-                patient_decoder = PatientDecoder(autosave=self.autosave)
-                for patient_data in patients_data:
-                    patient = patient_decoder.decode(json.dumps(patient_data))
-                    self.patients[patient.phn] = patient
-        except FileNotFoundError:
-            raise Exception(f"Patient data file '{patients_file_path}' not found.")
-        except json.JSONDecodeError:
-            raise Exception(f"Error decoding JSON from '{patients_file_path}'.")
+            with open(self.journal_file_path, 'rb') as file:
+                file.seek(offset)
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a torn record left by an interrupted append, nothing after it was written
+                        break
+                    # replaying is idempotent, so a journal that survived a compaction is harmless
+                    if entry['op'] == 'delete':
+                        self.patients.pop(entry['phn'], None)
+                    else:
+                        patient = patient_decoder.decode_dict(entry['patient'])
+                        if entry['op'] == 'update':
+                            self.patients.pop(entry['phn'], None)
+                        self.patients[patient.phn] = patient
+                    valid_length += len(line)
+                    self.journal_size += 1
         except Exception as e:
-            raise Exception(f"Error loading patient data: {e}")
-    
+            raise Exception(f"Error replaying patient journal: {e}")
+
+        # drop the torn tail so the next append starts on a clean line
+        if valid_length != os.path.getsize(self.journal_file_path):
+            with open(self.journal_file_path, 'r+b') as file:
+                file.truncate(valid_length)
+
+    @measured('save_data')
     def save_data(self):
         ''' Save patient data to a JSON file '''
-        root_dir = os.path.dirname(os.path.abspath(__file__))
-        # Explicitly set the path to the 'clinic' directory
-        patients_file_path = os.path.join(root_dir, '..', 'patients.json')  # This points to the clinic directory
-
-        # Ensure the path points to the right location
-        patients_file_path = os.path.abspath(patients_file_path)
+        patients_file_path = self.patients_file_path
+        # Write to a temporary file first so a crash never leaves a half written snapshot
+        temporary_file_path = patients_file_path + '.tmp'
 
         try:
-            with open(patients_file_path, 'w') as file:
-                # Manually serialize Patient objects including PatientRecord
-                serializable_patients = []
-                for patient in self.patients.values():
-                    patient_data = patient.__dict__.copy()  # Create a dictionary of Patient attributes
-                    # Manually serialize PatientRecord 
-                    if hasattr(patient.record, 'to_dict'):
-                        patient_data['record'] = patient.record.to_dict()
-                    serializable_patients.append(patient_data)
+            with open(temporary_file_path, 'w') as file:
+                # Serialize each Patient, including its PatientRecord, as a dictionary
+                serializable_patients = [patient.to_dict() for patient in self.patients.values()]
                 # Write the serialized data to the file
                 json.dump(serializable_patients, file, cls=PatientEncoder) #like in lab 9
+                written = file.tell()
+            os.replace(temporary_file_path, patients_file_path)
+            if self.metrics is not None:
+                self.metrics.wrote('patients', written)
         except Exception as e:
             raise Exception(f"Error saving patient data: {e}")
 
+    def compact(self):
+        ''' Fold the journal into a fresh snapshot and start an empty journal '''
+        with self.file_lock.exclusive():
+            self.save_data()
+            if os.path.exists(self.journal_file_path):
+                os.remove(self.journal_file_path)
+            self.journal_size = 0
+            self._record_write(self.patients_file_path)
+
+    def _append_journal(self, entries):
+        ''' Append mutation records to the journal, compacting when it grows too large '''
+        try:
+            with open(self.journal_file_path, 'a') as file:
+                start = file.tell()
+                file.writelines(json.dumps(entry, cls=PatientEncoder) + '\n' for entry in entries)
+                written = file.tell() - start
+            if self.metrics is not None:
+                self.metrics.wrote('patients_journal', written)
+        except Exception as e:
+            raise Exception(f"Error writing patient journal: {e}")
+        self.journal_size += len(entries)
+        if self.journal_size >= self.compaction_threshold:
+            self.compact()
+
+    def _persist(self, *entries):
+        ''' Persist mutations, either as journal records or as a full snapshot '''
+        if self.pending_entries is not None:
+            self.pending_entries.extend(entries)
+        elif self.flusher is not None:
+            self.unflushed_entries.extend(entries)
+            self.flusher.mark_dirty(self, len(entries))
+        else:
+            self._write(entries)
+
+    def _write(self, entries):
+        ''' Write mutations now, appending them to the journal or saving a full snapshot '''
+        if self.journal:
+            self._append_journal(entries)
+            self._record_write()
+        else:
+            self.save_data()
+            self._record_write(self.patients_file_path)
+        if self.metrics is not None:
+            self.metrics.size('patients', len(self.patients))
+
+    def flush(self):
+        ''' Write the mutations held back in write-behind mode, with a single write '''
+        with self.file_lock.exclusive():
+            entries = self.unflushed_entries
+            if not entries:
+                return
+            if self.file_lock.generation() != self.generation:
+                # another process wrote meanwhile, so these mutations are applied on top of its changes
+                loaded = copy.copy(self)
+                loaded.patients = {}
+                loaded.load_data()
+                for entry in entries:
+                    if entry['op'] != 'create':
+                        loaded.patients.pop(entry['phn'], None)
+                    if entry['op'] != 'delete':
+                        loaded.patients[entry['patient'].phn] = entry['patient']
+                self._adopt_loaded(loaded)
+
+            self.unflushed_entries = []
+            try:
+                self._write(entries)
+            except BaseException:
+                self.unflushed_entries = entries + self.unflushed_entries
+                raise
+
+    def begin(self):
+        ''' Defer persistence until commit, remembering the state to roll back to.
+            other processes cannot write the patients until the transaction ends '''
+        if self.autosave:
+            self.file_lock.acquire(exclusive=True)
+            self.refresh()
+        self.pending_entries = []
+        self.rollback_patients = self.patients.copy()
+
+    def commit(self):
+        ''' Write every mutation made since begin with a single write '''
+        entries = self.pending_entries
+        rollback_patients = self.rollback_patients
+        self.pending_entries = None
+        self.rollback_patients = None
+        try:
+            if entries:
+                self._persist(*entries)
+        except BaseException:
+            # the mutations that could not be written are discarded, as by a rollback
+            self._restore(rollback_patients)
+            raise
+        finally:
+            if self.autosave:
+                self.file_lock.release()
+
+    def rollback(self):
+        ''' Discard every mutation made since begin '''
+        rollback_patients = self.rollback_patients
+        self.pending_entries = None
+        self.rollback_patients = None
+        self._restore(rollback_patients)
+        if self.autosave:
+            self.file_lock.release()
+
+    def _restore(self, rollback_patients):
+        ''' put the patients back as begin saved them '''
+        self.patients = rollback_patients
+        self._name_index = None
+        self._query_index = None
+        self._notes_index = None
+
+    @property
+    def name_index(self):
+        ''' trigram index over patient names, built on the first search '''
+        if self._name_index is None:
+            # published only once complete, concurrent searches may build it at the same time
+            name_index = TrigramIndex()
+            for patient in self.patients.values():
+                name_index.add(patient.phn, patient.name)
+            self._name_index = name_index
+        return self._name_index
+
+    @property
+    def query_index(self):
+        ''' birth date, phone and email domain indexes, built on the first query '''
+        if self._query_index is None:
+            # published only once complete, like the name index
+            self._query_index = PatientQueryIndex(self.patients.values())
+        return self._query_index
+
+    @property
+    def notes_index(self):
+        ''' every patient's notes by timestamp, built on the first clinic-wide time range
+            query and brought up to date before each one. the notes DAOs report their
+            changes to it, and it is built again once another process wrote notes '''
+        with self.notes_index_lock:
+            notes_index = self._notes_index
+            if notes_index is not None and notes_index.notes_lock is not None and notes_index.notes_lock.generation() != notes_index.generation:
+                notes_index = None
+            if notes_index is None:
+                notes_index = ClinicTimestampIndex()
+                stale = list(self.patients)
+            else:
+                stale = notes_index.take_stale()
+
+            patients = self.patients
+            for phn in stale:
+                patient = patients.get(phn)
+                if patient is None:
+                    notes_index.replace(phn, [])
+                    continue
+                patient.record.notes_index = notes_index
+                # the notes not loaded yet are read without keeping them in memory
+                notes_dao = patient.record.notes_reader()
+                if notes_index.notes_lock is None and notes_dao.clinic_lock is not None:
+                    # the generation the notes read from now on are at least as recent as
+                    notes_index.notes_lock = notes_dao.clinic_lock
+                    notes_index.generation = notes_dao.clinic_lock.generation()
+                notes_index.replace(phn, notes_dao.retrieve_notes_between())
+            self._notes_index = notes_index
+            return notes_index
+
+    def _adopt(self, patient):
+        ''' make a new patient keep their notes where this DAO's patients do '''
+        if self.notes_dao_factory is not None:
+            patient.record.notes_dao_factory = self.notes_dao_factory
+        if self._notes_index is not None:
+            # notes left in the records by an earlier patient with the PHN are read on the next query
+            patient.record.notes_index = self._notes_index
+            self._notes_index.invalidate(patient.phn)
+
     def search_patient(self, phn):
         ''' search for a patient by PHN '''
+        self.refresh()
         return self.patients.get(phn, None)
 
     def create_patient(self, patient):
         ''' create a new patient '''
-        if patient.phn in self.patients:
-            raise IllegalOperationException("Patient with this PHN already exists.")
-        self.patients[patient.phn] = patient
-        if self.autosave:
-            self.save_data()  # Save after creating a patient
+        with self._write_locked():
+            if patient.phn in self.patients:
+                raise IllegalOperationException("Patient with this PHN already exists.")
+            self._adopt(patient)
+            self.patients[patient.phn] = patient
+            if self._name_index is not None:
+                self._name_index.add(patient.phn, patient.name)
+            if self._query_index is not None:
+                self._query_index.add(patient)
+            if self.autosave:
+                self._persist({'op': 'create', 'patient': patient})  # Save after creating a patient
         return patient
 
 
+    def create_patients(self, patients):
+        ''' create many new patients at once, persisting them with a single write '''
+        patients = list(patients)
+        with self._write_locked():
+            # check the whole batch first so a duplicate leaves the store untouched
+            batch_phns = set()
+            for patient in patients:
+                if patient.phn in self.patients or patient.phn in batch_phns:
+                    raise IllegalOperationException(f"Patient with PHN {patient.phn} already exists.")
+                batch_phns.add(patient.phn)
+
+            for patient in patients:
+                self._adopt(patient)
+                self.patients[patient.phn] = patient
+                if self._name_index is not None:
+                    self._name_index.add(patient.phn, patient.name)
+                if self._query_index is not None:
+                    self._query_index.add(patient)
+            if self.autosave and patients:
+                self._persist(*[{'op': 'create', 'patient': patient} for patient in patients])  # Save once for the whole batch
+        return patients
+
     def retrieve_patients(self, name):
         ''' retrieve patients whose name matches the search string '''
-        return [patient for patient in self.patients.values() if name.lower() in patient.name.lower()]
+        self.refresh()
+        patients = self.patients
+        # a reload by a concurrent reader may have swapped the patients in between
+        return [patients[phn] for phn in self.name_index.search(name) if phn in patients]
+
+    def query_patients(self, birth_date_from = None, birth_date_to = None, phone_prefix = None, email_domain = None):
+        ''' retrieve the patients born between two dates (both included), whose phone
+            starts with a prefix and whose email is at a domain, ordered by PHN '''
+        self.refresh()
+        return self.query_index.query(self.patients, birth_date_from=birth_date_from, birth_date_to=birth_date_to,
+            phone_prefix=phone_prefix, email_domain=email_domain)
+
+    def retrieve_notes_between(self, start = None, end = None):
+        ''' retrieve the (patient, note) pairs of every patient's notes timestamped
+            from start to end, both included and optional, oldest first '''
+        self.refresh()
+        patients = self.patients
+        pairs = []
+        for phn, code in self.notes_index.between(normalize_timestamp(start), normalize_timestamp(end, end_of_day=True)):
+            # only the patients with notes in the range have their notes loaded
+            patient = patients.get(phn)
+            note = None if patient is None else patient.search_note(code)
+            if note is not None:
+                pairs.append((patient, note))
+        return pairs
 
     def update_patient(self, phn, updated_patient):
         ''' update an existing patient '''
-        # Check if the original PHN exists in the system
-        if phn not in self.patients:
-            raise IllegalOperationException(f"Patient with PHN {phn} not found.")
+        with self._write_locked():
+            # Check if the original PHN exists in the system
+            if phn not in self.patients:
+                raise IllegalOperationException(f"Patient with PHN {phn} not found.")
 
-        # Delete the original patient entry using the old PHN
-        del self.patients[phn]
+            # Delete the original patient entry using the old PHN
+            previous_patient = self.patients.pop(phn)
+            if self._notes_index is not None:
+                self._notes_index.replace(phn, [])
 
-        # Update the patient record in the dictionary
-        self.patients[updated_patient.phn] = updated_patient
+            # Update the patient record in the dictionary
+            self._adopt(updated_patient)
+            self.patients[updated_patient.phn] = updated_patient
+            if self._name_index is not None:
+                self._name_index.remove(phn)
+                self._name_index.add(updated_patient.phn, updated_patient.name)
+            if self._query_index is not None:
+                self._query_index.remove(previous_patient)
+                self._query_index.add(updated_patient)
 
-        if self.autosave:
-            self.save_data()  # Save after updating a patient
+            if self.autosave:
+                self._persist({'op': 'update', 'phn': phn, 'patient': updated_patient})  # Save after updating a patient
         
 
         # If the code reaches here, the update succeeded
@@ -108,30 +504,43 @@ class PatientDAOJSON():
         ''' Updates patient data based on PHN '''
         patient = self.patients.get(phn)
         if patient:
-            updated_patient = Patient(phn, name, birth_date, phone, email, address)
+            updated_patient = Patient(phn, name, birth_date, phone, email, address, intern_strings=self.intern_strings)
             self.update_patient(phn, updated_patient)
         else:
             raise IllegalOperationException("Patient not found.")
     
     def delete_patient(self, phn):
         ''' delete a patient '''
-        if phn not in self.patients:
-            raise IllegalOperationException("Patient does not exist.")
-        del self.patients[phn]
-        if self.autosave:
-            self.save_data()  # Save after deleting a patient
+        with self._write_locked():
+            if phn not in self.patients:
+                raise IllegalOperationException("Patient does not exist.")
+            patient = self.patients.pop(phn)
+            if self._name_index is not None:
+                self._name_index.remove(phn)
+            if self._query_index is not None:
+                self._query_index.remove(patient)
+            if self._notes_index is not None:
+                self._notes_index.replace(phn, [])
+            if self.autosave:
+                self._persist({'op': 'delete', 'phn': phn})  # Save after deleting a patient
         return True
     
     def create_patient_from_data(self, phn, name, birth_date, phone, email, address):
         ''' Creates and returns a patient using the provided data '''
-        patient = Patient(phn, name, birth_date, phone, email, address)
+        patient = Patient(phn, name, birth_date, phone, email, address, intern_strings=self.intern_strings)
         return self.create_patient(patient)
     
     def retrieve_patients_by_name(self, name):
         ''' Retrieves patients that match the name '''
-        return [patient for patient in self.patients.values() if name.lower() in patient.name.lower()]
+        return self.retrieve_patients(name)
 
 
-    def list_patients(self):
-        ''' list all patients '''
-        return list(self.patients.values())
\ No newline at end of file
+    def list_patients(self, limit = None, after = None):
+        ''' list all patients, or with a limit a page of them ordered by PHN:
+            the first limit patients with a PHN greater than after '''
+        self.refresh()
+        if limit is None and after is None:
+            return list(self.patients.values())
+        patients = self.patients
+        # a reload by a concurrent reader may have swapped the patients in between
+        return [patients[phn] for phn in self.query_index.phns_after(after, limit) if phn in patients]
\ No newline at end of file
@@ -0,0 +1,254 @@
+from clinic.patient import Patient
+from clinic.exception.illegal_operation_exception import IllegalOperationException
+
+from clinic.dao.patient_dao import PatientDAO
+from clinic.dao.note_dao_sqlite import NoteDAOSQLite, time_range
+from clinic.note import Note
+from clinic.dao.patient_query_index import phone_digits, email_domain_of
+import os
+import sqlite3
+
+
+class PatientDAOSQLite(PatientDAO):
+    ''' DAO for handling patient data in a SQLite database '''
+
+    # the patients keep their insertion order through the id column, an update
+    # re-inserts the row so it moves last, like in the JSON DAO
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY,
+            phn INTEGER NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            birth_date TEXT,
+            phone TEXT,
+            email TEXT,
+            address TEXT)''',
+        'DROP INDEX IF EXISTS patients_name',
+        'CREATE INDEX IF NOT EXISTS patients_birth_date ON patients (birth_date)',
+        '''CREATE TABLE IF NOT EXISTS notes (
+            phn INTEGER NOT NULL,
+            code INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            timestamp TEXT,
+            PRIMARY KEY (phn, code))''',
+        'CREATE INDEX IF NOT EXISTS notes_phn_timestamp ON notes (phn, timestamp)',
+        'CREATE INDEX IF NOT EXISTS notes_timestamp ON notes (timestamp)',
+    )
+    # name search goes through a trigram index of the names lowered by Python, so
+    # a search string of three characters or more reads only the matching rows;
+    # _insert fills it and the trigger empties it when a patient row goes away
+    NAME_SCHEMA = (
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS patient_names
+            USING fts5(name, tokenize='trigram case_sensitive 1')''',
+        '''CREATE TRIGGER IF NOT EXISTS patient_names_delete AFTER DELETE ON patients
+            BEGIN DELETE FROM patient_names WHERE rowid = old.id; END''',
+    )
+    COLUMNS = 'phn, name, birth_date, phone, email, address'
+
+    def __init__(self, autosave = False, data_directory = None):
+        ''' open the database, kept in memory when autosave is off '''
+        self.autosave = autosave
+        if not self.autosave:
+            database = ':memory:'
+        else:
+            if data_directory is None:
+                data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+            database = os.path.abspath(os.path.join(data_directory, 'clinic.db'))
+
+        # autocommit, transactions are opened explicitly by begin and create_patients;
+        # the connection is shared by threads, Controller's store lock keeps writes apart
+        self.connection = sqlite3.connect(database, isolation_level=None, check_same_thread=False)
+        if self.autosave:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        # substring search uses Python's lower so results match the JSON DAO exactly
+        self.connection.create_function('py_lower', 1, str.lower, deterministic=True)
+        # and phones and email domains are compared as PatientQueryIndex compares them
+        self.connection.create_function('phone_digits', 1, phone_digits, deterministic=True)
+        self.connection.create_function('email_domain_of', 1, email_domain_of, deterministic=True)
+        for statement in self.SCHEMA:
+            self.connection.execute(statement)
+        self.name_index = self._create_name_index()
+
+    def _create_name_index(self):
+        ''' create the name trigram index, filling it from the patients already in the
+            database; without FTS5 or its trigram tokenizer name search scans the table '''
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'patient_names'").fetchone() is not None
+        try:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                for statement in self.NAME_SCHEMA:
+                    self.connection.execute(statement)
+                if not exists:
+                    self.connection.execute(
+                        'INSERT INTO patient_names (rowid, name) SELECT id, py_lower(name) FROM patients')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+        except sqlite3.OperationalError:
+            if exists:
+                raise
+            return False
+        return True
+
+    def _patient(self, row):
+        ''' build a Patient from a row, with its notes kept in the same database '''
+        patient = Patient(*row, autosave=self.autosave)
+        patient.record.notes_dao = NoteDAOSQLite(self.connection, patient.phn)
+        return patient
+
+    def _insert(self, patient):
+        ''' insert a patient row and make the patient keep its notes in the database '''
+        cursor = self.connection.execute(
+            f'INSERT INTO patients ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)',
+            (patient.phn, patient.name, patient.birth_date, patient.phone, patient.email, patient.address))
+        if self.name_index:
+            self.connection.execute(
+                'INSERT INTO patient_names (rowid, name) VALUES (?, ?)', (cursor.lastrowid, patient.name.lower()))
+        patient.record.notes_dao = NoteDAOSQLite(self.connection, patient.phn)
+
+    def search_patient(self, phn):
+        ''' search for a patient by PHN '''
+        row = self.connection.execute(f'SELECT {self.COLUMNS} FROM patients WHERE phn = ?', (phn,)).fetchone()
+        return self._patient(row) if row else None
+
+    def create_patient(self, patient):
+        ''' create a new patient '''
+        try:
+            self._insert(patient)
+        except sqlite3.IntegrityError:
+            raise IllegalOperationException("Patient with this PHN already exists.")
+        return patient
+
+    def create_patients(self, patients):
+        ''' create many new patients at once, in a single database transaction '''
+        patients = list(patients)
+        batch_phns = set()
+        for patient in patients:
+            if patient.phn in batch_phns or self.search_patient(patient.phn):
+                raise IllegalOperationException(f"Patient with PHN {patient.phn} already exists.")
+            batch_phns.add(patient.phn)
+
+        owns_transaction = not self.connection.in_transaction
+        if owns_transaction:
+            self.connection.execute('BEGIN')
+        try:
+            for patient in patients:
+                self._insert(patient)
+        except BaseException:
+            if owns_transaction:
+                self.connection.execute('ROLLBACK')
+            raise
+        if owns_transaction:
+            self.connection.execute('COMMIT')
+        return patients
+
+    def retrieve_patients(self, name):
+        ''' retrieve patients whose name matches the search string '''
+        name = name.lower()
+        if self.name_index and len(name) >= 3:
+            # a quoted phrase matches the names holding the string anywhere
+            phrase = '"' + name.replace('"', '""') + '"'
+            rows = self.connection.execute(
+                f'SELECT {self.COLUMNS} FROM patients WHERE id IN '
+                '(SELECT rowid FROM patient_names WHERE patient_names MATCH ?) ORDER BY id', (phrase,))
+        else:
+            rows = self.connection.execute(
+                f'SELECT {self.COLUMNS} FROM patients WHERE instr(py_lower(name), ?) > 0 ORDER BY id', (name,))
+        return [self._patient(row) for row in rows]
+
+    def query_patients(self, birth_date_from = None, birth_date_to = None, phone_prefix = None, email_domain = None):
+        ''' retrieve the patients born between two dates (both included), whose phone
+            starts with a prefix and whose email is at a domain, ordered by PHN '''
+        conditions = []
+        parameters = []
+        if birth_date_from is not None:
+            conditions.append('birth_date >= ?')
+            parameters.append(birth_date_from)
+        if birth_date_to is not None:
+            conditions.append('birth_date <= ?')
+            parameters.append(birth_date_to)
+        if phone_prefix is not None:
+            conditions.append('instr(phone_digits(phone), ?) = 1')
+            parameters.append(phone_digits(phone_prefix))
+        if email_domain is not None:
+            conditions.append('email_domain_of(email) = ?')
+            parameters.append(email_domain.lstrip('@').lower())
+        where = ' AND '.join(conditions) or '1'
+        rows = self.connection.execute(f'SELECT {self.COLUMNS} FROM patients WHERE {where} ORDER BY phn', parameters)
+        return [self._patient(row) for row in rows]
+
+    def retrieve_notes_between(self, start = None, end = None):
+        ''' retrieve the (patient, note) pairs of every patient's notes timestamped
+            from start to end, both included and optional, oldest first '''
+        conditions, parameters = time_range('notes.timestamp', start, end)
+        columns = ', '.join(f'patients.{column}' for column in self.COLUMNS.split(', '))
+        rows = self.connection.execute(
+            f'SELECT {columns}, notes.code, notes.text, notes.timestamp FROM notes JOIN patients ON patients.phn = notes.phn '
+            f'WHERE 1{conditions} ORDER BY notes.timestamp, notes.phn, notes.code', parameters)
+        patients = {}
+        pairs = []
+        for row in rows:
+            patient = patients.get(row[0])
+            if patient is None:
+                patient = patients[row[0]] = self._patient(row[:6])
+            pairs.append((patient, Note(*row[6:])))
+        return pairs
+
+    def update_patient(self, phn, updated_patient):
+        ''' update an existing patient '''
+        owns_transaction = not self.connection.in_transaction
+        if owns_transaction:
+            self.connection.execute('BEGIN')
+        try:
+            if self.connection.execute('DELETE FROM patients WHERE phn = ?', (phn,)).rowcount == 0:
+                raise IllegalOperationException(f"Patient with PHN {phn} not found.")
+            self._insert(updated_patient)
+        except BaseException:
+            if owns_transaction:
+                self.connection.execute('ROLLBACK')
+            raise
+        if owns_transaction:
+            self.connection.execute('COMMIT')
+        return True
+
+    def delete_patient(self, phn):
+        ''' delete a patient '''
+        if self.connection.execute('DELETE FROM patients WHERE phn = ?', (phn,)).rowcount == 0:
+            raise IllegalOperationException("Patient does not exist.")
+        return True
+
+    def list_patients(self, limit = None, after = None):
+        ''' list all patients, or with a limit a page of them ordered by PHN:
+            the first limit patients with a PHN greater than after '''
+        if limit is None and after is None:
+            rows = self.connection.execute(f'SELECT {self.COLUMNS} FROM patients ORDER BY id')
+        else:
+            condition, parameters = ('', ()) if after is None else ('WHERE phn > ? ', (after,))
+            rows = self.connection.execute(f'SELECT {self.COLUMNS} FROM patients {condition}ORDER BY phn LIMIT ?',
+                parameters + (-1 if limit is None else limit,))
+        return [self._patient(row) for row in rows]
+
+    def begin(self):
+        ''' open a database transaction covering patients and notes. it takes the write
+            lock at once, so other processes cannot write until the transaction ends '''
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        ''' commit the open database transaction, rolling it back if the commit fails '''
+        try:
+            self.connection.execute('COMMIT')
+        except BaseException:
+            if self.connection.in_transaction:
+                self.connection.execute('ROLLBACK')
+            raise
+
+    def rollback(self):
+        ''' roll back the open database transaction '''
+        self.connection.execute('ROLLBACK')
+
+    def close(self):
+        ''' close the database connection '''
+        self.connection.close()
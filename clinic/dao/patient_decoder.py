@@ -4,14 +4,20 @@ from clinic.patient_record import PatientRecord
 
 class PatientDecoder(json.JSONDecoder):
     ''' Custom decoder for Patient objects '''
-    def __init__(self, autosave=False):
+    def __init__(self, autosave=False, journal=False, notes_dao_factory=None, intern_strings=False):
         # Accept autosave argument in the constructor
         self.autosave = autosave
+        self.journal = journal
+        self.notes_dao_factory = notes_dao_factory
+        self.intern_strings = intern_strings
         super().__init__()
 
     def decode(self, s):
         ''' Override the decode method to handle custom decoding '''
-        data = super().decode(s)
+        return self.decode_dict(super().decode(s))
+
+    def decode_dict(self, data):
+        ''' Build a Patient directly from an already parsed dictionary '''
         if 'phn' in data:
             # Pass the autosave parameter here to create PatientRecord with it
             patient = Patient(
@@ -20,10 +26,48 @@ class PatientDecoder(json.JSONDecoder):
                 birth_date=data['birth_date'],
                 phone=data['phone'],
                 email=data['email'],
-                address=data['address']
+                address=data['address'],
+                intern_strings=self.intern_strings
             )
             if 'record' in data and data['record'] is not None:
                 # Pass autosave as per the current context
-                patient.record = PatientRecord.from_dict(data['record'], autosave=self.autosave)
+                patient.record = PatientRecord.from_dict(data['record'], autosave=self.autosave, journal=self.journal, notes_dao_factory=self.notes_dao_factory)
             return patient
-        return data
\ No newline at end of file
+        return data
+
+    def iter_decode(self, file, chunk_size=65536):
+        ''' Incrementally parse a JSON array of patients, yielding one Patient at a time '''
+        # Only the patient currently being parsed is buffered, so the whole
+        # document never has to be held in memory next to the Patient objects
+        buffer = ''
+        position = 0
+        opened = False
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    raise json.JSONDecodeError("Unterminated array of patients", buffer, position)
+                buffer, position = chunk, 0
+                continue
+
+            if not opened:
+                if buffer[position] != '[':
+                    raise json.JSONDecodeError("Expecting '['", buffer, position)
+                opened = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+
+            try:
+                data, position = self.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the patient continues in the next chunk
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield self.decode_dict(data)
\ No newline at end of file
@@ -0,0 +1,109 @@
+from bisect import bisect_left, bisect_right, insort
+import math
+
+
+def phone_digits(phone):
+    ''' the digits of a phone number, so '250 301-6060' and '2503016060' match '''
+    return ''.join(character for character in phone or '' if character.isdigit())
+
+
+def email_domain_of(email):
+    ''' the lowercased domain of an email address, without the @ '''
+    return (email or '').rpartition('@')[2].lower()
+
+
+class PatientQueryIndex():
+    ''' Secondary indexes over patient fields: PHNs, birth dates and phone digits
+        kept sorted for pages, ranges and prefixes, email domains hashed for equality '''
+
+    def __init__(self, patients = ()):
+        ''' index the given patients '''
+        self.phns = []  # sorted phns
+        self.birth_dates = []  # sorted (birth date, phn)
+        self.phones = []  # sorted (phone digits, phn)
+        self.email_domains = {}  # domain -> set of phns
+        for patient in patients:
+            self.phns.append(patient.phn)
+            self.birth_dates.append((patient.birth_date or '', patient.phn))
+            self.phones.append((phone_digits(patient.phone), patient.phn))
+            self.email_domains.setdefault(email_domain_of(patient.email), set()).add(patient.phn)
+        self.phns.sort()
+        self.birth_dates.sort()
+        self.phones.sort()
+
+    def add(self, patient):
+        ''' index one patient '''
+        insort(self.phns, patient.phn)
+        insort(self.birth_dates, (patient.birth_date or '', patient.phn))
+        insort(self.phones, (phone_digits(patient.phone), patient.phn))
+        self.email_domains.setdefault(email_domain_of(patient.email), set()).add(patient.phn)
+
+    def remove(self, patient):
+        ''' stop indexing a patient, as it was when it was added '''
+        for keys, key in ((self.phns, patient.phn), (self.birth_dates, (patient.birth_date or '', patient.phn)),
+                (self.phones, (phone_digits(patient.phone), patient.phn))):
+            position = bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+        domain = email_domain_of(patient.email)
+        phns = self.email_domains.get(domain)
+        if phns is not None:
+            phns.discard(patient.phn)
+            if not phns:
+                del self.email_domains[domain]
+
+    def phns_after(self, after, limit):
+        ''' up to limit PHNs greater than after, or from the first one, in order '''
+        start = 0 if after is None else bisect_right(self.phns, after)
+        return self.phns[start:] if limit is None else self.phns[start:start + limit]
+
+    def birth_date_range(self, birth_date_from, birth_date_to):
+        ''' positions of the birth dates between the bounds, both included and optional '''
+        low = 0 if birth_date_from is None else bisect_left(self.birth_dates, (birth_date_from,))
+        high = len(self.birth_dates) if birth_date_to is None else bisect_right(self.birth_dates, (birth_date_to, math.inf))
+        return low, max(low, high)
+
+    def phone_range(self, prefix):
+        ''' positions of the phone numbers starting with the prefix '''
+        # every key starting with the prefix sorts before the prefix followed by a non digit
+        return bisect_left(self.phones, (prefix,)), bisect_left(self.phones, (prefix + '\x7f',))
+
+    def query(self, patients, birth_date_from = None, birth_date_to = None, phone_prefix = None, email_domain = None):
+        ''' the patients matching every given criterion, by PHN. The planner takes the
+            candidates from the most selective index and checks the other criteria on
+            each of them; without any criterion every patient matches '''
+        if phone_prefix is not None:
+            phone_prefix = phone_digits(phone_prefix)
+        if email_domain is not None:
+            email_domain = email_domain.lstrip('@').lower()
+
+        plans = []  # (number of candidates, how to list them)
+        if birth_date_from is not None or birth_date_to is not None:
+            low, high = self.birth_date_range(birth_date_from, birth_date_to)
+            plans.append((high - low, lambda: [phn for birth_date, phn in self.birth_dates[low:high]]))
+        if phone_prefix is not None:
+            phone_low, phone_high = self.phone_range(phone_prefix)
+            plans.append((phone_high - phone_low, lambda: [phn for phone, phn in self.phones[phone_low:phone_high]]))
+        if email_domain is not None:
+            domain_phns = self.email_domains.get(email_domain, ())
+            plans.append((len(domain_phns), lambda: domain_phns))
+        if not plans:
+            return sorted(patients.values(), key=lambda patient: patient.phn)
+
+        size, candidates = min(plans, key=lambda plan: plan[0])
+        matches = []
+        for phn in candidates():
+            patient = patients.get(phn)
+            if patient is None:
+                continue
+            if birth_date_from is not None and not (patient.birth_date or '') >= birth_date_from:
+                continue
+            if birth_date_to is not None and not (patient.birth_date or '') <= birth_date_to:
+                continue
+            if phone_prefix is not None and not phone_digits(patient.phone).startswith(phone_prefix):
+                continue
+            if email_domain is not None and email_domain_of(patient.email) != email_domain:
+                continue
+            matches.append(patient)
+        matches.sort(key=lambda patient: patient.phn)
+        return matches
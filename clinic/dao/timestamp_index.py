@@ -0,0 +1,143 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, time
+import math
+import threading
+
+
+def normalize_timestamp(timestamp, end_of_day = False):
+    ''' a note timestamp, or a bound of a time range, as a naive local datetime:
+        notes are timestamped with datetimes or with '%Y-%m-%d %H:%M:%S' strings,
+        and bounds may also be dates or ISO date strings. None if it is neither.
+        a date is its midnight, or with end_of_day its last microsecond, so that
+        an end bound includes the whole day '''
+    if isinstance(timestamp, datetime):
+        return timestamp if timestamp.tzinfo is None else timestamp.astimezone().replace(tzinfo=None)
+    if isinstance(timestamp, date):
+        return datetime.combine(timestamp, time.max if end_of_day else time())
+    if isinstance(timestamp, str):
+        try:
+            return normalize_timestamp(date.fromisoformat(timestamp), end_of_day)
+        except ValueError:
+            pass
+        try:
+            return normalize_timestamp(datetime.fromisoformat(timestamp))
+        except ValueError:
+            return None
+    return None
+
+
+class TimestampIndex():
+    ''' Note codes ordered by their normalized timestamp, for time range queries '''
+
+    def __init__(self, notes = ()):
+        ''' index the given notes '''
+        self.keys = []  # sorted (timestamp, code)
+        for note in notes:
+            timestamp = normalize_timestamp(note.timestamp)
+            if timestamp is not None:
+                self.keys.append((timestamp, note.code))
+        self.keys.sort()
+
+    def add(self, code, timestamp):
+        ''' index a note; notes are usually created in time order, so it goes last '''
+        timestamp = normalize_timestamp(timestamp)
+        if timestamp is not None:
+            insort(self.keys, (timestamp, code))
+
+    def remove(self, code, timestamp):
+        ''' stop indexing a note, if it was indexed '''
+        key = (normalize_timestamp(timestamp), code)
+        if key[0] is None:
+            return
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def between(self, start = None, end = None):
+        ''' codes of the notes timestamped from start to end, both included and
+            optional normalized datetimes, oldest first '''
+        low = 0 if start is None else bisect_left(self.keys, (start,))
+        high = len(self.keys) if end is None else bisect_right(self.keys, (end, math.inf))
+        return [code for timestamp, code in self.keys[low:high]]
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class ClinicTimestampIndex():
+    ''' Every patient's notes ordered by their normalized timestamp, for time range
+        queries across the clinic. the notes DAOs report the notes they create and
+        delete, and the patients whose notes were loaded again are marked stale to
+        be read again before the next query '''
+
+    def __init__(self):
+        ''' an empty index '''
+        self.keys = []  # sorted (timestamp, phn, code)
+        self.timestamps = {}  # phn -> {code: normalized timestamp} of the indexed notes
+        self.stale = set()  # phns whose notes are read again before the next query
+        # lock file advanced by every notes write, and its generation the index matches
+        self.notes_lock = None
+        self.generation = None
+        # the DAOs report changes while concurrent readers may be querying
+        self.lock = threading.Lock()
+
+    def _add(self, phn, code, timestamp):
+        timestamp = normalize_timestamp(timestamp)
+        if timestamp is not None:
+            insort(self.keys, (timestamp, phn, code))
+            self.timestamps.setdefault(phn, {})[code] = timestamp
+
+    def _remove(self, key):
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def add(self, phn, code, timestamp):
+        ''' index a new note of a patient '''
+        with self.lock:
+            self._add(phn, code, timestamp)
+
+    def remove(self, phn, code):
+        ''' stop indexing a deleted note of a patient '''
+        with self.lock:
+            timestamp = self.timestamps.get(phn, {}).pop(code, None)
+            if timestamp is not None:
+                self._remove((timestamp, phn, code))
+
+    def replace(self, phn, notes):
+        ''' index the given notes of a patient instead of the ones indexed so far '''
+        with self.lock:
+            for code, timestamp in self.timestamps.pop(phn, {}).items():
+                self._remove((timestamp, phn, code))
+            for note in notes:
+                self._add(phn, note.code, note.timestamp)
+
+    def invalidate(self, phn):
+        ''' read a patient's notes again before the next query '''
+        with self.lock:
+            self.stale.add(phn)
+
+    def wrote(self, before, after):
+        ''' a notes DAO of this process advanced the generation from before to after,
+            after reporting its changes; a write of another process in between is not
+            indexed, so the generation only follows on from the one the index matches '''
+        with self.lock:
+            if self.generation == before:
+                self.generation = after
+
+    def take_stale(self):
+        ''' the phns marked stale, which are no longer marked '''
+        with self.lock:
+            stale, self.stale = self.stale, set()
+        return stale
+
+    def between(self, start = None, end = None):
+        ''' (phn, code) of the notes timestamped from start to end, both included
+            and optional normalized datetimes, oldest first '''
+        with self.lock:
+            low = 0 if start is None else bisect_left(self.keys, (start,))
+            high = len(self.keys) if end is None else bisect_right(self.keys, (end, math.inf))
+            return [(phn, code) for timestamp, phn, code in self.keys[low:high]]
+
+    def __len__(self):
+        return len(self.keys)
@@ -0,0 +1,92 @@
+class TrigramIndex():
+    ''' Inverted index from lowercase trigrams to keys, for case-insensitive substring search '''
+
+    def __init__(self, text_of = None):
+        ''' initialize an empty index. with text_of, a function giving the current text
+            of a key, the texts are not copied into the index but read back from their
+            owner, to confirm matches and to find the trigrams of a text being replaced '''
+        self.text_of = text_of
+        self.texts = {}  # key -> lowercased text, unless text_of gives them
+        self.order = {}  # key -> insertion sequence, so results keep the collection's order
+        self.postings = {}  # trigram -> set of keys whose text contains it
+        self.sequence = 0
+
+    @staticmethod
+    def trigrams(text):
+        ''' the distinct trigrams of a lowercased text '''
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, key, text):
+        ''' index a text under the given key, placing it last in the order '''
+        text = text.lower()
+        if self.text_of is None:
+            self.texts[key] = text
+        self.order[key] = self.sequence
+        self.sequence += 1
+        for trigram in self.trigrams(text):
+            self.postings.setdefault(trigram, set()).add(key)
+
+    def update(self, key, text):
+        ''' re-index the text of an existing key, keeping its place in the order;
+            with text_of, before the owner replaces the key's text '''
+        old_trigrams = self.trigrams(self.text(key))
+        text = text.lower()
+        if self.text_of is None:
+            self.texts[key] = text
+        new_trigrams = self.trigrams(text)
+        # only the trigrams that differ between the two versions are touched
+        for trigram in old_trigrams - new_trigrams:
+            keys = self.postings[trigram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[trigram]
+        for trigram in new_trigrams - old_trigrams:
+            self.postings.setdefault(trigram, set()).add(key)
+
+    def remove(self, key):
+        ''' remove a key from the index, if present; with text_of, before the owner removes it '''
+        if key not in self.order:
+            return
+        text = self.text(key)
+        self.texts.pop(key, None)
+        del self.order[key]
+        for trigram in self.trigrams(text):
+            keys = self.postings[trigram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[trigram]
+
+    def search(self, query):
+        ''' keys whose text contains the query, ignoring case, in insertion order '''
+        query = query.lower()
+        if len(query) < 3:
+            # too short to have a trigram, scan the texts
+            return [key for key in self.order if query in self.text(key)]
+
+        postings = []
+        for trigram in self.trigrams(query):
+            keys = self.postings.get(trigram)
+            if not keys:
+                return []
+            postings.append(keys)
+        # intersect starting from the rarest trigram
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for keys in postings[1:]:
+            candidates &= keys
+            if not candidates:
+                return []
+
+        # sharing every trigram does not guarantee a substring match, confirm each candidate
+        matches = [key for key in candidates if query in self.text(key)]
+        matches.sort(key=self.order.__getitem__)
+        return matches
+
+    def text(self, key):
+        ''' the lowercased text of an indexed key '''
+        if self.text_of is None:
+            return self.texts[key]
+        return self.text_of(key).lower()
+
+    def __len__(self):
+        return len(self.order)
@@ -0,0 +1,74 @@
+from contextlib import nullcontext
+import atexit
+import threading
+
+
+class WriteBehindFlusher():
+    ''' background thread writing the changes DAOs hold back in write-behind mode.
+        a DAO marked dirty many times between two flushes is written once '''
+
+    def __init__(self, interval = 1.0, threshold = 100, lock = None):
+        ''' flush every interval seconds, or sooner once threshold changes are waiting.
+            lock, if given, is called for a context manager held while flushing '''
+        self.interval = interval
+        self.threshold = threshold
+        self.lock = lock
+        self.dirty = {}  # DAOs with unwritten changes, in the order they were marked
+        self.dirty_count = 0
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()  # one flush at a time
+        self.thread = None
+        self.closed = False
+        self.last_error = None  # the error of the last failed background flush
+        # whatever is still waiting is written when the interpreter exits
+        atexit.register(self.close)
+
+    def mark_dirty(self, dao, changes = 1):
+        ''' remember that a DAO has changes to write '''
+        with self.condition:
+            self.dirty[dao] = None
+            self.dirty_count += changes
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(target=self.run, name='clinic-flusher', daemon=True)
+                self.thread.start()
+            if self.dirty_count >= self.threshold:
+                self.condition.notify()
+
+    def run(self):
+        ''' flush on every interval, or as soon as enough changes are waiting '''
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.closed or self.dirty_count >= self.threshold, timeout=self.interval)
+                if self.closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                # the DAOs keep their changes and were marked again, the next flush retries
+                self.last_error = e
+
+    def flush(self):
+        ''' write every dirty DAO now '''
+        with self.flush_lock:
+            with self.condition:
+                daos = list(self.dirty)
+                self.dirty = {}
+                self.dirty_count = 0
+            with self.lock() if self.lock is not None else nullcontext():
+                for position, dao in enumerate(daos):
+                    try:
+                        dao.flush()
+                    except BaseException:
+                        for unwritten in daos[position:]:
+                            self.mark_dirty(unwritten, 0)
+                        raise
+
+    def close(self):
+        ''' stop the background thread after writing what is still waiting '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.flush()
+        atexit.unregister(self.close)
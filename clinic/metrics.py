@@ -0,0 +1,171 @@
+import atexit
+import functools
+import os
+import threading
+import time
+
+
+class Metrics():
+	''' call counts, latency histograms, bytes written and dataset sizes
+		of a Controller and its DAOs '''
+
+	# upper bounds of the latency histogram buckets, in seconds
+	BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+
+	def __init__(self):
+		''' construct empty metrics '''
+		self.lock = threading.Lock()
+		self.operations = {}  # (layer, operation) -> [calls, errors, total seconds, calls per bucket]
+		self.bytes_written = {}  # file kind -> bytes
+		self.sizes = {}  # dataset -> {key: size}, summed when reported
+
+	def observe(self, layer, operation, seconds, failed = False):
+		''' count one call of an operation and the time it took '''
+		with self.lock:
+			entry = self.operations.get((layer, operation))
+			if entry is None:
+				entry = self.operations[(layer, operation)] = [0, 0, 0.0, [0] * (len(self.BUCKETS) + 1)]
+			entry[0] += 1
+			entry[1] += failed
+			entry[2] += seconds
+			for bucket, bound in enumerate(self.BUCKETS):
+				if seconds <= bound:
+					break
+			else:
+				bucket = len(self.BUCKETS)
+			entry[3][bucket] += 1
+
+	def timed(self, layer, operation, function):
+		''' wrap a function so its calls are observed '''
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			start = time.perf_counter()
+			failed = True
+			try:
+				result = function(*args, **kwargs)
+				failed = False
+				return result
+			finally:
+				self.observe(layer, operation, time.perf_counter() - start, failed)
+		return wrapper
+
+	def instrument(self, target, layer, names):
+		''' replace methods of one object by observed ones; other objects of
+			its class, and this one when metrics are off, pay nothing '''
+		for name in names:
+			setattr(target, name, self.timed(layer, name, getattr(target, name)))
+
+	def wrote(self, kind, count):
+		''' count bytes written to one kind of file '''
+		with self.lock:
+			self.bytes_written[kind] = self.bytes_written.get(kind, 0) + count
+
+	def size(self, dataset, value, key = None):
+		''' record the size of a dataset, or of the part of it kept under key '''
+		with self.lock:
+			self.sizes.setdefault(dataset, {})[key] = value
+
+	def stats(self):
+		''' a snapshot of every metric, as plain data '''
+		with self.lock:
+			operations = {}
+			for (layer, operation), (calls, errors, seconds, buckets) in sorted(self.operations.items()):
+				cumulative = []
+				for count in buckets:
+					cumulative.append(count + (cumulative[-1] if cumulative else 0))
+				operations.setdefault(layer, {})[operation] = {
+					'calls': calls,
+					'errors': errors,
+					'seconds': seconds,
+					'buckets': dict(zip(self.BUCKETS + (float('inf'),), cumulative)),
+				}
+			return {
+				'operations': operations,
+				'bytes_written': dict(self.bytes_written),
+				'sizes': {dataset: sum(sizes.values()) for dataset, sizes in self.sizes.items()},
+			}
+
+	def prometheus(self):
+		''' the metrics in the Prometheus text exposition format '''
+		stats = self.stats()
+		lines = [
+			'# HELP clinic_operation_seconds Time taken by Controller operations and DAO persistence calls.',
+			'# TYPE clinic_operation_seconds histogram',
+		]
+		for layer, operations in stats['operations'].items():
+			for operation, entry in operations.items():
+				labels = f'layer="{layer}",operation="{operation}"'
+				for bound, count in entry['buckets'].items():
+					le = '+Inf' if bound == float('inf') else repr(bound)
+					lines.append(f'clinic_operation_seconds_bucket{{{labels},le="{le}"}} {count}')
+				lines.append(f'clinic_operation_seconds_sum{{{labels}}} {entry["seconds"]!r}')
+				lines.append(f'clinic_operation_seconds_count{{{labels}}} {entry["calls"]}')
+		lines.append('# HELP clinic_operation_errors_total Operations that raised an exception.')
+		lines.append('# TYPE clinic_operation_errors_total counter')
+		for layer, operations in stats['operations'].items():
+			for operation, entry in operations.items():
+				lines.append(f'clinic_operation_errors_total{{layer="{layer}",operation="{operation}"}} {entry["errors"]}')
+		lines.append('# HELP clinic_bytes_written_total Bytes written to the data files.')
+		lines.append('# TYPE clinic_bytes_written_total counter')
+		for kind, count in sorted(stats['bytes_written'].items()):
+			lines.append(f'clinic_bytes_written_total{{file="{kind}"}} {count}')
+		lines.append('# HELP clinic_dataset_size Patients and notes held by the stores.')
+		lines.append('# TYPE clinic_dataset_size gauge')
+		for dataset, size in sorted(stats['sizes'].items()):
+			lines.append(f'clinic_dataset_size{{dataset="{dataset}"}} {size}')
+		return '\n'.join(lines) + '\n'
+
+	def write_prometheus(self, path):
+		''' write the metrics to a file in the Prometheus text format, replacing it atomically
+			so a scraper (e.g. the node exporter's textfile collector) never reads half of it '''
+		temporary_path = path + '.tmp'
+		with open(temporary_path, 'w') as file:
+			file.write(self.prometheus())
+		os.replace(temporary_path, path)
+
+
+class MetricsExporter():
+	''' background thread writing the metrics to a Prometheus text file periodically '''
+
+	def __init__(self, metrics, path, interval = 15.0):
+		''' write the metrics to path every interval seconds, and once more at exit '''
+		self.metrics = metrics
+		self.path = path
+		self.interval = interval
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run, name='clinic-metrics', daemon=True)
+		self.thread.start()
+		atexit.register(self.close)
+
+	def run(self):
+		''' write the metrics on every interval until closed '''
+		while not self.stopped.wait(self.interval):
+			self.metrics.write_prometheus(self.path)
+
+	def close(self):
+		''' stop the thread after writing the metrics one last time '''
+		self.stopped.set()
+		if self.thread is not threading.current_thread():
+			self.thread.join()
+		self.metrics.write_prometheus(self.path)
+		atexit.unregister(self.close)
+
+
+def measured(operation):
+	''' decorator observing a DAO method in the DAO's metrics; without metrics
+		the call only costs an attribute check '''
+	def decorate(function):
+		@functools.wraps(function)
+		def wrapper(self, *args, **kwargs):
+			if self.metrics is None:
+				return function(self, *args, **kwargs)
+			start = time.perf_counter()
+			failed = True
+			try:
+				result = function(self, *args, **kwargs)
+				failed = False
+				return result
+			finally:
+				self.metrics.observe('dao', operation, time.perf_counter() - start, failed)
+		return wrapper
+	return decorate
@@ -1,8 +1,13 @@
 import datetime
 
+from clinic.compression import decompress_text
+
 class Note():
 	''' class that represents a note '''
 
+	# _text holds the text, or its compressed bytes when the notes DAO compresses texts
+	__slots__ = ('code', '_text', 'timestamp')
+
 	def __init__(self, code, text, timestamp=datetime.datetime.now()):
 		''' constructs a note '''
 		self.code = code
@@ -16,6 +21,22 @@ class Note():
 
 		self.timestamp = timestamp
 
+	@property
+	def text(self):
+		''' the text of the note, decompressed on every access so it stays compressed in memory '''
+		text = self._text
+		return decompress_text(text) if isinstance(text, bytes) else text
+
+	@text.setter
+	def text(self, text):
+		''' sets the text, or the compressed bytes of one '''
+		self._text = text
+
+	@property
+	def stored_text(self):
+		''' the text as it is kept, compressed bytes if it was compressed '''
+		return self._text
+
 	def __eq__(self, other):
 		''' checks whether this note is the same as other note '''
 		return self.code == other.code and self.text == other.text
@@ -26,4 +47,15 @@ class Note():
 
 	def __repr__(self):
 		''' converts the note object to a string representation for debugging '''
-		return "Note(%r, %r, %r)" % (self.code, self.timestamp, self.text)
\ No newline at end of file
+		return "Note(%r, %r, %r)" % (self.code, self.timestamp, self.text)
+
+	def to_dict(self):
+		''' converts the note to a dictionary for serialization, a compressed text staying compressed '''
+		return {'code': self.code, 'text': self._text, 'timestamp': self.timestamp}
+
+	def __setstate__(self, state):
+		''' restores a pickled note, also one pickled before notes had slots '''
+		if isinstance(state, tuple):
+			state = state[1]
+		for name, value in state.items():
+			setattr(self, name, value)
\ No newline at end of file
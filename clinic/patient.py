@@ -1,18 +1,30 @@
 from clinic.patient_record import PatientRecord
+import sys
 
 class Patient():
 	''' class that represents a patient '''
 
-	def __init__(self, phn, name, birth_date, phone, email, address,  autosave = False):
-		''' constructs a patient '''
+	# slots instead of a __dict__ per patient, which counts with a million patients
+	__slots__ = ('phn', 'name', 'birth_date', 'phone', 'email', 'address', 'record')
+	# the fields many patients share a value of, interned on request
+	INTERNED_FIELDS = ('name', 'birth_date')
+
+	def __init__(self, phn, name, birth_date, phone, email, address,  autosave = False, journal = False, intern_strings = False):
+		''' constructs a patient. with intern_strings, patients with the same
+			name or birth date share one string for it '''
 		self.phn = phn
 		self.name = name
 		self.birth_date = birth_date
 		self.phone = phone
 		self.email = email
 		self.address = address
+		if intern_strings:
+			for field in self.INTERNED_FIELDS:
+				value = getattr(self, field)
+				if type(value) is str:
+					setattr(self, field, sys.intern(value))
 
-		self.record = PatientRecord(phn, autosave=autosave)
+		self.record = PatientRecord(phn, autosave=autosave, journal=journal)
 
 	def get_patient_record(self):
 		''' get the patient's record '''
@@ -33,6 +45,18 @@ class Patient():
 		''' converts the patient object to a string representation for debugging '''
 		return "Patient(%r, %r, %r, %r, %r, %r)" % (self.phn, self.name, self.birth_date, self.phone, self.email, self.address)
 
+	def to_dict(self):
+		''' converts the patient to a dictionary for serialization '''
+		return {
+			'phn': self.phn,
+			'name': self.name,
+			'birth_date': self.birth_date,
+			'phone': self.phone,
+			'email': self.email,
+			'address': self.address,
+			'record': self.record.to_dict() if self.record else None,
+		}
+
 	def search_note(self, code):
 		''' delegates note search to the patient's record '''
 		return self.record.search_note(code)
@@ -45,6 +69,14 @@ class Patient():
 		''' delegates note retrieval to the patient's record '''
 		return self.record.retrieve_notes(search_string)
 
+	def retrieve_notes_between(self, start = None, end = None):
+		''' delegates note retrieval by time range to the patient's record '''
+		return self.record.retrieve_notes_between(start, end)
+
+	def notes_since(self, since):
+		''' delegates retrieval of the recent notes to the patient's record '''
+		return self.record.notes_since(since)
+
 	def update_note(self, code, new_text):
 		''' delegates note updating to the patient's record '''
 		return self.record.update_note(code, new_text)
@@ -53,6 +85,6 @@ class Patient():
 		''' delegates note deletion to the patient's record '''
 		return self.record.delete_note(code)
 
-	def list_notes(self):
+	def list_notes(self, limit = None, before_code = None):
 		''' delegates note listing to the patient's record '''
-		return self.record.list_notes()
+		return self.record.list_notes(limit=limit, before_code=before_code)
@@ -1,13 +1,69 @@
 from clinic.dao.note_dao_pickle import NoteDAOPickle
+import threading
 
 
 class PatientRecord():
 	''' class that represents a patient's medical record '''
 
-	def __init__(self, phn, autosave = False):
+	__slots__ = ('phn', 'autosave', 'journal', 'notes_dao_factory', '_notes_dao', '_notes_index')
+
+	# sessions reading the same record in parallel must not load its notes twice
+	loading_lock = threading.Lock()
+
+	def __init__(self, phn, autosave = False, journal = False, notes_dao_factory = None):
 		''' construct a patient record '''
 		self.phn = phn
-		self.notes_dao = NoteDAOPickle(phn, autosave=autosave) 
+		self.autosave = autosave
+		self.journal = journal
+		# builds the notes DAO from the PHN when the notes are not kept in pickle files
+		self.notes_dao_factory = notes_dao_factory
+		# the notes DAO opens the patient's records file, so it is only
+		# created the first time a note operation needs it
+		self._notes_dao = None
+		# the clinic-wide timestamp index the notes DAO reports its changes to, if any
+		self._notes_index = None
+
+	def _new_notes_dao(self):
+		''' a notes DAO loading the patient's notes '''
+		if self.notes_dao_factory is not None:
+			return self.notes_dao_factory(self.phn)
+		return NoteDAOPickle(self.phn, autosave=self.autosave, journal=self.journal)
+
+	@property
+	def notes_dao(self):
+		''' the patient's notes DAO, created and loaded on first access '''
+		if self._notes_dao is None:
+			with self.loading_lock:
+				if self._notes_dao is None:
+					notes_dao = self._new_notes_dao()
+					if self._notes_index is not None:
+						notes_dao.clinic_index = self._notes_index
+						self._notes_index.invalidate(self.phn)
+					self._notes_dao = notes_dao
+		return self._notes_dao
+
+	@property
+	def notes_index(self):
+		''' the clinic-wide timestamp index the notes DAO reports its changes to '''
+		return self._notes_index
+
+	@notes_index.setter
+	def notes_index(self, notes_index):
+		''' have the notes DAO report its changes to a clinic-wide timestamp index '''
+		self._notes_index = notes_index
+		if self._notes_dao is not None:
+			self._notes_dao.clinic_index = notes_index
+
+	def notes_reader(self):
+		''' the notes DAO if the notes are loaded, or else a new one that is not
+			kept, to read the notes without keeping them in memory '''
+		notes_dao = self._notes_dao
+		return notes_dao if notes_dao is not None else self._new_notes_dao()
+
+	@notes_dao.setter
+	def notes_dao(self, notes_dao):
+		''' replace the patient's notes DAO '''
+		self._notes_dao = notes_dao
 
 	def search_note(self, code):
 		''' search a note in the patient's record '''
@@ -21,6 +77,14 @@ class PatientRecord():
 		''' retrieve notes in the patient's record that satisfy a search string '''
 		return self.notes_dao.retrieve_notes(search_string)
 
+	def retrieve_notes_between(self, start = None, end = None):
+		''' retrieve notes in the patient's record timestamped from start to end, oldest first '''
+		return self.notes_dao.retrieve_notes_between(start, end)
+
+	def notes_since(self, since):
+		''' retrieve notes in the patient's record timestamped at or after since, oldest first '''
+		return self.notes_dao.notes_since(since)
+
 	def update_note(self, code, new_text):
 		''' update a note from the patient's record '''
 		return self.notes_dao.update_note(code, new_text)
@@ -30,16 +94,17 @@ class PatientRecord():
 		''' delete a note from the patient's record '''
 		return self.notes_dao.delete_note(code)
 
-	def list_notes(self):
+	def list_notes(self, limit = None, before_code = None):
 		''' list all notes from the patient's record from the 
-			more recently added to the least recently added'''
-		return self.notes_dao.list_notes()
+			more recently added to the least recently added, or with a
+			limit the limit newest notes with a code lower than before_code'''
+		return self.notes_dao.list_notes(limit=limit, before_code=before_code)
 	
 	@staticmethod
-	def from_dict(data: dict, autosave: bool = False) -> 'PatientRecord':
+	def from_dict(data: dict, autosave: bool = False, journal: bool = False, notes_dao_factory = None) -> 'PatientRecord':
 		''' Convert a dictionary back to a PatientRecord object '''
 		# Pass the phn and autosave argument to create a PatientRecord
-		return PatientRecord(data['phn'], autosave=autosave)
+		return PatientRecord(data['phn'], autosave=autosave, journal=journal, notes_dao_factory=notes_dao_factory)
 
 	def to_dict(self) -> dict:
 		''' Convert a PatientRecord object to a dictionary for serialization '''
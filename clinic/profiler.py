@@ -0,0 +1,159 @@
+from collections import Counter
+import atexit
+import cProfile
+import functools
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+class Profiler():
+	''' profiles operations on the real request path, aggregated per operation.
+		'cprofile' mode records every call with cProfile and dumps <operation>.pstats
+		files; 'sampling' mode samples the stacks of the threads running an operation
+		and dumps <operation>.collapsed files, one "frame;frame;frame count" line per
+		stack, ready for flamegraph.pl or speedscope '''
+
+	MODES = ('cprofile', 'sampling')
+
+	def __init__(self, directory, operations, mode = 'cprofile', interval = 60.0, sample_interval = 0.005):
+		''' profile the named operations and dump them to directory every interval
+			seconds; in sampling mode the stacks are sampled every sample_interval seconds '''
+		if mode not in self.MODES:
+			raise ValueError(f"Unknown profiling mode '{mode}'.")
+		self.directory = directory
+		self.operations = tuple(operations)
+		self.mode = mode
+		self.interval = interval
+		self.sample_interval = sample_interval
+		os.makedirs(directory, exist_ok=True)
+
+		self.calls = Counter()  # operation -> profiled calls
+		self.profiles = {}  # operation -> cProfile.Profile
+		# cProfile can only profile one call at a time, calls made meanwhile run unprofiled
+		self.profile_lock = threading.Lock()
+		self.local = threading.local()
+		self.stacks = {}  # operation -> Counter of collapsed stacks
+		self.running = {}  # thread id -> operation it is running, for the sampler
+		self.sampled_code = None  # code of the sampling wrappers, where stacks are cut
+		self.wrapped = []  # (object, method name, the attribute it had before)
+
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run, name='clinic-profiler', daemon=True)
+		self.thread.start()
+		atexit.register(self.close)
+
+	def instrument(self, target):
+		''' profile the operations of one object; close puts its methods back '''
+		for name in self.operations:
+			self.wrapped.append((target, name, vars(target).get(name)))
+			if self.mode == 'cprofile':
+				self.profiles.setdefault(name, cProfile.Profile())
+				wrapper = self._profiled(name, getattr(target, name))
+			else:
+				self.stacks.setdefault(name, Counter())
+				wrapper = self._sampled(name, getattr(target, name))
+			setattr(target, name, wrapper)
+
+	def _profiled(self, operation, function):
+		''' wrap a function so its calls are recorded by the operation's profile '''
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			# an operation called by another one is already in the outer profile
+			if getattr(self.local, 'active', False) or not self.profile_lock.acquire(blocking=False):
+				return function(*args, **kwargs)
+			self.local.active = True
+			try:
+				self.calls[operation] += 1
+				profile = self.profiles[operation]
+				profile.enable()
+				try:
+					return function(*args, **kwargs)
+				finally:
+					profile.disable()
+			finally:
+				self.local.active = False
+				self.profile_lock.release()
+		return wrapper
+
+	def _sampled(self, operation, function):
+		''' wrap a function so the sampler attributes its thread's stack to the operation '''
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			thread = threading.get_ident()
+			if thread in self.running:
+				return function(*args, **kwargs)
+			self.running[thread] = operation
+			self.calls[operation] += 1
+			try:
+				return function(*args, **kwargs)
+			finally:
+				del self.running[thread]
+		self.sampled_code = wrapper.__code__
+		return wrapper
+
+	def sample(self):
+		''' count the current stack of every thread running an operation '''
+		frames = sys._current_frames()
+		for thread, operation in list(self.running.items()):
+			frame = frames.get(thread)
+			stack = []
+			# the stack is cut at the wrapper, so it starts with the operation itself
+			while frame is not None and frame.f_code is not self.sampled_code:
+				code = frame.f_code
+				stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+				frame = frame.f_back
+			if frame is not None:
+				self.stacks[operation][';'.join(reversed(stack))] += 1
+
+	def run(self):
+		''' sample the stacks, if sampling, and dump the profiles on every interval '''
+		next_dump = time.monotonic() + self.interval
+		timeout = self.sample_interval if self.mode == 'sampling' else self.interval
+		while not self.stopped.wait(timeout):
+			if self.mode == 'sampling':
+				self.sample()
+			if time.monotonic() >= next_dump:
+				self.dump()
+				next_dump = time.monotonic() + self.interval
+
+	def dump(self):
+		''' write the profile of every operation called so far; each file covers
+			every call since profiling started '''
+		for operation in list(self.calls):
+			if self.mode == 'cprofile':
+				# taking the stats disables the profile, so no call may be running
+				with self.profile_lock:
+					stats = pstats.Stats(self.profiles[operation])
+				self._replace(f"{operation}.pstats", stats.dump_stats)
+			else:
+				lines = [f"{operation}{';' if stack else ''}{stack} {count}\n" for stack, count in self.stacks[operation].items()]
+				self._replace(f"{operation}.collapsed", lambda path: self._write_lines(path, lines))
+
+	def _replace(self, filename, write):
+		''' write a file through a temporary one, so readers never see half of it '''
+		path = os.path.join(self.directory, filename)
+		write(path + '.tmp')
+		os.replace(path + '.tmp', path)
+
+	@staticmethod
+	def _write_lines(path, lines):
+		''' write text lines to a file '''
+		with open(path, 'w') as file:
+			file.writelines(lines)
+
+	def close(self):
+		''' stop profiling: dump the profiles and put the original methods back '''
+		self.stopped.set()
+		if self.thread is not threading.current_thread():
+			self.thread.join()
+		for target, name, previous in reversed(self.wrapped):
+			if previous is None:
+				delattr(target, name)
+			else:
+				setattr(target, name, previous)
+		self.wrapped = []
+		self.dump()
+		atexit.unregister(self.close)
@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+import threading
+
+
+class ReadWriteLock():
+	''' lock shared by many readers or held by one writer. Waiting writers keep
+		new readers out so they are not starved, and the writing thread may
+		take the lock again for reading or writing '''
+
+	def __init__(self):
+		''' construct an unlocked lock '''
+		self.condition = threading.Condition(threading.Lock())
+		self.readers = 0
+		self.waiting_writers = 0
+		self.writer = None  # thread holding the write lock
+		self.writer_depth = 0
+
+	@contextmanager
+	def read_locked(self):
+		''' hold the lock for reading, alongside other readers '''
+		if self.writer == threading.get_ident():
+			yield  # the writer already excludes everyone else
+			return
+		with self.condition:
+			while self.writer is not None or self.waiting_writers:
+				self.condition.wait()
+			self.readers += 1
+		try:
+			yield
+		finally:
+			with self.condition:
+				self.readers -= 1
+				if not self.readers:
+					self.condition.notify_all()
+
+	@contextmanager
+	def write_locked(self):
+		''' hold the lock for writing, excluding every other thread '''
+		thread = threading.get_ident()
+		with self.condition:
+			if self.writer != thread:
+				self.waiting_writers += 1
+				while self.writer is not None or self.readers:
+					self.condition.wait()
+				self.waiting_writers -= 1
+				self.writer = thread
+			self.writer_depth += 1
+		try:
+			yield
+		finally:
+			with self.condition:
+				self.writer_depth -= 1
+				if not self.writer_depth:
+					self.writer = None
+					self.condition.notify_all()
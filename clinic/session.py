@@ -0,0 +1,32 @@
+from clinic.controller import Controller
+
+
+class Session(Controller):
+	''' one user's login on a shared controller. The session has its own login
+		and current patient, and shares the controller's users, store and lock
+		with every other session '''
+
+	def __init__(self, controller):
+		''' construct a logged out session on a controller '''
+		self.users = controller.users
+		self.username = None
+		self.password = None
+		self.logged = False
+		self.current_patient = None
+		self.transaction_daos = None
+
+		self.autosave = controller.autosave
+		self.journal = controller.journal
+		self.backend = controller.backend
+		self.intern_strings = controller.intern_strings
+		self.store_lock = controller.store_lock
+		self.flusher = controller.flusher
+		self.patients_dao = controller.patients_dao
+		self.metrics = controller.metrics
+		self.metrics_exporter = None  # the controller's exporter covers its sessions
+		if self.metrics is not None:
+			self.metrics.instrument(self, 'controller', self.OPERATIONS)
+		# the session is profiled while the controller is; stopping it puts both back
+		self.profiler = controller.profiler
+		if self.profiler is not None:
+			self.profiler.instrument(self)
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from unittest import IsolatedAsyncioTestCase
+from unittest import main
+from clinic.async_controller import AsyncController
+from clinic.controller import Controller
+from clinic.note import Note
+from clinic.patient import Patient
+from clinic.exception.illegal_operation_exception import IllegalOperationException
+from clinic.exception.no_current_patient_exception import NoCurrentPatientException
+
+class AsyncControllerTest(IsolatedAsyncioTestCase):
+	backend = 'json'
+
+	async def asyncSetUp(self):
+		self.controller = AsyncController(autosave=False, backend=self.backend)
+		await self.controller.login("user", "123456")
+
+	async def asyncTearDown(self):
+		self.controller.close()
+
+	async def test_concurrent_patient_operations(self):
+		created = await asyncio.gather(*[
+			self.controller.create_patient(9790000000 + i, f"Patient {i}", "2000-10-10", "250 203 1010", "patient@gmail.com", "300 Moss St, Victoria")
+			for i in range(50)])
+		self.assertEqual(len(created), 50)
+		self.assertEqual(len(await self.controller.list_patients()), 50)
+		self.assertEqual(await self.controller.search_patient(9790000007), Patient(9790000007, "Patient 7", "2000-10-10", "250 203 1010", "patient@gmail.com", "300 Moss St, Victoria"))
+		self.assertEqual(len(await self.controller.retrieve_patients("Patient 4")), 11)
+		with self.assertRaises(IllegalOperationException):
+			await self.controller.create_patient(9790000007, "Patient 7", "2000-10-10", "250 203 1010", "patient@gmail.com", "300 Moss St, Victoria")
+
+	async def test_notes_of_the_current_patient(self):
+		with self.assertRaises(NoCurrentPatientException):
+			await self.controller.create_note("Patient comes with headache and high blood pressure.")
+		await self.controller.create_patient(9792225555, "Joe Hancock", "1990-01-15", "278 456 7890", "john.hancock@outlook.com", "5000 Douglas St, Saanich")
+		await self.controller.set_current_patient(9792225555)
+		notes = await asyncio.gather(*[self.controller.create_note(f"note {i}") for i in range(20)])
+		self.assertEqual(sorted(note.code for note in notes), list(range(1, 21)), "concurrent notes on one patient get distinct codes")
+		self.assertTrue(await self.controller.update_note(3, "Patient says high BP is controlled."))
+		self.assertEqual(await self.controller.retrieve_notes("BP"), [Note(3, "Patient says high BP is controlled.")])
+		self.assertTrue(await self.controller.delete_note(3))
+		self.assertIsNone(await self.controller.search_note(3))
+		self.assertEqual(len(await self.controller.list_notes()), 19)
+
+	async def test_storage_work_runs_off_the_event_loop(self):
+		loop_thread = threading.get_ident()
+		threads = []
+		patients_dao = self.controller.controller.patients_dao
+		search_patient = patients_dao.search_patient
+		patients_dao.search_patient = lambda phn: threads.append(threading.get_ident()) or search_patient(phn)
+		await self.controller.search_patient(9790000000)
+		self.assertNotIn(loop_thread, threads)
+
+	async def test_reads_run_side_by_side(self):
+		await self.controller.create_patient(9792225555, "Joe Hancock", "1990-01-15", "278 456 7890", "john.hancock@outlook.com", "5000 Douglas St, Saanich")
+		await self.controller.set_current_patient(9792225555)
+		await self.controller.create_note("Patient comes with headache and high blood pressure.")
+		# each read waits for the other one, so they only finish if they run at the same time
+		barrier = threading.Barrier(2, timeout=5)
+		controller = self.controller.controller
+		search_patient = controller.search_patient
+		controller.search_patient = lambda phn: (barrier.wait(), search_patient(phn))[1]
+		found = await asyncio.gather(self.controller.search_patient(9792225555), self.controller.search_patient(9792225555))
+		self.assertEqual([patient.phn for patient in found], [9792225555, 9792225555])
+
+		barrier.reset()
+		notes_dao = controller.current_patient.record.notes_dao
+		list_notes = notes_dao.list_notes
+		notes_dao.list_notes = lambda **kwargs: (barrier.wait(), list_notes(**kwargs))[1]
+		pages = await asyncio.gather(self.controller.list_notes(), self.controller.list_notes(limit=1))
+		self.assertEqual([len(page) for page in pages], [1, 1])
+
+	async def test_note_operations_take_the_store_lock(self):
+		store_lock = self.controller.controller.store_lock
+		locked = []
+		read_locked, write_locked = store_lock.read_locked, store_lock.write_locked
+		store_lock.read_locked = lambda: locked.append('read') or read_locked()
+		store_lock.write_locked = lambda: locked.append('write') or write_locked()
+		await self.controller.create_patient(9792225555, "Joe Hancock", "1990-01-15", "278 456 7890", "john.hancock@outlook.com", "5000 Douglas St, Saanich")
+		await self.controller.set_current_patient(9792225555)
+		locked.clear()
+		await self.controller.create_note("Patient comes with headache and high blood pressure.")
+		await self.controller.update_note(1, "Patient says high BP is controlled.")
+		await self.controller.list_notes(limit=1)
+		await self.controller.retrieve_notes_between()
+		await self.controller.delete_note(1)
+		self.assertEqual(locked, ['write', 'write', 'read', 'read', 'write'])
+
+	async def test_note_operations_are_measured(self):
+		self.controller.close()
+		self.controller = AsyncController(controller=Controller(autosave=False, backend=self.backend, metrics=True))
+		await self.controller.login("user", "123456")
+		await self.controller.create_patient(9792225555, "Joe Hancock", "1990-01-15", "278 456 7890", "john.hancock@outlook.com", "5000 Douglas St, Saanich")
+		await self.controller.set_current_patient(9792225555)
+		await asyncio.gather(*[self.controller.create_note(f"note {i}") for i in range(5)])
+		await self.controller.list_notes()
+		operations = self.controller.controller.stats()['operations']['controller']
+		self.assertEqual(operations['create_note']['calls'], 5)
+		self.assertEqual(operations['list_notes']['calls'], 1)
+		with self.assertRaises(IllegalOperationException):
+			await self.controller.list_notes(limit=-1)
+		self.assertEqual(self.controller.controller.stats()['operations']['controller']['list_notes']['errors'], 1)
+
+class AsyncControllerSQLiteTest(AsyncControllerTest):
+	backend = 'sqlite'
+
+if __name__ == '__main__':
+	main()
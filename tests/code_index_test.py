@@ -0,0 +1,41 @@
+import random
+from unittest import TestCase
+from unittest import main
+from clinic.dao.code_index import CodeIndex
+
+class CodeIndexTest(TestCase):
+
+	def setUp(self):
+		self.generator = random.Random(265)
+		self.notes = dict.fromkeys(range(1, 1001))
+		self.index = CodeIndex(self.notes)
+
+	def scan(self, before_code, limit):
+		codes = [code for code in sorted(self.notes, reverse=True) if before_code is None or code < before_code]
+		return codes if limit is None else codes[:limit]
+
+	def assertPagesMatchScan(self):
+		for before_code, limit in ((None, None), (None, 10), (500, 25), (2, 5), (1, 5), (5000, 3), (self.generator.randrange(1, 1200), 40)):
+			with self.subTest(before_code=before_code, limit=limit):
+				self.assertEqual(self.index.before(before_code, limit, self.notes), self.scan(before_code, limit))
+
+	def test_pages_match_a_scan(self):
+		self.assertPagesMatchScan()
+
+	def test_index_follows_changes(self):
+		for code in self.generator.sample(sorted(self.notes), 900):
+			del self.notes[code]
+			self.index.remove(code, self.notes)
+		for code in range(1001, 1051):
+			self.notes[code] = None
+			self.index.add(code)
+		# codes replayed out of order, one of them deleted before
+		for code in (3, 4, 5):
+			if code not in self.notes:
+				self.notes[code] = None
+				self.index.add(code)
+		self.assertPagesMatchScan()
+		self.assertLessEqual(len(self.index.codes), len(self.notes) + 64, "deleted codes are dropped")
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,92 @@
+import datetime
+import random
+from unittest import TestCase
+from unittest import main
+from clinic.dao.columnar_notes import ColumnarNotes
+from clinic.note import Note
+
+class ColumnarNotesTest(TestCase):
+
+	def setUp(self):
+		self.columns = ColumnarNotes()
+		self.notes = {}
+
+	def set(self, code, text, timestamp="2024-01-01 10:00:00"):
+		self.columns[code] = Note(code, text, timestamp)
+		self.notes[code] = Note(code, text, timestamp)
+
+	def delete(self, code):
+		del self.columns[code]
+		del self.notes[code]
+
+	def assertSameNotes(self):
+		self.assertEqual(len(self.columns), len(self.notes))
+		self.assertEqual(list(self.columns), list(self.notes))
+		self.assertEqual(list(reversed(self.columns.values())), list(reversed(self.notes.values())))
+		for column_note, note in zip(self.columns.values(), self.notes.values()):
+			self.assertEqual((column_note.code, column_note.text, column_note.timestamp), (note.code, note.text, note.timestamp))
+
+	def test_behaves_like_a_dictionary(self):
+		generator = random.Random(265)
+		texts = ["Patient comes with headache.", "Blood pressure 120x80.", "Café au lait spots, no change.", ""]
+		code = 0
+		for step in range(3000):
+			operation = generator.random()
+			if operation < 0.5 or not self.notes:
+				code += 1
+				self.set(code, generator.choice(texts))
+			elif operation < 0.75:
+				self.set(generator.choice(list(self.notes)), generator.choice(texts) + f" {step}")
+			else:
+				self.delete(generator.choice(list(self.notes)))
+			if step % 500 == 0:
+				self.assertSameNotes()
+		self.assertSameNotes()
+		self.assertLess(len(self.columns.codes), 2 * len(self.notes) + 65, "deleted rows are compacted away")
+		self.assertNotIn(code + 1, self.columns)
+		self.assertIsNone(self.columns.get(code + 1))
+
+	def test_codes_out_of_order(self):
+		for code in (5, 6, 7):
+			self.set(code, f"note {code}")
+		self.delete(6)
+		self.set(6, "note 6, created again")
+		self.set(2, "note 2, replayed")
+		self.assertSameNotes()
+		self.columns.compact()
+		self.assertSameNotes()
+		self.assertEqual(self.columns[6].text, "note 6, created again")
+
+	def test_timestamps_keep_their_type(self):
+		timestamps = [
+			"2024-01-01 10:00:00",
+			datetime.datetime(2023, 5, 17, 8, 30, 12, 250),
+			datetime.datetime(1950, 2, 1),
+			datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+			None,
+		]
+		for code, timestamp in enumerate(timestamps, start=1):
+			self.set(code, f"note {code}", timestamp)
+		for code, timestamp in enumerate(timestamps, start=1):
+			self.assertEqual(self.columns[code].timestamp, timestamp)
+			self.assertIs(type(self.columns[code].timestamp), type(timestamp))
+
+	def test_returned_notes_are_copies(self):
+		self.set(1, "first note")
+		note = self.columns[1]
+		note.text = "changed"
+		self.assertEqual(self.columns[1].text, "first note")
+		self.columns[1] = note
+		self.assertEqual(self.columns[1].text, "changed")
+
+	def test_copy_is_independent(self):
+		for code in range(1, 4):
+			self.set(code, f"note {code}")
+		copied = self.columns.copy()
+		self.delete(2)
+		self.set(1, "first note, corrected")
+		self.assertEqual([note.text for note in copied.values()], ["note 1", "note 2", "note 3"])
+		self.assertSameNotes()
+
+if __name__ == '__main__':
+	main()
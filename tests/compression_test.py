@@ -0,0 +1,63 @@
+import lzma
+import random
+import string
+import zlib
+from unittest import TestCase
+from unittest import main
+from clinic.compression import TextCompressor, decompress_text
+from clinic.dao.columnar_notes import ColumnarNotes
+from clinic.note import Note
+
+LONG_TEXT = "Patient comes with headache and high blood pressure. Blood pressure 150x95, pulse 88. " * 8
+
+class TextCompressorTest(TestCase):
+
+	def test_long_texts_are_compressed(self):
+		for codec, level, decompress in (('zlib', None, zlib.decompress), ('zlib', 1, zlib.decompress), ('lzma', 0, lzma.decompress)):
+			with self.subTest(codec=codec, level=level):
+				compressed = TextCompressor(codec, level=level).compress(LONG_TEXT)
+				self.assertIsInstance(compressed, bytes)
+				self.assertLess(len(compressed), len(LONG_TEXT))
+				self.assertEqual(decompress(compressed).decode(), LONG_TEXT)
+				self.assertEqual(decompress_text(compressed), LONG_TEXT)
+
+	def test_short_and_incompressible_texts_stay_text(self):
+		compressor = TextCompressor(threshold=64)
+		self.assertEqual(compressor.compress("Patient feels better."), "Patient feels better.")
+		generator = random.Random(265)
+		incompressible = "".join(generator.choice(string.ascii_letters + string.digits + string.punctuation) for i in range(80))
+		self.assertEqual(compressor.compress(incompressible), incompressible)
+		self.assertEqual(TextCompressor(threshold=0).compress(""), "")
+		self.assertEqual(TextCompressor('lzma', threshold=0).compress("Café au lait spots."), "Café au lait spots.", "the xz header outweighs the savings")
+
+	def test_invalid_options(self):
+		with self.assertRaises(ValueError):
+			TextCompressor('bz2')
+		with self.assertRaises(ValueError):
+			TextCompressor('zlib', level=10)
+
+class CompressedNoteTest(TestCase):
+
+	def test_text_is_decompressed_when_read(self):
+		compressed = TextCompressor().compress(LONG_TEXT)
+		note = Note(1, compressed, "2024-01-01 10:00:00")
+		self.assertEqual(note.text, LONG_TEXT)
+		self.assertIs(note.stored_text, compressed, "reading the text leaves it compressed")
+		self.assertEqual(note.to_dict()['text'], compressed)
+		self.assertEqual(note, Note(1, LONG_TEXT, "2024-01-01 10:00:00"))
+		note.text = "Patient feels better."
+		self.assertEqual(note.stored_text, "Patient feels better.")
+
+	def test_columnar_notes_keep_texts_compressed(self):
+		compressor = TextCompressor(threshold=64)
+		notes = ColumnarNotes([Note(1, compressor.compress(LONG_TEXT), "2024-01-01 10:00:00"), Note(2, "Patient feels better.", "2024-01-02 10:00:00")])
+		self.assertLess(len(notes.text), len(LONG_TEXT))
+		self.assertIsInstance(notes[1].stored_text, bytes)
+		self.assertEqual([note.text for note in notes.values()], [LONG_TEXT, "Patient feels better."])
+		notes[2] = Note(2, compressor.compress(LONG_TEXT + " Follow up."), "2024-01-02 10:00:00")
+		del notes[1]
+		notes.compact()
+		self.assertEqual(notes.copy()[2].text, LONG_TEXT + " Follow up.")
+
+if __name__ == '__main__':
+	main()
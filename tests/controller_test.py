@@ -0,0 +1,519 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from unittest import main
+from clinic.controller import Controller
+from clinic.dao.timestamp_index import normalize_timestamp
+from clinic.patient import Patient
+from clinic.exception.illegal_access_exception import IllegalAccessException
+from clinic.exception.illegal_operation_exception import IllegalOperationException
+from clinic.exception.invalid_login_exception import InvalidLoginException
+from clinic.exception.no_current_patient_exception import NoCurrentPatientException
+from concurrent.futures import ThreadPoolExecutor
+
+class ControllerBulkImportTest(TestCase):
+	backend = 'json'
+
+	def setUp(self):
+		self.controller = Controller(autosave=False, backend=self.backend)
+		self.controller.login("user", "123456")
+		self.controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+
+	def test_create_patients(self):
+		created = self.controller.create_patients([
+			(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt"),
+			{'phn': 9790012000, 'name': "John Doe", 'birth_date': "2000-10-10", 'phone': "250 203 1010", 'email': "john.doe@gmail.com", 'address': "300 Moss St, Victoria"},
+		])
+		self.assertEqual(created, [
+			Patient(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt"),
+			Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"),
+		])
+		self.assertEqual(len(self.controller.list_patients()), 3)
+		self.assertEqual(self.controller.retrieve_patients("doe"), [created[1]])
+
+	def test_invalid_batch_is_rejected_as_a_whole(self):
+		with self.assertRaises(IllegalOperationException, msg="PHN already registered"):
+			self.controller.create_patients([
+				(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt"),
+				(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria"),
+			])
+		with self.assertRaises(IllegalOperationException, msg="PHN repeated within the batch"):
+			self.controller.create_patients([
+				(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt"),
+				(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt"),
+			])
+		with self.assertRaises(IllegalOperationException, msg="missing patient field"):
+			self.controller.create_patients([{'phn': 9792226666, 'name': "Jin Hu"}])
+		self.assertEqual(len(self.controller.list_patients()), 1, "a rejected batch must not insert anyone")
+
+		self.controller.logout()
+		with self.assertRaises(IllegalAccessException, msg="cannot import patients without logging in"):
+			self.controller.create_patients([])
+
+	def test_import_patients_from_csv(self):
+		with tempfile.TemporaryDirectory() as directory:
+			file_path = os.path.join(directory, 'patients.csv')
+			with open(file_path, 'w') as file:
+				file.write("phn,name,birth_date,phone,email,address\n")
+				file.write('9790012000,John Doe,2000-10-10,250 203 1010,john.doe@gmail.com,"300 Moss St, Victoria"\n')
+				file.write('9790014444,Mary Doe,1995-07-01,250 203 2020,mary.doe@gmail.com,"300 Moss St, Victoria"\n')
+			self.controller.import_patients(file_path)
+		self.assertEqual(self.controller.search_patient(9790014444), Patient(9790014444, "Mary Doe", "1995-07-01", "250 203 2020", "mary.doe@gmail.com", "300 Moss St, Victoria"))
+		self.assertEqual(len(self.controller.retrieve_patients("Doe")), 2)
+
+class ControllerTransactionTest(TestCase):
+	backend = 'json'
+	columnar_notes = False
+
+	def setUp(self):
+		self.controller = Controller(autosave=False, backend=self.backend, columnar_notes=self.columnar_notes)
+		self.controller.login("user", "123456")
+		self.controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+		self.controller.set_current_patient(9798884444)
+		self.controller.create_note("Patient comes with headache and high blood pressure.")
+
+	def test_commit_keeps_changes(self):
+		with self.controller.transaction():
+			self.controller.create_patient(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt")
+			self.controller.create_note("Patient complains of a strong headache on the back of neck.")
+		self.assertIsNotNone(self.controller.search_patient(9792226666))
+		self.assertEqual(len(self.controller.list_notes()), 2)
+
+	def test_exception_discards_every_change(self):
+		with self.assertRaises(ValueError):
+			with self.controller.transaction():
+				self.controller.create_patient(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt")
+				self.controller.update_note(1, "Patient comes with a mild headache.")
+				self.controller.create_note("Patient complains of a strong headache on the back of neck.")
+				raise ValueError("intake form rejected")
+
+		self.assertIsNone(self.controller.search_patient(9792226666), "the created patient is rolled back")
+		self.assertEqual(self.controller.retrieve_patients("Jin"), [], "the name index is rolled back too")
+		self.assertEqual([note.text for note in self.controller.list_notes()], ["Patient comes with headache and high blood pressure."])
+		self.assertEqual(self.controller.create_note("Patient feels better.").code, 2, "note codes are rolled back")
+
+	def test_rollback_unsets_patient_created_in_transaction(self):
+		with self.assertRaises(IllegalOperationException):
+			with self.controller.transaction():
+				self.controller.create_patient(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt")
+				self.controller.set_current_patient(9792226666)
+				self.controller.create_patient(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt")
+		self.assertIsNone(self.controller.get_current_patient())
+
+	def test_transactions_do_not_nest(self):
+		with self.controller.transaction():
+			with self.assertRaises(IllegalOperationException):
+				with self.controller.transaction():
+					pass
+
+class ControllerSQLiteBulkImportTest(ControllerBulkImportTest):
+	backend = 'sqlite'
+
+class ControllerSQLiteTransactionTest(ControllerTransactionTest):
+	backend = 'sqlite'
+
+class ControllerColumnarTransactionTest(ControllerTransactionTest):
+	columnar_notes = True
+
+class ControllerFailedCommitTest(TestCase):
+
+	def test_failed_commit_rolls_back_the_daos_not_committed(self):
+		with tempfile.TemporaryDirectory() as data_directory:
+			controller = Controller(autosave=True, data_directory=data_directory)
+			controller.login("user", "123456")
+			controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+			controller.set_current_patient(9798884444)
+			controller.create_note("Patient comes with headache and high blood pressure.")
+
+			def disk_full():
+				raise OSError("No space left on device")
+			controller.patients_dao.save_data = disk_full
+			with self.assertRaises(OSError):
+				with controller.transaction():
+					controller.create_patient(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt")
+					controller.create_note("Patient complains of a strong headache on the back of neck.")
+			del controller.patients_dao.save_data
+
+			self.assertIsNone(controller.search_patient(9792226666), "the patients that could not be written are discarded")
+			self.assertEqual(len(controller.list_notes()), 1, "the notes of the failed transaction are rolled back")
+			self.assertIsNone(controller.current_patient.record.notes_dao.pending_records)
+			controller.create_note("Patient feels better.")
+
+			# the notes file is not left locked, so another controller can read it
+			reloaded = Controller(autosave=True, data_directory=data_directory)
+			reloaded.login("user", "123456")
+			reloaded.set_current_patient(9798884444)
+			self.assertEqual([note.text for note in reloaded.list_notes()], ["Patient feels better.", "Patient comes with headache and high blood pressure."])
+
+class ControllerSessionTest(TestCase):
+	backend = 'json'
+
+	def setUp(self):
+		self.controller = Controller(autosave=False, backend=self.backend)
+		self.first = self.controller.open_session("user", "123456")
+		self.second = self.controller.open_session("ali", "@G00dPassw0rd")
+		self.first.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+		self.first.create_patient(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt")
+
+	def test_sessions_share_the_store(self):
+		self.assertEqual(self.second.search_patient(9798884444).name, "Ali Mesbah")
+		self.second.delete_patient(9792226666)
+		self.assertIsNone(self.first.search_patient(9792226666))
+		with self.assertRaises(IllegalAccessException, msg="the controller's own login is separate"):
+			self.controller.list_patients()
+
+	def test_sessions_have_their_own_current_patient(self):
+		self.first.set_current_patient(9798884444)
+		self.second.set_current_patient(9792226666)
+		self.first.create_note("Patient comes with headache.")
+		self.assertEqual(len(self.first.list_notes()), 1)
+		self.assertEqual(self.second.list_notes(), [])
+		self.second.logout()
+		with self.assertRaises(NoCurrentPatientException):
+			self.controller.open_session("ali", "@G00dPassw0rd").list_notes()
+		self.assertEqual(self.first.get_current_patient().phn, 9798884444)
+
+	def test_invalid_session_login(self):
+		with self.assertRaises(InvalidLoginException):
+			self.controller.open_session("user", "wrong")
+
+	def test_concurrent_sessions(self):
+		sessions = [self.controller.open_session("user", "123456") for i in range(8)]
+		for session in sessions:
+			session.set_current_patient(9798884444)
+
+		def work(session):
+			for i in range(20):
+				session.create_note(f"Note {i}")
+				session.retrieve_notes("note")
+				session.list_patients()
+
+		with ThreadPoolExecutor(max_workers=8) as executor:
+			list(executor.map(work, sessions))
+		notes = self.first.search_patient(9798884444).record.list_notes()
+		self.assertEqual(len(notes), 160)
+		self.assertEqual(sorted(note.code for note in notes), list(range(1, 161)), "every note got its own code")
+
+class ControllerSQLiteSessionTest(ControllerSessionTest):
+	backend = 'sqlite'
+
+class ControllerWriteBehindTest(TestCase):
+
+	def setUp(self):
+		self.controller = Controller(autosave=True, write_behind=True, flush_interval=3600)
+		self.controller.login("user", "123456")
+
+	def tearDown(self):
+		self.controller.flusher.close()
+		for state_file in ('clinic/patients.json', 'clinic/patients.journal', 'clinic/patients.lock'):
+			if os.path.exists(state_file):
+				os.remove(state_file)
+		for filename in os.listdir('clinic/records'):
+			os.remove(os.path.join('clinic/records', filename))
+
+	def test_logout_writes_the_changes(self):
+		self.controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+		self.controller.set_current_patient(9798884444)
+		for i in range(10):
+			self.controller.create_note(f"Patient visit {i}.")
+		self.assertEqual(Controller(autosave=True).patients_dao.list_patients(), [], "nothing is written on the request path")
+
+		self.controller.logout()
+		reloaded = Controller(autosave=True)
+		reloaded.login("user", "123456")
+		reloaded.set_current_patient(9798884444)
+		self.assertEqual(len(reloaded.list_notes()), 10)
+
+	def test_explicit_flush(self):
+		self.controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+		self.controller.flush()
+		self.assertEqual(len(Controller(autosave=True).patients_dao.list_patients()), 1)
+
+class ControllerMetricsTest(TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+		self.controller = Controller(autosave=True, metrics=True, data_directory=self.directory.name)
+		self.controller.login("user", "123456")
+
+	def test_stats(self):
+		self.controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+		self.controller.search_patient(9798884444)
+		self.controller.set_current_patient(9798884444)
+		self.controller.create_note("Patient comes with headache and high blood pressure.")
+		self.controller.create_note("Patient complains of a strong headache on the back of neck.")
+		with self.assertRaises(IllegalOperationException):
+			self.controller.delete_patient(9792226666)
+
+		stats = self.controller.stats()
+		controller = stats['operations']['controller']
+		self.assertEqual(controller['login']['calls'], 1)
+		self.assertEqual(controller['create_note']['calls'], 2)
+		self.assertEqual((controller['delete_patient']['calls'], controller['delete_patient']['errors']), (1, 1))
+		dao = stats['operations']['dao']
+		self.assertEqual(dao['save_data']['calls'], 1)
+		self.assertEqual(dao['autosave_note_to_file']['calls'], 2)
+		self.assertGreaterEqual(dao['load_data']['calls'], 2)
+		self.assertGreater(stats['bytes_written']['patients'], 0)
+		self.assertGreater(stats['bytes_written']['notes'], 0)
+		self.assertEqual(stats['sizes'], {'patients': 1, 'notes': 2})
+
+	def test_sessions_share_the_metrics(self):
+		session = self.controller.open_session("user", "123456")
+		session.list_patients()
+		self.controller.list_patients()
+		self.assertEqual(self.controller.stats()['operations']['controller']['list_patients']['calls'], 2)
+
+	def test_export_metrics(self):
+		path = os.path.join(self.directory.name, 'clinic.prom')
+		self.controller.list_patients()
+		self.controller.export_metrics(path)
+		with open(path) as file:
+			self.assertIn('clinic_operation_seconds_count{layer="controller",operation="list_patients"} 1', file.read())
+
+	def test_metrics_file(self):
+		path = os.path.join(self.directory.name, 'clinic.prom')
+		controller = Controller(metrics_file=path, metrics_interval=60)
+		controller.login("user", "123456")
+		controller.metrics_exporter.close()
+		with open(path) as file:
+			self.assertIn('operation="login"', file.read())
+
+	def test_metrics_are_off_by_default(self):
+		controller = Controller()
+		self.assertIsNone(controller.metrics)
+		# the operations are the class's own methods, not wrappers
+		self.assertNotIn('search_patient', vars(controller))
+		with self.assertRaises(IllegalOperationException):
+			controller.stats()
+
+class ControllerProfilingTest(TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+
+	def test_start_and_stop_profiling(self):
+		controller = Controller()
+		controller.login("user", "123456")
+		controller.start_profiling(self.directory.name, ['create_patient', 'search_patient'])
+		with self.assertRaises(IllegalOperationException):
+			controller.start_profiling(self.directory.name)
+		controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+		session = controller.open_session("user", "123456")
+		session.search_patient(9798884444)
+		controller.stop_profiling()
+
+		self.assertEqual(sorted(os.listdir(self.directory.name)), ['create_patient.pstats', 'search_patient.pstats'])
+		self.assertNotIn('search_patient', vars(controller))
+		self.assertNotIn('search_patient', vars(session))
+		with self.assertRaises(IllegalOperationException):
+			controller.stop_profiling()
+
+	def test_profiling_with_metrics(self):
+		controller = Controller(metrics=True)
+		controller.start_profiling(self.directory.name, ['login'], mode='sampling')
+		controller.login("user", "123456")
+		controller.stop_profiling()
+		# the metrics wrapper is back in place once profiling stops
+		controller.logout()
+		controller.login("user", "123456")
+		self.assertEqual(controller.stats()['operations']['controller']['login']['calls'], 2)
+
+	def test_profiling_from_the_environment(self):
+		os.environ['CLINIC_PROFILE'] = self.directory.name
+		os.environ['CLINIC_PROFILE_OPERATIONS'] = 'login'
+		try:
+			controller = Controller()
+		finally:
+			del os.environ['CLINIC_PROFILE']
+			del os.environ['CLINIC_PROFILE_OPERATIONS']
+		controller.login("user", "123456")
+		controller.stop_profiling()
+		self.assertEqual(os.listdir(self.directory.name), ['login.pstats'])
+
+	def test_invalid_profiling(self):
+		controller = Controller()
+		with self.assertRaises(IllegalOperationException):
+			controller.start_profiling(self.directory.name, ['drop_tables'])
+		with self.assertRaises(IllegalOperationException):
+			controller.start_profiling(self.directory.name, mode='perf')
+		self.assertIsNone(controller.profiler)
+
+class ControllerBackendTest(TestCase):
+
+	def test_unknown_backend(self):
+		with self.assertRaises(IllegalOperationException):
+			Controller(backend='csv')
+
+	def test_write_behind_needs_the_json_backend(self):
+		with self.assertRaises(IllegalOperationException):
+			Controller(backend='sqlite', write_behind=True)
+
+	def test_query_patients(self):
+		for backend in ('json', 'sqlite'):
+			with self.subTest(backend=backend), tempfile.TemporaryDirectory() as data_directory:
+				controller = Controller(autosave=True, backend=backend, data_directory=data_directory)
+				with self.assertRaises(IllegalAccessException):
+					controller.query_patients(email_domain="gmail.com")
+				controller.login("user", "123456")
+				controller.create_patients([
+					(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria"),
+					(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt"),
+					(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@Gmail.com", "300 Moss St, Victoria"),
+					(9790014444, "Mary Doe", "1995-07-01", "250 203 2020", "mary.doe@gmail.com", "300 Moss St, Victoria"),
+				])
+				query = controller.query_patients
+				self.assertEqual([patient.phn for patient in query(email_domain="gmail.com")], [9790012000, 9790014444, 9798884444])
+				self.assertEqual([patient.phn for patient in query(email_domain="gmail.com", birth_date_from="1990-01-01")], [9790012000, 9790014444])
+				self.assertEqual([patient.phn for patient in query(phone_prefix="250-203", birth_date_to="1999-12-31")], [9790014444])
+				self.assertEqual([patient.phn for patient in query(birth_date_from="2001-01-01", birth_date_to="2002-02-28")], [9792226666])
+				self.assertEqual(len(query()), 4)
+				self.assertEqual([patient.phn for patient in query(birth_date_from=datetime.date(2001, 1, 1))], [9792226666])
+				self.assertEqual([patient.phn for patient in query(birth_date_to=datetime.datetime(1980, 3, 3, 12))], [9798884444])
+				for invalid in ({'birth_date_from': "March 3rd"}, {'birth_date_to': 1980}, {'phone_prefix': "abc"}, {'phone_prefix': 250}):
+					with self.assertRaises(IllegalOperationException):
+						query(**invalid)
+				if backend == 'sqlite':
+					controller.patients_dao.close()
+
+	def test_pages(self):
+		for backend, columnar_notes in (('json', False), ('json', True), ('segments', False), ('sqlite', False)):
+			with self.subTest(backend=backend, columnar_notes=columnar_notes), tempfile.TemporaryDirectory() as data_directory:
+				controller = Controller(autosave=True, backend=backend, data_directory=data_directory, columnar_notes=columnar_notes)
+				controller.login("user", "123456")
+				phns = [9790010000 + 7 * i for i in range(25)]
+				controller.create_patients((phn, f"Patient {phn}", "1980-03-03", "250 301 6060", "patient@gmail.com", "500 Fairfield Rd, Victoria") for phn in reversed(phns))
+
+				first_page = controller.list_patients(10)
+				self.assertEqual([patient.phn for patient in first_page], phns[:10])
+				# patients created or deleted before the cursor do not move the next page
+				controller.create_patient(9790000001, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt")
+				controller.delete_patient(phns[3])
+				self.assertEqual([patient.phn for patient in controller.list_patients(10, after=first_page[-1].phn)], phns[10:20])
+				self.assertEqual([patient.phn for patient in controller.list_patients(10, after=phns[-1])], [])
+				self.assertEqual([patient.phn for patient in controller.iter_patients(page_size=4)], [9790000001] + phns[:3] + phns[4:])
+				self.assertEqual(len(controller.list_patients()), 25, "without a limit every patient is listed")
+
+				controller.set_current_patient(phns[0])
+				for code in range(1, 31):
+					controller.create_note(f"note {code}")
+				for code in (5, 6, 7, 28):
+					controller.delete_note(code)
+				first_page = controller.list_notes(5)
+				self.assertEqual([note.code for note in first_page], [30, 29, 27, 26, 25])
+				controller.create_note("note 31")
+				self.assertEqual([note.code for note in controller.list_notes(5, before_code=first_page[-1].code)], [24, 23, 22, 21, 20])
+				self.assertEqual([note.code for note in controller.list_notes(5, before_code=9)], [8, 4, 3, 2, 1])
+				self.assertEqual([note.code for note in controller.iter_notes(page_size=7)], [note.code for note in controller.list_notes()])
+				with self.assertRaises(IllegalOperationException):
+					controller.list_notes(0)
+				if backend == 'sqlite':
+					controller.patients_dao.close()
+
+	def test_time_ranges(self):
+		for backend, columnar_notes in (('json', False), ('json', True), ('segments', False), ('sqlite', False)):
+			with self.subTest(backend=backend, columnar_notes=columnar_notes), tempfile.TemporaryDirectory() as data_directory:
+				controller = Controller(autosave=True, backend=backend, data_directory=data_directory, columnar_notes=columnar_notes)
+				with self.assertRaises(IllegalAccessException):
+					controller.retrieve_clinic_notes_between()
+				controller.login("user", "123456")
+				controller.create_patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria")
+				controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+				# the notes are timestamped to the second, so the window starts a second early
+				start = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(seconds=1)
+				controller.set_current_patient(9790012000)
+				controller.create_note("Patient comes with headache and high blood pressure.")
+				controller.create_note("Patient complains of a strong headache on the back of neck.")
+				controller.set_current_patient(9798884444)
+				controller.create_note("Patient is taking medicines to control blood pressure.")
+				controller.create_note("Patient feels general improvement and no more headaches.")
+				controller.delete_note(1)
+
+				self.assertEqual([note.code for note in controller.notes_since(start)], [2])
+				self.assertEqual([note.code for note in controller.retrieve_notes_between(start.astimezone(datetime.timezone.utc), None)], [2])
+				self.assertEqual(controller.retrieve_notes_between(end=start), [])
+				self.assertEqual(controller.notes_since(datetime.date.today() + datetime.timedelta(days=1)), [])
+				# a date end bound includes the whole day
+				day = normalize_timestamp(controller.search_note(2).timestamp).date()
+				self.assertEqual([note.code for note in controller.retrieve_notes_between(day, day)], [2])
+				self.assertEqual([note.code for note in controller.retrieve_notes_between(day.isoformat(), day.isoformat())], [2])
+				self.assertEqual(len(controller.retrieve_clinic_notes_between(day, day)), 3)
+				self.assertEqual([(patient.phn, note.code) for patient, note in controller.retrieve_clinic_notes_between(start)],
+					[(9790012000, 1), (9790012000, 2), (9798884444, 2)])
+				self.assertEqual(controller.retrieve_clinic_notes_between(start - datetime.timedelta(days=1), start), [])
+				with self.assertRaises(IllegalOperationException):
+					controller.notes_since("last visit")
+				if backend == 'sqlite':
+					controller.patients_dao.close()
+
+	def test_note_compression(self):
+		long_text = "Patient comes with headache and high blood pressure. Blood pressure 150x95, pulse 88. " * 8
+		for backend, note_compression, columnar_notes in (('json', 'zlib', False), ('json', 'lzma', True), ('segments', 'zlib', False)):
+			with self.subTest(backend=backend, note_compression=note_compression, columnar_notes=columnar_notes), tempfile.TemporaryDirectory() as data_directory:
+				new_controller = lambda: Controller(autosave=True, backend=backend, data_directory=data_directory, columnar_notes=columnar_notes,
+					note_compression=note_compression, compression_level=1, compression_threshold=128)
+				controller = new_controller()
+				controller.login("user", "123456")
+				controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+				controller.set_current_patient(9798884444)
+				self.assertEqual(controller.create_note(long_text).text, long_text)
+				controller.create_note("Patient feels better.")
+				self.assertIsInstance(controller.search_note(1).stored_text, bytes)
+				self.assertEqual(controller.search_note(2).stored_text, "Patient feels better.", "short texts are not compressed")
+
+				reloaded = new_controller()
+				reloaded.login("user", "123456")
+				reloaded.set_current_patient(9798884444)
+				self.assertEqual([note.text for note in reloaded.list_notes()], ["Patient feels better.", long_text])
+				self.assertEqual([note.code for note in reloaded.retrieve_notes("blood pressure 150x95")], [1])
+		with self.assertRaises(IllegalOperationException):
+			Controller(backend='sqlite', note_compression='zlib')
+		with self.assertRaises(IllegalOperationException):
+			Controller(note_compression='bz2')
+		with self.assertRaises(IllegalOperationException):
+			Controller(note_compression='lzma', compression_level=12)
+
+	def test_columnar_notes(self):
+		for backend in ('json', 'segments'):
+			with self.subTest(backend=backend), tempfile.TemporaryDirectory() as data_directory:
+				controller = Controller(autosave=True, backend=backend, data_directory=data_directory, columnar_notes=True)
+				controller.login("user", "123456")
+				controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+				controller.set_current_patient(9798884444)
+				controller.create_note("Patient comes with headache and high blood pressure.")
+				controller.create_note("Patient complains of a strong headache on the back of neck.")
+				controller.update_note(1, "Patient comes with a mild headache.")
+				controller.delete_note(2)
+				controller.create_note("Patient says high BP is controlled, 120x80 in general.")
+
+				reloaded = Controller(autosave=True, backend=backend, data_directory=data_directory, columnar_notes=True)
+				reloaded.login("user", "123456")
+				reloaded.set_current_patient(9798884444)
+				self.assertEqual(reloaded.list_notes(), controller.list_notes())
+				self.assertEqual([note.text for note in reloaded.retrieve_notes("headache")], ["Patient comes with a mild headache."])
+		with self.assertRaises(IllegalOperationException):
+			Controller(backend='sqlite', columnar_notes=True)
+
+	def test_data_directory(self):
+		for backend in ('json', 'segments', 'sqlite'):
+			with self.subTest(backend=backend), tempfile.TemporaryDirectory() as data_directory:
+				controller = Controller(autosave=True, backend=backend, data_directory=data_directory)
+				controller.login("user", "123456")
+				controller.create_patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria")
+				controller.set_current_patient(9798884444)
+				controller.create_note("Patient comes with headache and high blood pressure.")
+				self.assertTrue(os.listdir(data_directory))
+
+				reloaded = Controller(autosave=True, backend=backend, data_directory=data_directory)
+				reloaded.login("user", "123456")
+				reloaded.set_current_patient(9798884444)
+				self.assertEqual(len(reloaded.list_notes()), 1)
+				if backend == 'sqlite':
+					controller.patients_dao.close()
+					reloaded.patients_dao.close()
+
+if __name__ == '__main__':
+	main()
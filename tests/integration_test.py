@@ -26,6 +26,12 @@ class IntegrationTest(TestCase):
 	def tearDown(self):
 		patients_file = 'clinic/patients.json'
 		patients_file_exists = os.path.exists(patients_file)
+		for state_file in ('clinic/patients.journal', 'clinic/patients.lock'):
+			if os.path.exists(state_file):
+				os.remove(state_file)
+		for database_file in ('clinic/clinic.db', 'clinic/clinic.db-wal', 'clinic/clinic.db-shm'):
+			if os.path.exists(database_file):
+				os.remove(database_file)
 		records_path = 'clinic/records'
 		if os.path.exists(records_path):
 			filenames = os.listdir(records_path)
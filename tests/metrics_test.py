@@ -0,0 +1,73 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest import main
+from clinic.metrics import Metrics, MetricsExporter
+
+class MetricsTest(TestCase):
+
+	def setUp(self):
+		self.metrics = Metrics()
+
+	def test_observe(self):
+		self.metrics.observe('controller', 'search_patient', 0.00005)
+		self.metrics.observe('controller', 'search_patient', 0.5, failed=True)
+		self.metrics.observe('controller', 'search_patient', 60.0)
+		entry = self.metrics.stats()['operations']['controller']['search_patient']
+		self.assertEqual(entry['calls'], 3)
+		self.assertEqual(entry['errors'], 1)
+		self.assertAlmostEqual(entry['seconds'], 60.50005)
+		# the buckets count the calls at or below their bound, like Prometheus does
+		self.assertEqual(entry['buckets'][0.00001], 0)
+		self.assertEqual(entry['buckets'][0.0001], 1)
+		self.assertEqual(entry['buckets'][1.0], 2)
+		self.assertEqual(entry['buckets'][10.0], 2)
+		self.assertEqual(entry['buckets'][float('inf')], 3)
+
+	def test_timed(self):
+		def fail():
+			raise ValueError()
+		self.assertEqual(self.metrics.timed('dao', 'add', lambda a, b: a + b)(1, 2), 3)
+		with self.assertRaises(ValueError):
+			self.metrics.timed('dao', 'fail', fail)()
+		operations = self.metrics.stats()['operations']['dao']
+		self.assertEqual((operations['add']['calls'], operations['add']['errors']), (1, 0))
+		self.assertEqual((operations['fail']['calls'], operations['fail']['errors']), (1, 1))
+
+	def test_bytes_and_sizes(self):
+		self.metrics.wrote('notes', 100)
+		self.metrics.wrote('notes', 50)
+		self.metrics.size('patients', 3)
+		self.metrics.size('notes', 4, key=9798884444)
+		self.metrics.size('notes', 2, key=9792226666)
+		self.metrics.size('notes', 1, key=9798884444)
+		stats = self.metrics.stats()
+		self.assertEqual(stats['bytes_written'], {'notes': 150})
+		self.assertEqual(stats['sizes'], {'patients': 3, 'notes': 3})
+
+	def test_prometheus(self):
+		self.metrics.observe('controller', 'create_note', 0.002)
+		self.metrics.wrote('patients', 1024)
+		self.metrics.size('patients', 7)
+		text = self.metrics.prometheus()
+		self.assertIn('# TYPE clinic_operation_seconds histogram\n', text)
+		self.assertIn('clinic_operation_seconds_bucket{layer="controller",operation="create_note",le="0.001"} 0\n', text)
+		self.assertIn('clinic_operation_seconds_bucket{layer="controller",operation="create_note",le="0.01"} 1\n', text)
+		self.assertIn('clinic_operation_seconds_bucket{layer="controller",operation="create_note",le="+Inf"} 1\n', text)
+		self.assertIn('clinic_operation_seconds_count{layer="controller",operation="create_note"} 1\n', text)
+		self.assertIn('clinic_operation_errors_total{layer="controller",operation="create_note"} 0\n', text)
+		self.assertIn('clinic_bytes_written_total{file="patients"} 1024\n', text)
+		self.assertIn('clinic_dataset_size{dataset="patients"} 7\n', text)
+
+	def test_exporter(self):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'clinic.prom')
+			exporter = MetricsExporter(self.metrics, path, interval=60)
+			self.metrics.observe('controller', 'login', 0.001)
+			exporter.close()
+			with open(path) as file:
+				self.assertIn('operation="login"', file.read())
+			self.assertFalse(os.path.exists(path + '.tmp'))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,328 @@
+import datetime
+import os
+import pickle
+import tempfile
+from unittest import TestCase
+from unittest import main
+from clinic.compression import TextCompressor
+from clinic.note import Note
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.dao import file_lock
+from clinic.dao.write_behind_flusher import WriteBehindFlusher
+from multiprocessing import Pool
+from unittest import skipIf
+
+class NoteDAOPickleJournalTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+
+	def tearDown(self):
+		self.temporary_directory.cleanup()
+
+	def new_dao(self, checkpoint_interval=100):
+		return NoteDAOPickle(9790012000, autosave=True, journal=True, checkpoint_interval=checkpoint_interval, data_directory=self.data_directory)
+
+	def test_changes_are_logged_and_replayed(self):
+		dao = self.new_dao()
+		dao.create_note("Patient comes with headache and high blood pressure.")
+		dao.create_note("Patient complains of a strong headache on the back of neck.")
+		dao.create_note("Patient says high BP is controlled, 120x80 in general.")
+		dao.update_note(2, "Patient complains of a mild headache.")
+		dao.delete_note(1)
+
+		self.assertFalse(os.path.exists(dao.notes_file_path), "no checkpoint should be written before the interval")
+		self.assertEqual(dao.log_size, 5)
+
+		reloaded = self.new_dao()
+		self.assertEqual(reloaded.list_notes(), [Note(3, "Patient says high BP is controlled, 120x80 in general."), Note(2, "Patient complains of a mild headache.")])
+		self.assertEqual(reloaded.counter, 4)
+
+	def test_checkpoint_bounds_the_log(self):
+		dao = self.new_dao(checkpoint_interval=3)
+		for i in range(5):
+			dao.create_note(f"note {i + 1}")
+		dao.compaction_thread.join()
+
+		self.assertTrue(os.path.exists(dao.notes_file_path), "a checkpoint should be written in the background")
+		self.assertFalse(os.path.exists(dao.old_log_file_path), "the rotated log is dropped once its checkpoint is written")
+
+		reloaded = self.new_dao(checkpoint_interval=3)
+		self.assertEqual([note.code for note in reloaded.list_notes()], [5, 4, 3, 2, 1])
+		self.assertEqual(reloaded.log_size, 2, "only the changes after the last checkpoint are replayed")
+
+	def test_unfinished_checkpoint_replays_rotated_log(self):
+		dao = self.new_dao()
+		dao.create_note("first note")
+		dao.create_note("second note")
+		# simulate a crash after the log rotation but before the checkpoint was written
+		os.replace(dao.log_file_path, dao.old_log_file_path)
+		dao.update_note(1, "first note, corrected")
+
+		reloaded = self.new_dao()
+		self.assertEqual(reloaded.list_notes(), [Note(2, "second note"), Note(1, "first note, corrected")])
+
+	def test_transaction_defers_log_records(self):
+		dao = self.new_dao()
+		dao.create_note("first note")
+		dao.begin()
+		dao.create_note("second note")
+		dao.update_note(1, "first note, corrected")
+		self.assertEqual(dao.log_size, 1, "nothing is logged before commit")
+		dao.commit()
+		self.assertEqual(dao.log_size, 3)
+		self.assertEqual(self.new_dao().list_notes(), [Note(2, "second note"), Note(1, "first note, corrected")])
+
+		dao.begin()
+		dao.update_note(1, "discarded")
+		dao.delete_note(2)
+		dao.rollback()
+		self.assertEqual(dao.list_notes(), [Note(2, "second note"), Note(1, "first note, corrected")])
+		self.assertEqual(dao.log_size, 3)
+
+	def test_torn_log_record_is_discarded(self):
+		dao = self.new_dao()
+		dao.create_note("first note")
+		with open(dao.log_file_path, 'ab') as file:
+			file.write(b'\x80\x04\x95')
+
+		reloaded = self.new_dao()
+		self.assertEqual(reloaded.list_notes(), [Note(1, "first note")])
+		reloaded.create_note("second note")
+		self.assertEqual(len(self.new_dao().list_notes()), 2, "appends after a torn record should still be replayed")
+
+class NoteDAOPickleColumnarJournalTest(NoteDAOPickleJournalTest):
+
+	def new_dao(self, checkpoint_interval=100):
+		return NoteDAOPickle(9790012000, autosave=True, journal=True, checkpoint_interval=checkpoint_interval, data_directory=self.data_directory,
+			columnar=True)
+
+class NoteDAOPickleFileTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+
+	def tearDown(self):
+		self.temporary_directory.cleanup()
+
+	def test_notes_are_saved_as_dictionaries(self):
+		dao = NoteDAOPickle(9790012000, autosave=True, data_directory=self.data_directory)
+		note = dao.create_note("Patient comes with headache and high blood pressure.")
+		self.assertFalse(hasattr(note, '__dict__'))
+		with open(dao.notes_file_path, 'rb') as file:
+			self.assertEqual(pickle.load(file), [{'code': 1, 'text': note.text, 'timestamp': note.timestamp}])
+		self.assertEqual(NoteDAOPickle(9790012000, autosave=True, data_directory=self.data_directory).list_notes(), [note])
+
+	def test_notes_pickled_before_slots_are_loaded(self):
+		legacy_note = LegacyNote(3, "Patient feels better.", "2024-01-02 10:00:00")
+		data = pickle.dumps([legacy_note], protocol=2).replace(f"{__name__}\nLegacyNote\n".encode(), b"clinic.note\nNote\n")
+		dao = NoteDAOPickle(9790012000, autosave=False, data_directory=self.data_directory)
+		with open(dao.notes_file_path, 'wb') as file:
+			file.write(data)
+		dao.load_data()
+		note = dao.search_note(3)
+		self.assertIsInstance(note, Note)
+		self.assertEqual((note.code, note.text, note.timestamp), (3, "Patient feels better.", "2024-01-02 10:00:00"))
+		self.assertEqual(repr(pickle.loads(pickle.dumps(note))), repr(note))
+
+	def test_time_ranges_over_mixed_timestamps(self):
+		notes = [
+			{'code': 1, 'text': "first visit", 'timestamp': datetime.datetime(2023, 12, 30, 9, 15)},
+			{'code': 2, 'text': "follow up", 'timestamp': "2024-01-02 10:00:00"},
+			{'code': 3, 'text': "lab results", 'timestamp': datetime.datetime(2024, 1, 2, 9, 59, 59)},
+			{'code': 4, 'text': "second visit", 'timestamp': "2024-01-05 16:30:00"},
+		]
+		for columnar in (False, True):
+			with self.subTest(columnar=columnar):
+				dao = NoteDAOPickle(9790012000, autosave=True, data_directory=self.data_directory, columnar=columnar)
+				with open(dao.notes_file_path, 'wb') as file:
+					pickle.dump(notes, file)
+				dao.load_data()
+				self.assertEqual([note.code for note in dao.retrieve_notes_between("2024-01-01", "2024-01-02 10:00:00")], [3, 2])
+				self.assertEqual([note.code for note in dao.retrieve_notes_between(end=datetime.date(2024, 1, 1))], [1])
+				self.assertEqual([note.code for note in dao.retrieve_notes_between(end=datetime.date(2024, 1, 2))], [1, 3, 2], "the end date is included")
+				self.assertEqual([note.code for note in dao.notes_since(datetime.datetime(2024, 1, 2, 10))], [2, 4])
+				dao.delete_note(2)
+				new_note = dao.create_note("third visit")
+				self.assertEqual([note.code for note in dao.notes_since(datetime.date(2024, 1, 2))], [3, 4, new_note.code])
+				self.assertEqual(NoteDAOPickle(9790012000, autosave=True, data_directory=self.data_directory, columnar=columnar).notes_since("2024-01-02"),
+					dao.notes_since("2024-01-02"))
+
+	def test_long_texts_are_saved_compressed(self):
+		long_text = "Patient comes with headache and high blood pressure. Blood pressure 150x95, pulse 88. " * 8
+		for journal, columnar in ((False, False), (True, False), (True, True)):
+			with self.subTest(journal=journal, columnar=columnar), tempfile.TemporaryDirectory() as data_directory:
+				new_dao = lambda: NoteDAOPickle(9790012000, autosave=True, journal=journal, data_directory=data_directory, columnar=columnar,
+					compressor=TextCompressor(threshold=256))
+				dao = new_dao()
+				dao.create_note(long_text)
+				dao.create_note("Patient feels better.")
+				dao.begin()
+				dao.update_note(2, long_text + " Follow up in a week.")
+				dao.commit()
+				dao.begin()
+				dao.update_note(1, "discarded")
+				dao.rollback()
+				self.assertIsInstance(dao.search_note(1).stored_text, bytes, "a rollback restores the compressed text")
+
+				with open(dao.log_file_path if journal else dao.notes_file_path, 'rb') as file:
+					data = file.read()
+				self.assertNotIn(b"headache", data)
+				self.assertLess(len(data), len(long_text))
+				reloaded = new_dao()
+				self.assertEqual([note.text for note in reloaded.list_notes()], [long_text + " Follow up in a week.", long_text])
+				self.assertEqual([note.code for note in reloaded.retrieve_notes("PULSE 88")], [1, 2])
+				self.assertEqual(reloaded.text_index.texts, {}, "the search index does not hold the texts uncompressed")
+				reloaded.update_note(1, "Patient feels better.")
+				reloaded.delete_note(2)
+				self.assertEqual(reloaded.retrieve_notes("PULSE 88"), [])
+				self.assertEqual([note.code for note in reloaded.retrieve_notes("better")], [1])
+
+class LegacyNote():
+	''' a note as it was pickled while notes still had a __dict__ '''
+
+	def __init__(self, code, text, timestamp):
+		self.code = code
+		self.text = text
+		self.timestamp = timestamp
+
+class NoteDAOPickleSearchTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.dao = NoteDAOPickle(9790012000, data_directory=self.temporary_directory.name)
+		self.dao.create_note("Patient comes with headache and high blood pressure.")
+		self.dao.create_note("Patient complains of a strong headache on the back of neck.")
+		self.dao.create_note("Patient is taking medicines to control blood pressure.")
+
+	def tearDown(self):
+		self.temporary_directory.cleanup()
+
+	def test_retrieve_notes_follows_note_changes(self):
+		self.assertEqual([note.code for note in self.dao.retrieve_notes("HEADACHE")], [1, 2])
+		self.dao.create_note("Patient feels general improvement and no more headaches.")
+		self.dao.update_note(1, "Patient comes with high blood pressure.")
+		self.dao.delete_note(2)
+		self.assertEqual([note.code for note in self.dao.retrieve_notes("headache")], [4])
+		self.assertEqual([note.code for note in self.dao.retrieve_notes("blood pressure")], [1, 3])
+		self.assertEqual([note.code for note in self.dao.retrieve_notes("b")], [1, 3])
+		self.assertEqual(self.dao.retrieve_notes("fever"), [])
+
+	def test_code_operations_keep_newest_first_order(self):
+		self.assertTrue(self.dao.delete_note(2))
+		self.assertFalse(self.dao.delete_note(2), "a deleted note cannot be deleted again")
+		self.assertFalse(self.dao.update_note(2, "missing note"))
+		self.assertIsNone(self.dao.search_note(2))
+		self.assertTrue(self.dao.update_note(1, "Patient comes with high blood pressure."))
+		self.dao.create_note("Patient feels general improvement and no more headaches.")
+		self.assertEqual([note.code for note in self.dao.list_notes()], [4, 3, 1])
+		self.assertEqual(self.dao.search_note(1).text, "Patient comes with high blood pressure.")
+
+	def test_pages_skip_deleted_notes(self):
+		for code in range(4, 1001):
+			self.dao.create_note(f"note {code}")
+		self.assertEqual([note.code for note in self.dao.list_notes(3)], [1000, 999, 998])
+		for code in range(60, 1000):
+			self.dao.delete_note(code)
+		self.assertEqual([note.code for note in self.dao.list_notes(3)], [1000, 59, 58])
+		self.assertEqual([note.code for note in self.dao.list_notes(3, before_code=700)], [59, 58, 57])
+		self.assertLess(len(self.dao.code_index.codes), 200, "the deleted codes are not walked over again")
+
+class NoteDAOPickleWriteBehindTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+		self.flusher = WriteBehindFlusher(interval=3600, threshold=1000)
+
+	def tearDown(self):
+		self.flusher.close()
+		self.temporary_directory.cleanup()
+
+	def new_dao(self, journal=False, flusher=None):
+		return NoteDAOPickle(9790012000, autosave=True, journal=journal, data_directory=os.path.join(self.data_directory, str(journal)), flusher=flusher)
+
+	def test_changes_wait_for_the_flush(self):
+		for journal in (False, True):
+			with self.subTest(journal=journal):
+				dao = self.new_dao(journal, self.flusher)
+				note = dao.create_note("Patient comes with headache and high blood pressure.")
+				for i in range(50):
+					dao.update_note(note.code, f"Patient comes with headache, visit {i}.")
+				self.assertEqual(self.new_dao(journal).list_notes(), [], "nothing is written on the request path")
+				self.flusher.flush()
+				self.assertEqual(self.new_dao(journal).search_note(note.code).text, "Patient comes with headache, visit 49.")
+
+	def test_flush_keeps_changes_of_other_processes(self):
+		behind, other = self.new_dao(flusher=self.flusher), self.new_dao()
+		note = behind.create_note("Patient comes with headache and high blood pressure.")
+		behind.update_note(note.code, "Patient comes with headache.")
+		other.create_note("Patient feels better.")
+		self.flusher.flush()
+		self.assertEqual(note.code, 2, "the code taken by the other process meanwhile is given up")
+		self.assertEqual([(note.code, note.text) for note in self.new_dao().list_notes()], [(2, "Patient comes with headache."), (1, "Patient feels better.")])
+		self.assertEqual(behind.create_note("Patient is discharged.").code, 3)
+
+def create_notes_in_process(data_directory, journal):
+	dao = NoteDAOPickle(9790012000, autosave=True, journal=journal, checkpoint_interval=7, data_directory=data_directory)
+	for i in range(20):
+		dao.create_note(f"Note {i}")
+	dao.compact()
+
+class NoteDAOPickleSharedFilesTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+
+	def tearDown(self):
+		self.temporary_directory.cleanup()
+
+	def new_dao(self, journal=False):
+		return NoteDAOPickle(9790012000, autosave=True, journal=journal, data_directory=os.path.join(self.data_directory, str(journal)))
+
+	def test_changes_by_another_dao_are_reloaded(self):
+		for journal in (False, True):
+			with self.subTest(journal=journal):
+				first, second = self.new_dao(journal), self.new_dao(journal)
+				note = first.create_note("Patient comes with headache and high blood pressure.")
+				self.assertEqual(second.search_note(note.code), note)
+				self.assertEqual(second.create_note("Patient feels better.").code, note.code + 1, "codes continue after the other DAO's")
+				first.update_note(note.code, "Patient comes with headache.")
+				self.assertEqual([found.code for found in second.retrieve_notes("headache")], [note.code])
+				self.assertEqual(len(first.list_notes()), len(self.new_dao(journal).list_notes()))
+
+	def test_log_rotated_before_its_checkpoint_is_reloaded(self):
+		first, second = self.new_dao(True), self.new_dao(True)
+		first.create_note("Patient comes with headache and high blood pressure.")
+		# another process's compaction moved the log aside and has not written its checkpoint
+		# yet, so neither the log nor the notes file the second DAO last saw exist
+		with first.file_lock.exclusive():
+			os.replace(first.log_file_path, first.old_log_file_path)
+			first.file_lock.advance()
+		self.assertEqual(second.create_note("Patient feels better.").code, 2)
+		self.assertEqual(len(self.new_dao(True).list_notes()), 2)
+
+	def test_daos_of_one_process_share_the_file_lock(self):
+		first, second = self.new_dao(), self.new_dao()
+		self.new_dao().create_note("Patient comes with headache and high blood pressure.")
+		first.begin()
+		first.create_note("Patient feels better.")
+		# the second DAO is stale, it reloads under the lock the transaction holds
+		self.assertEqual(len(second.list_notes()), 1)
+		first.commit()
+		self.assertEqual(len(second.list_notes()), 2)
+
+	@skipIf(file_lock.fcntl is None, "advisory file locks need fcntl")
+	def test_concurrent_processes_do_not_lose_writes(self):
+		for journal in (False, True):
+			with self.subTest(journal=journal):
+				with Pool(4) as pool:
+					pool.starmap(create_notes_in_process, [(os.path.join(self.data_directory, str(journal)), journal)] * 4)
+				codes = [note.code for note in self.new_dao(journal).list_notes()]
+				self.assertEqual(sorted(codes), list(range(1, 81)), "every note kept, each with its own code")
+
+if __name__ == '__main__':
+	main()
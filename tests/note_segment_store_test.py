@@ -0,0 +1,123 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest import main
+from clinic.note import Note
+from clinic.dao.note_dao_segment import NoteDAOSegment
+from clinic.dao.note_segment_store import NoteSegmentStore
+
+class NoteSegmentStoreTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+		self.store = NoteSegmentStore(self.data_directory)
+
+	def tearDown(self):
+		self.store.close()
+		self.temporary_directory.cleanup()
+
+	def reopen(self, **options):
+		self.store.close()
+		self.store = NoteSegmentStore(self.data_directory, **options)
+		return self.store
+
+	def segment_files(self):
+		return [filename for filename in os.listdir(self.data_directory) if filename.endswith('.seg')]
+
+	def test_patients_share_segment_files(self):
+		for phn in range(9790000000, 9790000050):
+			dao = NoteDAOSegment(phn, self.store, autosave=True)
+			dao.create_note(f"Patient {phn} comes with headache.")
+			dao.create_note(f"Patient {phn} says high BP is controlled.")
+			dao.update_note(1, f"Patient {phn} comes with a mild headache.")
+		self.assertEqual(self.segment_files(), ['notes-000001.seg'], "every patient's notes go to one segment")
+
+		dao = NoteDAOSegment(9790000007, self.reopen(), autosave=True)
+		self.assertEqual(dao.list_notes(), [Note(2, "Patient 9790000007 says high BP is controlled."), Note(1, "Patient 9790000007 comes with a mild headache.")])
+		self.assertTrue(dao.delete_note(2))
+		self.assertEqual(NoteDAOSegment(9790000007, self.reopen(), autosave=True).list_notes(), [Note(1, "Patient 9790000007 comes with a mild headache.")])
+		self.assertEqual(NoteDAOSegment(9790000008, self.store, autosave=True).counter, 3)
+
+	def test_checkpoint_bounds_replayed_records(self):
+		dao = NoteDAOSegment(9790012000, self.store, autosave=True, checkpoint_interval=10)
+		for i in range(25):
+			dao.create_note(f"note {i + 1}")
+		self.assertLess(self.store.record_count(9790012000), 10)
+		reloaded = NoteDAOSegment(9790012000, self.reopen(), autosave=True)
+		self.assertEqual([note.code for note in reloaded.list_notes()], list(range(25, 0, -1)))
+
+	def test_segments_roll_over_and_compact(self):
+		store = self.reopen(segment_size=256)
+		dao = NoteDAOSegment(9790012000, store, autosave=True, checkpoint_interval=5)
+		other = NoteDAOSegment(9790014444, store, autosave=True)
+		for i in range(20):
+			dao.create_note(f"note {i + 1}")
+		other.create_note("Patient complains of a strong headache on the back of neck.")
+		self.assertGreater(len(self.segment_files()), 1, "a full segment should start a new one")
+
+		store.compact()
+		self.assertEqual([note.code for note in NoteDAOSegment(9790012000, store).list_notes()], list(range(20, 0, -1)))
+		store = self.reopen(segment_size=256)
+		self.assertEqual([note.code for note in NoteDAOSegment(9790012000, store).list_notes()], list(range(20, 0, -1)))
+		self.assertEqual(NoteDAOSegment(9790014444, store).list_notes(), [Note(1, "Patient complains of a strong headache on the back of neck.")])
+
+	def test_checkpoints_compact_the_segments(self):
+		store = self.reopen(segment_size=4096, compaction_min_size=4096)
+		dao = NoteDAOSegment(9790012000, store, autosave=True, checkpoint_interval=5)
+		other = NoteDAOSegment(9790014444, store, autosave=True)
+		other.create_note("Patient complains of a strong headache on the back of neck.")
+		for i in range(200):
+			dao.create_note(f"note {i + 1}")
+			self.assertLessEqual(sum(store.dead.values()), sum(store.indexed.values()) * store.compaction_ratio + 4096,
+				"the records replaced by checkpoints are reclaimed")
+		self.assertNotIn('notes-000001.seg', self.segment_files(), "the first segments were compacted away")
+
+		dead = store.dead
+		store = self.reopen(segment_size=4096, compaction_min_size=4096)
+		self.assertEqual(store.dead, dead, "the checkpoints are recognized when the segments are indexed")
+		self.assertLess(store.record_count(9790012000), 5)
+		self.assertEqual([note.code for note in NoteDAOSegment(9790012000, store).list_notes()], list(range(200, 0, -1)))
+		self.assertEqual(NoteDAOSegment(9790014444, store).list_notes(), [Note(1, "Patient complains of a strong headache on the back of neck.")])
+
+	def test_torn_record_is_discarded(self):
+		dao = NoteDAOSegment(9790012000, self.store, autosave=True)
+		dao.create_note("first note")
+		self.store.close()
+		with open(os.path.join(self.data_directory, 'notes-000001.seg'), 'ab') as file:
+			file.write(b'\x00\x0a\x00\x00')
+		dao = NoteDAOSegment(9790012000, self.reopen(), autosave=True)
+		dao.create_note("second note")
+		self.assertEqual(NoteDAOSegment(9790012000, self.reopen()).list_notes(), [Note(2, "second note"), Note(1, "first note")])
+
+	def test_stores_share_segments(self):
+		other = NoteSegmentStore(self.data_directory)
+		try:
+			self.store.append(9790012000, [('create', 1, "first note")])
+			other.append(9790014444, [('create', 1, "other patient's note")])
+			self.store.append(9790012000, [('create', 2, "second note")])
+			self.assertEqual(self.store.read(9790012000), [('create', 1, "first note"), ('create', 2, "second note")],
+				"an append goes after the records of other stores")
+			self.assertEqual(other.read(9790012000), [('create', 1, "first note"), ('create', 2, "second note")])
+			self.assertEqual(self.store.read(9790014444), [('create', 1, "other patient's note")])
+
+			other.compact()
+			self.store.append(9790014444, [('create', 2, "after the compaction")])
+			self.assertEqual(other.read(9790014444), [('create', 1, "other patient's note"), ('create', 2, "after the compaction")])
+		finally:
+			other.close()
+
+	def test_daos_on_shared_segments_see_each_other(self):
+		other = NoteSegmentStore(self.data_directory)
+		try:
+			dao = NoteDAOSegment(9790012000, self.store, autosave=True)
+			other_dao = NoteDAOSegment(9790012000, other, autosave=True)
+			dao.create_note("first note")
+			self.assertEqual(other_dao.create_note("second note").code, 2, "codes are not reused across stores")
+			self.assertTrue(dao.update_note(2, "second note, updated"))
+			self.assertEqual(other_dao.list_notes(), [Note(2, "second note, updated"), Note(1, "first note")])
+		finally:
+			other.close()
+
+if __name__ == '__main__':
+	main()
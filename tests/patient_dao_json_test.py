@@ -0,0 +1,323 @@
+import io
+import os
+import json
+import tempfile
+from unittest import TestCase
+from unittest import main
+from clinic.patient import Patient
+from clinic.dao.patient_dao_json import PatientDAOJSON
+from clinic.dao.patient_decoder import PatientDecoder
+from clinic.dao.note_dao_pickle import NoteDAOPickle
+from clinic.exception.illegal_operation_exception import IllegalOperationException
+from clinic.dao import file_lock
+from clinic.dao.write_behind_flusher import WriteBehindFlusher
+from multiprocessing import Pool
+from unittest import skipIf
+
+class PatientDAOJSONJournalTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+		self.dao = self.new_dao()
+
+	def tearDown(self):
+		self.temporary_directory.cleanup()
+
+	def new_dao(self, compaction_threshold=1000):
+		return PatientDAOJSON(autosave=True, journal=True, compaction_threshold=compaction_threshold, data_directory=self.data_directory)
+
+	def read_snapshot(self):
+		with open(os.path.join(self.data_directory, 'patients.json')) as file:
+			return json.load(file)
+
+	def test_mutations_are_journaled_and_replayed(self):
+		self.dao.create_patient(Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		self.dao.create_patient(Patient(9790014444, "Mary Doe", "1995-07-01", "250 203 2020", "mary.doe@gmail.com", "300 Moss St, Victoria"))
+		self.dao.update_patient(9790012000, Patient(9790019999, "John Doe", "2000-10-10", "278 999 4041", "john.doe@hotmail.com", "205 Foul Bay Rd, Oak Bay"))
+		self.dao.delete_patient(9790014444)
+
+		# the snapshot is untouched, only the journal grew
+		self.assertEqual(self.read_snapshot(), [], "mutations should not rewrite the snapshot")
+		self.assertEqual(self.dao.journal_size, 4)
+
+		reloaded = self.new_dao()
+		self.assertEqual(list(reloaded.patients.keys()), [9790019999], "journal replay should rebuild the current state")
+		self.assertEqual(reloaded.search_patient(9790019999).phone, "278 999 4041")
+
+	def test_compaction_folds_journal_into_snapshot(self):
+		dao = self.new_dao(compaction_threshold=3)
+		dao.create_patient(Patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria"))
+		dao.create_patient(Patient(9792226666, "Jin Hu", "2002-02-28", "278 222 4545", "jinhu@outlook.com", "200 Admirals Rd, Esquimalt"))
+		dao.create_patient(Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+
+		self.assertFalse(os.path.exists(os.path.join(self.data_directory, 'patients.journal')), "journal should be removed after compaction")
+		self.assertEqual(len(self.read_snapshot()), 3, "compaction should write every patient to the snapshot")
+		self.assertEqual(dao.journal_size, 0)
+
+		dao.delete_patient(9792226666)
+		reloaded = self.new_dao(compaction_threshold=3)
+		self.assertEqual(sorted(reloaded.patients.keys()), [9790012000, 9798884444])
+
+	def test_bulk_create_is_one_journal_write(self):
+		patients = [Patient(9790000000 + i, f"Patient {i}", "2000-10-10", "250 203 1010", "patient@gmail.com", "300 Moss St, Victoria") for i in range(5)]
+		self.dao.create_patients(patients)
+		self.assertEqual(self.dao.journal_size, 5)
+		self.assertEqual(list(self.new_dao().patients.values()), patients)
+
+		self.dao.compact()
+		dao = PatientDAOJSON(autosave=True, data_directory=self.data_directory)
+		dao.create_patients([Patient(9791111111, "Mary Doe", "1995-07-01", "250 203 2020", "mary.doe@gmail.com", "300 Moss St, Victoria")])
+		self.assertEqual(len(self.read_snapshot()), 6, "without the journal the batch is written with one snapshot")
+
+	def test_transaction_commits_with_one_write(self):
+		dao = PatientDAOJSON(autosave=True, data_directory=self.data_directory)
+		writes = []
+		save_data = dao.save_data
+		dao.save_data = lambda: writes.append(save_data())
+		dao.begin()
+		dao.create_patient(Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		dao.create_patient(Patient(9790014444, "Mary Doe", "1995-07-01", "250 203 2020", "mary.doe@gmail.com", "300 Moss St, Victoria"))
+		dao.delete_patient(9790012000)
+		self.assertEqual(writes, [], "nothing is written before commit")
+		dao.commit()
+		self.assertEqual(len(writes), 1)
+		self.assertEqual([patient['phn'] for patient in self.read_snapshot()], [9790014444])
+
+	def test_torn_journal_record_is_discarded(self):
+		self.dao.create_patient(Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		with open(os.path.join(self.data_directory, 'patients.journal'), 'a') as file:
+			file.write('{"op": "delete", "ph')
+
+		reloaded = self.new_dao()
+		self.assertIsNotNone(reloaded.search_patient(9790012000), "an interrupted record must not be applied")
+		reloaded.create_patient(Patient(9790014444, "Mary Doe", "1995-07-01", "250 203 2020", "mary.doe@gmail.com", "300 Moss St, Victoria"))
+		self.assertEqual(len(self.new_dao().patients), 2, "appends after a torn record should still be replayed")
+
+class PatientDAOJSONLoadTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+		dao = PatientDAOJSON(autosave=True, data_directory=self.data_directory)
+		dao.create_patient(Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		dao.create_patient(Patient(9790014444, "Mary Doe", "1995-07-01", "250 203 2020", "mary.doe@gmail.com", "300 Moss St, Victoria"))
+
+	def tearDown(self):
+		self.temporary_directory.cleanup()
+
+	def test_notes_are_not_loaded_at_startup(self):
+		dao = PatientDAOJSON(autosave=True, data_directory=self.data_directory)
+		self.assertEqual(len(dao.patients), 2)
+		for patient in dao.patients.values():
+			self.assertIsNone(patient.record._notes_dao, "notes should only be loaded on first access")
+
+		patient = dao.search_patient(9790012000)
+		self.assertEqual(patient.list_notes(), [])
+		self.assertIsNotNone(patient.record._notes_dao, "a note operation should load the notes")
+		os.remove(patient.record.notes_dao.file_lock.path)
+
+	def test_name_index_follows_mutations(self):
+		dao = PatientDAOJSON(autosave=True, data_directory=self.data_directory)
+		self.assertEqual([patient.phn for patient in dao.retrieve_patients("doe")], [9790012000, 9790014444])
+		dao.update_patient(9790012000, Patient(9790019999, "John Smith", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		dao.create_patient(Patient(9792225555, "Joe Hancock", "1990-01-15", "278 456 7890", "john.hancock@outlook.com", "5000 Douglas St, Saanich"))
+		dao.delete_patient(9790014444)
+		self.assertEqual(dao.retrieve_patients("doe"), [])
+		self.assertEqual([patient.phn for patient in dao.retrieve_patients("jo")], [9790019999, 9792225555])
+		self.assertEqual([patient.phn for patient in dao.retrieve_patients("SMITH")], [9790019999])
+
+	def test_query_index_follows_mutations(self):
+		dao = PatientDAOJSON(autosave=True, data_directory=self.data_directory)
+		self.assertEqual([patient.phn for patient in dao.query_patients(phone_prefix="250 203")], [9790012000, 9790014444])
+		dao.update_patient(9790012000, Patient(9790019999, "John Doe", "2000-10-10", "278 203 1010", "john.doe@uvic.ca", "300 Moss St, Victoria"))
+		dao.create_patient(Patient(9792225555, "Joe Hancock", "1990-01-15", "250-456-7890", "john.hancock@outlook.com", "5000 Douglas St, Saanich"))
+		self.assertEqual([patient.phn for patient in dao.query_patients(phone_prefix="250")], [9790014444, 9792225555])
+		self.assertEqual([patient.phn for patient in dao.query_patients(email_domain="UVic.ca")], [9790019999])
+		self.assertEqual([patient.phn for patient in dao.query_patients(birth_date_from="1990-01-15", birth_date_to="1995-07-01")], [9790014444, 9792225555])
+
+		dao.begin()
+		dao.delete_patient(9790014444)
+		self.assertEqual([patient.phn for patient in dao.query_patients(birth_date_to="1999-12-31")], [9792225555])
+		dao.rollback()
+		self.assertEqual([patient.phn for patient in dao.query_patients(birth_date_to="1999-12-31")], [9790014444, 9792225555])
+
+		# a change by another DAO on the same files is seen too
+		PatientDAOJSON(autosave=True, data_directory=self.data_directory).delete_patient(9792225555)
+		self.assertEqual([patient.phn for patient in dao.query_patients(phone_prefix="250")], [9790014444])
+
+	def test_streaming_load_matches_full_load(self):
+		dao = PatientDAOJSON(autosave=True, data_directory=self.data_directory)
+		streamed = PatientDAOJSON(autosave=True, data_directory=self.data_directory, streaming=True)
+		self.assertEqual(streamed.patients, dao.patients)
+
+	def test_streaming_decode_across_chunk_boundaries(self):
+		with open(os.path.join(self.data_directory, 'patients.json')) as file:
+			text = file.read()
+		patient_decoder = PatientDecoder()
+		expected = [patient_decoder.decode_dict(patient_data) for patient_data in json.loads(text)]
+		for chunk_size in (1, 7, 64, len(text)):
+			self.assertEqual(list(patient_decoder.iter_decode(io.StringIO(text), chunk_size=chunk_size)), expected)
+		self.assertEqual(list(patient_decoder.iter_decode(io.StringIO(' [ ] '))), [])
+		with self.assertRaises(json.JSONDecodeError, msg="a truncated file is still an error"):
+			list(patient_decoder.iter_decode(io.StringIO(text[:-10]), chunk_size=7))
+
+	def test_interned_strings(self):
+		dao = PatientDAOJSON(autosave=True, data_directory=self.data_directory, intern_strings=True)
+		john, mary = dao.search_patient(9790012000), dao.search_patient(9790014444)
+		self.assertEqual(dao.patients, PatientDAOJSON(autosave=True, data_directory=self.data_directory).patients)
+		self.assertIs(mary.birth_date, PatientDAOJSON(autosave=True, data_directory=self.data_directory, intern_strings=True).search_patient(9790014444).birth_date)
+		self.assertFalse(hasattr(john, '__dict__'))
+		self.assertFalse(hasattr(john.record, '__dict__'))
+
+	def test_saved_file_is_unchanged(self):
+		with open(os.path.join(self.data_directory, 'patients.json')) as file:
+			self.assertEqual(json.load(file)[0], {
+				'phn': 9790012000, 'name': "John Doe", 'birth_date': "2000-10-10", 'phone': "250 203 1010",
+				'email': "john.doe@gmail.com", 'address': "300 Moss St, Victoria", 'record': {'phn': 9790012000}})
+
+class PatientDAOJSONWriteBehindTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+		self.flusher = WriteBehindFlusher(interval=3600, threshold=1000)
+
+	def tearDown(self):
+		self.flusher.close()
+		self.temporary_directory.cleanup()
+
+	def new_dao(self, journal=False, flusher=None):
+		return PatientDAOJSON(autosave=True, journal=journal, data_directory=self.data_directory, flusher=flusher)
+
+	def test_changes_wait_for_the_flush(self):
+		for journal in (False, True):
+			with self.subTest(journal=journal):
+				dao = self.new_dao(journal, self.flusher)
+				dao.create_patient(Patient(9790012000 + journal, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+				for i in range(50):
+					dao.update_patient(9790012000 + journal, Patient(9790012000 + journal, "John Doe", "2000-10-10", f"250 203 {1000 + i}", "john.doe@gmail.com", "300 Moss St, Victoria"))
+				self.assertIsNone(self.new_dao(journal).search_patient(9790012000 + journal), "nothing is written on the request path")
+				self.assertEqual(len(dao.unflushed_entries), 51)
+				self.flusher.flush()
+				self.assertEqual(self.new_dao(journal).search_patient(9790012000 + journal).phone, "250 203 1049")
+				if journal:
+					self.assertEqual(dao.journal_size, 51, "the coalesced entries are appended with one write")
+
+	def test_flush_keeps_changes_of_other_processes(self):
+		behind, other = self.new_dao(flusher=self.flusher), self.new_dao()
+		behind.create_patient(Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		other.create_patient(Patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria"))
+		self.flusher.flush()
+		self.assertEqual(sorted(behind.patients), [9790012000, 9798884444])
+		self.assertEqual(sorted(patient.phn for patient in self.new_dao().list_patients()), [9790012000, 9798884444])
+
+def create_patients_in_process(data_directory, journal, first_phn):
+	dao = PatientDAOJSON(autosave=True, journal=journal, data_directory=data_directory)
+	for phn in range(first_phn, first_phn + 25):
+		dao.create_patient(Patient(phn, f"Patient {phn}", "2000-10-10", "250 203 1010", "patient@gmail.com", "300 Moss St, Victoria"))
+
+class PatientDAOJSONSharedFilesTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+
+	def tearDown(self):
+		self.temporary_directory.cleanup()
+
+	def new_dao(self, journal=False):
+		return PatientDAOJSON(autosave=True, journal=journal, data_directory=self.data_directory)
+
+	def test_changes_by_another_dao_are_reloaded(self):
+		first, second = self.new_dao(), self.new_dao()
+		first.create_patient(Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		self.assertEqual([patient.phn for patient in second.retrieve_patients("doe")], [9790012000])
+		second.create_patient(Patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria"))
+		with self.assertRaises(IllegalOperationException, msg="the write sees the patient created by the other DAO"):
+			first.create_patient(Patient(9798884444, "Ali Mesbah", "1980-03-03", "250 301 6060", "mesbah.ali@gmail.com", "500 Fairfield Rd, Victoria"))
+		first.delete_patient(9790012000)
+		self.assertEqual([patient.phn for patient in self.new_dao().list_patients()], [9798884444], "no write was lost")
+
+	def test_journal_appends_are_replayed_incrementally(self):
+		first, second = self.new_dao(journal=True), self.new_dao(journal=True)
+		first.create_patient(Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		snapshot = second.patients
+		self.assertIsNotNone(second.search_patient(9790012000))
+		self.assertEqual(second.journal_size, 1)
+		self.assertIsNot(second.patients, snapshot, "the patients are swapped, not changed in place")
+		first.compact()
+		first.delete_patient(9790012000)
+		self.assertIsNone(second.search_patient(9790012000))
+
+	@skipIf(file_lock.fcntl is None, "advisory file locks need fcntl")
+	def test_concurrent_processes_do_not_lose_writes(self):
+		for journal in (False, True):
+			with self.subTest(journal=journal):
+				with Pool(4) as pool:
+					pool.starmap(create_patients_in_process, [(self.data_directory, journal, 1000 * (i + 1) + 100 * journal) for i in range(4)])
+				self.assertEqual(len(self.new_dao(journal=True).list_patients()), 100 * (journal + 1))
+
+class PatientDAOJSONClinicNotesTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.data_directory = self.temporary_directory.name
+		dao = self.new_dao()
+		for i in range(5):
+			patient = dao.create_patient(Patient(9790010000 + i, f"Patient {i}", "2000-10-10", "250 203 1010", "patient@gmail.com", "300 Moss St, Victoria"))
+			for j in range(i):
+				patient.create_note(f"note {j} of patient {i}")
+
+	def tearDown(self):
+		self.temporary_directory.cleanup()
+
+	def new_dao(self):
+		records_directory = os.path.join(self.data_directory, 'records')
+		return PatientDAOJSON(autosave=True, data_directory=self.data_directory,
+			notes_dao_factory=lambda phn: NoteDAOPickle(phn, autosave=True, data_directory=records_directory))
+
+	def notes_between(self, dao, start = None, end = None):
+		return [(patient.phn, note.code) for patient, note in dao.retrieve_notes_between(start, end)]
+
+	def test_only_patients_with_notes_in_range_are_loaded(self):
+		dao = self.new_dao()
+		self.assertEqual(self.notes_between(dao, end="2000-01-01"), [])
+		self.assertEqual(len(dao.notes_index), 10)
+		for patient in dao.patients.values():
+			self.assertIsNone(patient.record._notes_dao, "the notes stay unloaded until a note in range is returned")
+		pairs = self.notes_between(dao)
+		self.assertEqual(sorted(pairs), [(9790010000 + i, j + 1) for i in range(5) for j in range(i)])
+		self.assertIsNone(dao.patients[9790010000].record._notes_dao, "the patient has no notes")
+
+	def test_index_follows_note_and_patient_changes(self):
+		dao = self.new_dao()
+		self.assertEqual(len(self.notes_between(dao)), 10)
+		patient = dao.search_patient(9790010001)
+		note = patient.create_note("a new note")
+		self.assertIn((9790010001, note.code), self.notes_between(dao))
+		patient.delete_note(1)
+		self.assertNotIn((9790010001, 1), self.notes_between(dao))
+
+		patient.record.notes_dao.begin()
+		patient.create_note("rolled back")
+		patient.record.notes_dao.rollback()
+		self.assertEqual([pair for pair in self.notes_between(dao) if pair[0] == 9790010001], [(9790010001, note.code)])
+
+		dao.delete_patient(9790010004)
+		self.assertEqual([pair for pair in self.notes_between(dao) if pair[0] == 9790010004], [])
+		self.assertEqual(len(dao.notes_index), 6)
+
+	def test_notes_written_by_another_process_are_seen(self):
+		dao = self.new_dao()
+		self.assertEqual(len(self.notes_between(dao)), 10)
+		other = self.new_dao()
+		other.search_patient(9790010000).create_note("written by another process")
+		other.search_patient(9790010003).delete_note(1)
+		pairs = self.notes_between(dao)
+		self.assertIn((9790010000, 1), pairs)
+		self.assertNotIn((9790010003, 1), pairs)
+		self.assertEqual(len(pairs), 10)
+
+if __name__ == '__main__':
+	main()
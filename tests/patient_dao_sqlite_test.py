@@ -0,0 +1,102 @@
+import tempfile
+from unittest import TestCase
+from unittest import main
+from clinic.note import Note
+from clinic.patient import Patient
+from clinic.dao.patient_dao_sqlite import PatientDAOSQLite
+from clinic.exception.illegal_operation_exception import IllegalOperationException
+from multiprocessing import Pool
+
+def create_notes_in_process(data_directory):
+	dao = PatientDAOSQLite(autosave=True, data_directory=data_directory)
+	patient = dao.search_patient(9790012000)
+	for i in range(150):
+		patient.create_note(f"Note {i}")
+	dao.close()
+
+class PatientDAOSQLiteTest(TestCase):
+
+	def setUp(self):
+		self.temporary_directory = tempfile.TemporaryDirectory()
+		self.dao = self.new_dao()
+		self.dao.create_patient(Patient(9790012000, "John Doe", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		self.dao.create_patient(Patient(9790014444, "Mary Doe", "1995-07-01", "250 203 2020", "mary.doe@gmail.com", "300 Moss St, Victoria"))
+		self.dao.create_patient(Patient(9792225555, "Joe Hancock", "1990-01-15", "278 456 7890", "john.hancock@outlook.com", "5000 Douglas St, Saanich"))
+
+	def tearDown(self):
+		self.dao.close()
+		self.temporary_directory.cleanup()
+
+	def new_dao(self):
+		return PatientDAOSQLite(autosave=True, data_directory=self.temporary_directory.name)
+
+	def test_patients_persist_in_insertion_order(self):
+		self.assertEqual(self.dao.connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+		self.dao.update_patient(9790012000, Patient(9790012000, "John Doe", "2000-10-10", "278 999 4041", "john.doe@hotmail.com", "205 Foul Bay Rd, Oak Bay"))
+		self.dao.delete_patient(9790014444)
+		with self.assertRaises(IllegalOperationException):
+			self.dao.create_patient(Patient(9792225555, "Joe Hancock", "1990-01-15", "278 456 7890", "john.hancock@outlook.com", "5000 Douglas St, Saanich"))
+		with self.assertRaises(IllegalOperationException):
+			self.dao.update_patient(9790014444, Patient(9790014444, "Mary Doe", "1995-07-01", "250 203 2020", "mary.doe@gmail.com", "300 Moss St, Victoria"))
+
+		reopened = self.new_dao()
+		self.assertEqual([patient.phn for patient in reopened.list_patients()], [9792225555, 9790012000], "an update moves the patient last")
+		self.assertEqual(reopened.search_patient(9790012000).phone, "278 999 4041")
+		self.assertEqual([patient.phn for patient in reopened.retrieve_patients("jO")], [9792225555, 9790012000])
+		reopened.close()
+
+	def test_name_search_reads_the_trigram_index(self):
+		self.assertTrue(self.dao.name_index)
+		plan = ' '.join(row[-1] for row in self.dao.connection.execute(
+			"EXPLAIN QUERY PLAN SELECT rowid FROM patient_names WHERE patient_names MATCH '\"doe\"'"))
+		self.assertIn('VIRTUAL TABLE', plan)
+		self.dao.update_patient(9790012000, Patient(9790012000, "John Smith", "2000-10-10", "250 203 1010", "john.doe@gmail.com", "300 Moss St, Victoria"))
+		self.dao.begin()
+		self.dao.delete_patient(9790014444)
+		self.dao.rollback()
+		self.assertEqual([patient.phn for patient in self.dao.retrieve_patients("DOE")], [9790014444])
+		self.assertEqual([patient.phn for patient in self.dao.retrieve_patients("n sM")], [9790012000])
+		self.assertEqual([patient.phn for patient in self.dao.retrieve_patients('"o')], [])
+		self.dao.delete_patient(9790014444)
+		self.assertEqual(self.dao.retrieve_patients("doe"), [])
+
+		# a database from before the index is filled when it is opened
+		self.dao.connection.execute('DROP TABLE patient_names')
+		reopened = self.new_dao()
+		self.assertEqual([patient.phn for patient in reopened.retrieve_patients("ohn")], [9790012000])
+		reopened.close()
+
+	def test_notes_are_kept_in_the_database(self):
+		patient = self.dao.search_patient(9790012000)
+		patient.create_note("Patient comes with headache and high blood pressure.")
+		patient.create_note("Patient complains of a strong headache on the back of neck.")
+		patient.create_note("Patient is taking medicines to control blood pressure.")
+		self.assertTrue(patient.update_note(1, "Patient comes with a headache."))
+		self.assertTrue(patient.delete_note(2))
+		self.assertFalse(patient.delete_note(2))
+
+		reopened = self.new_dao()
+		patient = reopened.search_patient(9790012000)
+		self.assertEqual(patient.list_notes(), [Note(3, "Patient is taking medicines to control blood pressure."), Note(1, "Patient comes with a headache.")])
+		self.assertEqual(patient.retrieve_notes("HEADACHE"), [Note(1, "Patient comes with a headache.")])
+		self.assertEqual(patient.search_note(3), Note(3, "Patient is taking medicines to control blood pressure."))
+		self.assertEqual(patient.create_note("Patient feels better.").code, 4)
+		self.assertEqual(reopened.search_patient(9790014444).list_notes(), [], "notes belong to a single patient")
+		reopened.close()
+
+	def test_concurrent_processes_do_not_lose_notes(self):
+		with Pool(4) as pool:
+			pool.map(create_notes_in_process, [self.temporary_directory.name] * 4)
+		codes = [note.code for note in self.dao.search_patient(9790012000).list_notes()]
+		self.assertEqual(sorted(codes), list(range(1, 601)), "every note kept, each with its own code")
+
+	def test_rollback(self):
+		self.dao.begin()
+		self.dao.delete_patient(9790012000)
+		self.dao.search_patient(9790014444).create_note("discarded note")
+		self.dao.rollback()
+		self.assertIsNotNone(self.dao.search_patient(9790012000))
+		self.assertEqual(self.dao.search_patient(9790014444).list_notes(), [])
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,84 @@
+import random
+from unittest import TestCase
+from unittest import main
+from clinic.dao.patient_query_index import PatientQueryIndex
+from clinic.patient import Patient
+
+class PatientQueryIndexTest(TestCase):
+
+	def setUp(self):
+		self.generator = random.Random(265)
+		self.patients = {}
+		for phn in range(9790010000, 9790010300):
+			self.patients[phn] = self.random_patient(phn)
+		self.index = PatientQueryIndex(self.patients.values())
+
+	def random_patient(self, phn):
+		generator = self.generator
+		birth_date = f"{generator.randint(1940, 2020)}-{generator.randint(1, 12):02}-{generator.randint(1, 28):02}"
+		phone = f"{generator.choice(['250', '778', '604'])} {generator.randint(200, 999)} {generator.randint(1000, 9999)}"
+		email = f"patient{phn}@{generator.choice(['gmail.com', 'Outlook.com', 'uvic.ca'])}"
+		return Patient(phn, f"Patient {phn}", birth_date, phone, email, "500 Fairfield Rd, Victoria")
+
+	def scan(self, birth_date_from=None, birth_date_to=None, phone_prefix=None, email_domain=None):
+		return [patient for phn, patient in sorted(self.patients.items())
+			if (birth_date_from is None or patient.birth_date >= birth_date_from)
+			and (birth_date_to is None or patient.birth_date <= birth_date_to)
+			and (phone_prefix is None or patient.phone.replace(' ', '').startswith(phone_prefix.replace(' ', '')))
+			and (email_domain is None or patient.email.lower().endswith('@' + email_domain.lower()))]
+
+	def assertQueriesMatchScan(self):
+		queries = [
+			{},
+			{'birth_date_from': '1980-01-01', 'birth_date_to': '1989-12-31'},
+			{'birth_date_from': '2000-06-15'},
+			{'birth_date_to': '1950-03-03'},
+			{'birth_date_from': '1990-01-01', 'birth_date_to': '1980-01-01'},
+			{'phone_prefix': '250'},
+			{'phone_prefix': '778 3'},
+			{'email_domain': 'outlook.com'},
+			{'email_domain': 'uvic.ca', 'phone_prefix': '604', 'birth_date_from': '1970-01-01'},
+			{'email_domain': 'example.com'},
+		]
+		for query in queries:
+			with self.subTest(**query):
+				self.assertEqual(self.index.query(self.patients, **query), self.scan(**query))
+
+	def test_queries_match_a_scan(self):
+		self.assertQueriesMatchScan()
+
+	def test_index_follows_changes(self):
+		for phn in self.generator.sample(sorted(self.patients), 100):
+			self.index.remove(self.patients.pop(phn))
+		for phn in self.generator.sample(sorted(self.patients), 100):
+			self.index.remove(self.patients[phn])
+			self.patients[phn] = self.random_patient(phn)
+			self.index.add(self.patients[phn])
+		for phn in range(9790020000, 9790020050):
+			self.patients[phn] = self.random_patient(phn)
+			self.index.add(self.patients[phn])
+		self.assertQueriesMatchScan()
+
+	def test_planner_starts_from_the_most_selective_index(self):
+		patients = RecordingPatients(self.patients)
+		recent = self.index.query(patients, email_domain='@UVIC.CA', birth_date_from='2015-01-01')
+		self.assertEqual(recent, self.scan(email_domain='uvic.ca', birth_date_from='2015-01-01'))
+		self.assertEqual(len(patients.looked_up), len(self.scan(birth_date_from='2015-01-01')), "only the recent births are checked")
+
+		patients.looked_up = []
+		self.assertEqual(self.index.query(patients, email_domain='uvic.ca', phone_prefix='250 1'), [])
+		self.assertEqual(patients.looked_up, [], "no phone starts with 250 1")
+
+class RecordingPatients(dict):
+	''' patients by PHN, remembering which ones the query looked up '''
+
+	def __init__(self, patients):
+		super().__init__(patients)
+		self.looked_up = []
+
+	def get(self, phn, default=None):
+		self.looked_up.append(phn)
+		return super().get(phn, default)
+
+if __name__ == '__main__':
+	main()
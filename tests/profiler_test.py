@@ -0,0 +1,93 @@
+import os
+import pstats
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest import main
+from clinic.profiler import Profiler
+
+class Clinic():
+
+	def search(self, phn):
+		return self.lookup(phn)
+
+	def lookup(self, phn):
+		return phn
+
+	def wait(self, seconds):
+		time.sleep(seconds)
+
+class ProfilerTest(TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+		self.clinic = Clinic()
+
+	def test_cprofile(self):
+		profiler = Profiler(self.directory.name, ['search', 'lookup'], interval=60)
+		profiler.instrument(self.clinic)
+		for phn in range(5):
+			self.assertEqual(self.clinic.search(phn), phn)
+		profiler.close()
+
+		# lookup ran inside search, so it is only part of the search profile
+		self.assertEqual(profiler.calls, {'search': 5})
+		stats = pstats.Stats(os.path.join(self.directory.name, 'search.pstats'))
+		functions = {function[2]: counts for function, counts in stats.stats.items()}
+		self.assertEqual(functions['lookup'][1], 5)
+		self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'lookup.pstats')))
+
+	def test_sampling(self):
+		profiler = Profiler(self.directory.name, ['wait'], mode='sampling', interval=60, sample_interval=0.001)
+		profiler.instrument(self.clinic)
+		self.clinic.wait(0.1)
+		profiler.close()
+
+		with open(os.path.join(self.directory.name, 'wait.collapsed')) as file:
+			lines = file.read().splitlines()
+		self.assertTrue(lines)
+		for line in lines:
+			stack, count = line.rsplit(' ', 1)
+			self.assertTrue(stack.startswith('wait;wait (profiler_test.py:'))
+			self.assertGreater(int(count), 0)
+
+	def test_periodic_dumps(self):
+		profiler = Profiler(self.directory.name, ['search'], interval=0.01)
+		profiler.instrument(self.clinic)
+		self.clinic.search(1)
+		path = os.path.join(self.directory.name, 'search.pstats')
+		deadline = time.monotonic() + 5
+		while not os.path.exists(path) and time.monotonic() < deadline:
+			time.sleep(0.01)
+		self.assertTrue(os.path.exists(path))
+		profiler.close()
+
+	def test_close_puts_the_methods_back(self):
+		profiler = Profiler(self.directory.name, ['search'])
+		profiler.instrument(self.clinic)
+		self.assertIn('search', vars(self.clinic))
+		profiler.close()
+		self.assertNotIn('search', vars(self.clinic))
+		self.assertEqual(self.clinic.search(3), 3)
+
+	def test_concurrent_calls(self):
+		profiler = Profiler(self.directory.name, ['search'])
+		profiler.instrument(self.clinic)
+		threads = [threading.Thread(target=lambda: [self.clinic.search(phn) for phn in range(200)]) for i in range(4)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		profiler.close()
+		# calls made while another thread's call was profiled ran unprofiled
+		self.assertLessEqual(profiler.calls['search'], 800)
+		self.assertGreater(profiler.calls['search'], 0)
+
+	def test_unknown_mode(self):
+		with self.assertRaises(ValueError):
+			Profiler(self.directory.name, ['search'], mode='perf')
+
+if __name__ == '__main__':
+	main()
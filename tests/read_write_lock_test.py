@@ -0,0 +1,59 @@
+import threading
+from unittest import TestCase
+from unittest import main
+from clinic.read_write_lock import ReadWriteLock
+
+class ReadWriteLockTest(TestCase):
+
+	def setUp(self):
+		self.lock = ReadWriteLock()
+
+	def test_readers_share_the_lock(self):
+		both_reading = threading.Barrier(2, timeout=5)
+
+		def read():
+			with self.lock.read_locked():
+				both_reading.wait()
+
+		threads = [threading.Thread(target=read) for i in range(2)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertFalse(both_reading.broken, "the two readers held the lock together")
+
+	def test_writer_excludes_readers(self):
+		events = []
+		writing = threading.Event()
+
+		def read():
+			writing.wait()
+			with self.lock.read_locked():
+				events.append('read')
+
+		reader = threading.Thread(target=read)
+		reader.start()
+		with self.lock.write_locked():
+			writing.set()
+			reader.join(0.1)
+			events.append('written')
+		reader.join()
+		self.assertEqual(events, ['written', 'read'])
+
+	def test_writer_may_lock_again(self):
+		with self.lock.write_locked():
+			with self.lock.write_locked():
+				with self.lock.read_locked():
+					pass
+		# released completely, another thread can write now
+		def write():
+			with self.lock.write_locked():
+				pass
+
+		thread = threading.Thread(target=write)
+		thread.start()
+		thread.join(5)
+		self.assertFalse(thread.is_alive())
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,81 @@
+import datetime
+import random
+from unittest import TestCase
+from unittest import main
+from clinic.dao.timestamp_index import TimestampIndex, normalize_timestamp
+from clinic.note import Note
+
+class NormalizeTimestampTest(TestCase):
+
+	def test_timestamps_and_bounds(self):
+		self.assertEqual(normalize_timestamp("2024-01-01 10:00:00"), datetime.datetime(2024, 1, 1, 10))
+		self.assertEqual(normalize_timestamp("2024-01-01T10:00:00.250000"), datetime.datetime(2024, 1, 1, 10, 0, 0, 250000))
+		self.assertEqual(normalize_timestamp("2024-01-01"), datetime.datetime(2024, 1, 1))
+		self.assertEqual(normalize_timestamp(datetime.date(2024, 1, 1)), datetime.datetime(2024, 1, 1))
+		# an end bound covers the whole day
+		self.assertEqual(normalize_timestamp(datetime.date(2024, 1, 1), end_of_day=True), datetime.datetime(2024, 1, 1, 23, 59, 59, 999999))
+		self.assertEqual(normalize_timestamp("2024-01-01", end_of_day=True), datetime.datetime(2024, 1, 1, 23, 59, 59, 999999))
+		self.assertEqual(normalize_timestamp("2024-01-01 10:00:00", end_of_day=True), datetime.datetime(2024, 1, 1, 10))
+		self.assertEqual(normalize_timestamp(datetime.datetime(2024, 1, 1, 10)), datetime.datetime(2024, 1, 1, 10))
+		aware = datetime.datetime(2024, 1, 1, 10, tzinfo=datetime.timezone.utc)
+		self.assertEqual(normalize_timestamp(aware), aware.astimezone().replace(tzinfo=None))
+		self.assertIsNone(normalize_timestamp("yesterday"))
+		self.assertIsNone(normalize_timestamp(None))
+		self.assertIsNone(normalize_timestamp(1704103200))
+
+class TimestampIndexTest(TestCase):
+
+	def setUp(self):
+		self.generator = random.Random(265)
+		self.notes = {}
+		for code in range(1, 301):
+			self.notes[code] = self.random_note(code)
+		self.index = TimestampIndex(self.notes.values())
+
+	def random_note(self, code):
+		timestamp = datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=self.generator.randrange(24 * 60))
+		# older notes were saved with datetimes, newer ones with strings
+		if self.generator.random() < 0.5:
+			timestamp = timestamp.strftime('%Y-%m-%d %H:%M:%S')
+		return Note(code, f"note {code}", timestamp)
+
+	def scan(self, start=None, end=None):
+		return [code for timestamp, code in sorted((normalize_timestamp(note.timestamp), code) for code, note in self.notes.items())
+			if (start is None or timestamp >= start) and (end is None or timestamp <= end)]
+
+	def assertRangesMatchScan(self):
+		notes = list(self.notes.values())
+		ranges = [
+			(None, None),
+			(datetime.datetime(2024, 1, 15), datetime.datetime(2024, 1, 31)),
+			(datetime.datetime(2024, 2, 10), None),
+			(None, datetime.datetime(2024, 1, 3, 12)),
+			(datetime.datetime(2024, 2, 1), datetime.datetime(2024, 1, 1)),
+			# both bounds are included
+			(normalize_timestamp(notes[0].timestamp), normalize_timestamp(notes[0].timestamp)),
+			(normalize_timestamp(notes[1].timestamp), normalize_timestamp(notes[2].timestamp)),
+		]
+		for start, end in ranges:
+			with self.subTest(start=start, end=end):
+				self.assertEqual(self.index.between(start, end), self.scan(start, end))
+
+	def test_ranges_match_a_scan(self):
+		self.assertRangesMatchScan()
+
+	def test_index_follows_changes(self):
+		for code in self.generator.sample(sorted(self.notes), 100):
+			note = self.notes.pop(code)
+			self.index.remove(code, note.timestamp)
+		for code in range(301, 351):
+			self.notes[code] = self.random_note(code)
+			self.index.add(code, self.notes[code].timestamp)
+		self.assertRangesMatchScan()
+
+	def test_notes_without_a_timestamp_are_not_indexed(self):
+		index = TimestampIndex([Note(1, "note 1", None), Note(2, "note 2", "2024-01-01 10:00:00")])
+		index.add(3, None)
+		index.remove(1, None)
+		self.assertEqual(index.between(), [2])
+
+if __name__ == '__main__':
+	main()
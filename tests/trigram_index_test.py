@@ -0,0 +1,72 @@
+import random
+from unittest import TestCase
+from unittest import main
+from clinic.dao.trigram_index import TrigramIndex
+
+class TrigramIndexTest(TestCase):
+
+	def setUp(self):
+		self.index = TrigramIndex()
+		self.texts = {}
+
+	# the index is changed first, as an index with text_of reads the texts being replaced
+	def add(self, key, text):
+		self.index.remove(key)
+		self.texts.pop(key, None)
+		self.texts[key] = text
+		self.index.add(key, text)
+
+	def update(self, key, text):
+		self.index.update(key, text)
+		self.texts[key] = text
+
+	def remove(self, key):
+		self.index.remove(key)
+		self.texts.pop(key, None)
+
+	def scan(self, query):
+		return [key for key, text in self.texts.items() if query.lower() in text.lower()]
+
+	def test_search_matches_linear_scan(self):
+		generator = random.Random(265)
+		first_names = ["John", "Mary", "Joe", "Ali", "Jin", "Johanna", "Jonah", "Marianne"]
+		last_names = ["Doe", "Hancock", "Mesbah", "Hu", "Dover", "Hanson", "MacDonald"]
+		for key in range(500):
+			self.add(key, f"{generator.choice(first_names)} {generator.choice(last_names)}")
+		for key in generator.sample(range(500), 100):
+			self.remove(key)
+		for key in generator.sample(range(500), 100):
+			self.add(key, f"{generator.choice(first_names)} {generator.choice(last_names)}")
+		for key in generator.sample(list(self.texts), 100):
+			self.update(key, f"{generator.choice(first_names)} {generator.choice(last_names)}")
+
+		queries = ["", "o", "Jo", "john", "DOE", "n Do", "ohn D", "hanc", "mac", "anna", "xyz", "Mary Doe", "johnDoe"]
+		for query in queries:
+			self.assertEqual(self.index.search(query), self.scan(query), f"query {query!r}")
+		self.assertEqual(len(self.index), len(self.texts))
+
+	def test_shared_trigrams_are_not_a_match(self):
+		self.add(1, "abcdbcde")
+		self.assertEqual(self.index.search("abcde"), [], "all trigrams present but not as one substring")
+		self.assertEqual(self.index.search("dbcde"), [1])
+
+	def test_removal_drops_empty_postings(self):
+		self.add(1, "John Doe")
+		self.remove(1)
+		self.assertEqual(self.index.postings, {})
+		self.assertEqual(self.index.search("john"), [])
+
+class TrigramIndexTextOfTest(TrigramIndexTest):
+
+	def setUp(self):
+		self.texts = {}
+		self.index = TrigramIndex(text_of=self.texts.__getitem__)
+
+	def test_texts_are_not_copied(self):
+		self.add(1, "John Doe")
+		self.add(2, "Mary Doe")
+		self.assertEqual(self.index.texts, {})
+		self.assertEqual(self.index.search("DOE"), [1, 2])
+
+if __name__ == '__main__':
+	main()
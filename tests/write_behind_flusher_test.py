@@ -0,0 +1,66 @@
+import threading
+from unittest import TestCase
+from unittest import main
+from clinic.dao.write_behind_flusher import WriteBehindFlusher
+
+class RecordingDAO():
+
+	def __init__(self, failures=0):
+		self.flushes = 0
+		self.failures = failures
+		self.flushed = threading.Event()
+
+	def flush(self):
+		if self.failures:
+			self.failures -= 1
+			raise OSError("disk full")
+		self.flushes += 1
+		self.flushed.set()
+
+class WriteBehindFlusherTest(TestCase):
+
+	def setUp(self):
+		self.flusher = WriteBehindFlusher(interval=3600, threshold=10)
+
+	def tearDown(self):
+		self.flusher.close()
+
+	def test_repeated_changes_are_written_once(self):
+		first, second = RecordingDAO(), RecordingDAO()
+		for i in range(5):
+			self.flusher.mark_dirty(first)
+		self.flusher.mark_dirty(second)
+		self.assertEqual(first.flushes, 0, "nothing is written before the interval or threshold")
+		self.flusher.flush()
+		self.assertEqual((first.flushes, second.flushes), (1, 1))
+		self.flusher.flush()
+		self.assertEqual(first.flushes, 1, "a DAO is only written again after new changes")
+
+	def test_threshold_wakes_the_flusher(self):
+		dao = RecordingDAO()
+		self.flusher.mark_dirty(dao, 10)
+		self.assertTrue(dao.flushed.wait(5))
+
+	def test_interval_flush(self):
+		flusher = WriteBehindFlusher(interval=0.01, threshold=10)
+		dao = RecordingDAO()
+		flusher.mark_dirty(dao)
+		self.assertTrue(dao.flushed.wait(5))
+		flusher.close()
+
+	def test_failed_flush_is_retried(self):
+		dao = RecordingDAO(failures=1)
+		self.flusher.mark_dirty(dao)
+		with self.assertRaises(OSError):
+			self.flusher.flush()
+		self.flusher.flush()
+		self.assertEqual(dao.flushes, 1)
+
+	def test_close_writes_what_is_waiting(self):
+		dao = RecordingDAO()
+		self.flusher.mark_dirty(dao)
+		self.flusher.close()
+		self.assertEqual(dao.flushes, 1)
+
+if __name__ == '__main__':
+	main()